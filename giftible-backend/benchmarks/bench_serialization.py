@@ -0,0 +1,106 @@
+"""
+Micro-benchmark: encoding one `/products/browse` page of 100 products.
+
+Compares the old path (strftime dicts → jsonable_encoder → stdlib JSONResponse)
+with the new one (row serializers → FastJSONResponse/orjson). No database needed.
+
+    cd giftible-backend && python -m benchmarks.bench_serialization
+"""
+import timeit
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from services.serialization import FastJSONResponse, serialize_browse_product
+
+PAGE_SIZE = 100
+ROUNDS = 200
+
+
+def make_products(count: int = PAGE_SIZE):
+    category = SimpleNamespace(id=3, name="Handicrafts")
+    ngo = SimpleNamespace(id=7, ngo_name="Helping Hands", logo="/uploads/ngos/7/logo-" + "a" * 32 + ".png")
+    owner = SimpleNamespace(id=12, ngo=ngo, contact_number="+919876543210", email="ngo@example.com")
+    created = datetime(2025, 1, 1, 10, 30)
+    return [
+        SimpleNamespace(
+            id=i,
+            name=f"Hand-painted diya set #{i}",
+            price=499.0 + i,
+            stock=20 + i % 5,
+            is_approved=True,
+            is_live=True,
+            created_at=created + timedelta(hours=i),
+            category=category,
+            universal_user=owner,
+            images=[SimpleNamespace(image_url=f"uploads/products/{i:032x}.jpg") for _ in range(3)],
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_page(products, ratings):
+    # Mirrors the dict building that browse_products did before
+    return {
+        "message": "✅ Products fetched successfully",
+        "total": len(products),
+        "products": [
+            {
+                "id": product.id,
+                "name": product.name,
+                "price": product.price,
+                "stock": product.stock,
+                "is_approved": product.is_approved,
+                "is_live": product.is_live,
+                "created_at": product.created_at.strftime("%Y-%m-%d"),
+                "average_rating": ratings.get(product.id, 5.0),
+                "category": {"id": product.category.id, "name": product.category.name} if product.category else None,
+                "ngo": {
+                    "id": product.universal_user.ngo.id if product.universal_user.ngo else None,
+                    "universal_user_id": product.universal_user.id,
+                    "ngo_name": product.universal_user.ngo.ngo_name if product.universal_user.ngo else "No NGO",
+                    "logo": product.universal_user.ngo.logo,
+                    "contact_number": product.universal_user.contact_number,
+                    "email": product.universal_user.email,
+                } if product.universal_user.ngo else None,
+                "images": [{"image_url": img.image_url} for img in product.images],
+            }
+            for product in products
+        ],
+    }
+
+
+def encode_legacy(products, ratings) -> bytes:
+    return JSONResponse(jsonable_encoder(legacy_page(products, ratings))).body
+
+
+def encode_fast(products, ratings) -> bytes:
+    return FastJSONResponse({
+        "message": "✅ Products fetched successfully",
+        "total": len(products),
+        "products": [serialize_browse_product(product, ratings.get(product.id, 5.0)) for product in products],
+    }).body
+
+
+def main():
+    products = make_products()
+    ratings = {p.id: 4.5 for p in products[::2]}
+
+    import json
+    assert json.loads(encode_legacy(products, ratings)) == json.loads(encode_fast(products, ratings))
+
+    print(f"📦 {PAGE_SIZE}-product page, {ROUNDS} rounds (best of 5)")
+    results = {}
+    for name, fn in (("jsonable_encoder + json", encode_legacy), ("serializers + orjson", encode_fast)):
+        best = min(timeit.repeat(lambda: fn(products, ratings), number=ROUNDS, repeat=5)) / ROUNDS
+        results[name] = best
+        print(f"  {name:<26} {best * 1000:8.3f} ms/page   {len(fn(products, ratings)):>7} bytes")
+
+    legacy, fast = results.values()
+    print(f"🚀 Speed-up: {legacy / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
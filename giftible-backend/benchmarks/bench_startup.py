@@ -0,0 +1,58 @@
+"""
+Startup-time benchmark: how long a fresh worker takes to import and build the app.
+
+Each run is a new interpreter (like a new uvicorn/gunicorn worker) that imports
+`main`, which builds the app via `create_app()`. Reports min / median / max wall
+time and the slowest imports of one more run (python -X importtime).
+
+    cd giftible-backend && python -m benchmarks.bench_startup [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+SNIPPET = "import main"  # Module import builds the app once via create_app()
+TOP_IMPORTS = 10
+
+
+def run_once(env, importtime: bool = False, snippet: str = SNIPPET) -> tuple[float, str]:
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", snippet]
+    started = time.perf_counter()
+    result = subprocess.run(args, env=env, capture_output=True, text=True, check=True)
+    return time.perf_counter() - started, result.stderr
+
+
+def slowest_imports(importtime_output: str) -> list[tuple[int, str]]:
+    # Lines look like "import time:       250 |     447411 |           fastapi.openapi.models"
+    rows = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line.removeprefix("import time:").split("|")
+        rows.append((int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:TOP_IMPORTS]
+
+
+def main():
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///:memory:")  # Startup must not need a reachable DB
+    env.setdefault("PAYMENT_BACKEND", "fake")
+
+    bare = [run_once(env, snippet="pass")[0] for _ in range(RUNS)]
+    timings = [run_once(env)[0] for _ in range(RUNS)]
+
+    print(f"🚀 import main (create_app) in a fresh interpreter, {RUNS} runs")
+    print(f"  min {min(timings) * 1000:7.1f} ms   median {statistics.median(timings) * 1000:7.1f} ms   max {max(timings) * 1000:7.1f} ms")
+    print(f"  (bare interpreter: median {statistics.median(bare) * 1000:.1f} ms)")
+
+    _, importtime_output = run_once(env, importtime=True)
+    print("🐢 Slowest imports (self time):")
+    for self_us, name in slowest_imports(importtime_output):
+        print(f"  {self_us / 1000:7.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,22 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from settings import SQL_ECHO  # ✅ Also loads .env
 
 # MySQL Connection URL
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 # Create the database engine
-engine = create_engine(DATABASE_URL, echo=True)  # Enable SQL logging
+engine = create_engine(DATABASE_URL, echo=SQL_ECHO)  # SQL logging via SQL_ECHO=true
 
 # Create a session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 📖 Read replicas (comma-separated URLs) for reporting reads; routed by services/read_routing.py
+REPLICA_DATABASE_URLS = [url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()]
+replica_engines = [create_engine(url, echo=SQL_ECHO, pool_pre_ping=True) for url in REPLICA_DATABASE_URLS]
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False)  # Bound to a replica per session
+
 # Base class for models
 Base = declarative_base()
 
@@ -29,4 +31,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+if __name__ == "__main__":
+    init_db()  # ✅ `python database.py` creates missing tables (startup no longer runs DDL)
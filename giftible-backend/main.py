@@ -1,51 +1,77 @@
+import settings  # ✅ First: loads .env once for every module below
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-import models
-from database import engine
-from routes import auth  # Import the auth routes
 from fastapi.middleware.cors import CORSMiddleware
-from routes import admin  # Import the new admin routes
-from fastapi.staticfiles import StaticFiles
-from routes import product, cart, checkout, order, payment, ngo, category, search, address, user, admin, wishlist, sales, payouts, dashboard, inventory, analytics, reviews
-
-
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Update with frontend URL in production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-app.include_router(dashboard.router)
-app.include_router(analytics.router)
-app.include_router(auth.router)
-app.include_router(admin.router)
-app.include_router(category.router)
-app.include_router(product.router)
-app.include_router(inventory.router)
-app.include_router(checkout.router)
-app.include_router(cart.router)
-app.include_router(wishlist.router)
-app.include_router(sales.router)
-app.include_router(payouts.router)
-app.include_router(order.router)
-app.include_router(payment.router)
-app.include_router(ngo.router)
-app.include_router(search.router)
-app.include_router(address.router)
-app.include_router(user.router)
-app.include_router(reviews.router)
-
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-
-
-# Create tables (optional, since `init_db.py` already handles this)
-models.Base.metadata.create_all(bind=engine)
-
-# Include authentication routes
-app.include_router(auth.router)
-
-@app.get("/")
-def home():
-    return {"message": "Welcome to Giftible API!"}
+from services.static_files import CachedStaticFiles
+from services.uploads import UploadSizeLimitMiddleware
+from services.serialization import FastJSONResponse
+from services.rate_limit import RateLimitMiddleware
+from services.read_routing import ReadRoutingMiddleware
+from services.razorpay_client import close_gateway
+from services.scheduler import start_scheduler, stop_scheduler
+from services.invalidation_bus import start_invalidation_bus, stop_invalidation_bus
+from starlette.concurrency import run_in_threadpool
+from routes import auth, product, cart, checkout, order, payment, ngo, category, search, address, user, admin, wishlist, sales, payouts, dashboard, inventory, analytics, reviews
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_invalidation_bus()  # 📡 Other workers' commits invalidate this worker's caches (services/invalidation_bus.py)
+    start_scheduler()  # ⏰ Periodic jobs; only the lease-holding worker runs them (services/scheduler.py)
+    yield
+    await run_in_threadpool(stop_scheduler)
+    await run_in_threadpool(stop_invalidation_bus)
+    await close_gateway()  # ✅ Release pooled Razorpay connections on shutdown
+
+
+def create_app() -> FastAPI:
+    """
+    Builds the ASGI app. Startup is side-effect free: no DDL (run `python database.py`
+    or `init_db.py` to create tables), no DB connection, and third-party SDKs
+    (Razorpay, Twilio, boto3) are only imported on first use. The scheduler and
+    invalidation-bus threads started by the lifespan connect from their own loops, not during startup.
+    """
+    app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)  # ✅ orjson for every JSON response
+
+    app.add_middleware(UploadSizeLimitMiddleware)  # ✅ 413 before oversized multipart bodies are parsed
+    app.add_middleware(RateLimitMiddleware)  # ✅ 429 before any DB / bcrypt work on login, reset, register & search
+    app.add_middleware(ReadRoutingMiddleware)  # 📖 Read-your-writes for replica-routed reports (no-op without replicas)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Update with frontend URL in production
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.include_router(dashboard.router)
+    app.include_router(analytics.router)
+    app.include_router(auth.router)
+    app.include_router(admin.router)
+    app.include_router(category.router)
+    app.include_router(product.router)
+    app.include_router(inventory.router)
+    app.include_router(checkout.router)
+    app.include_router(cart.router)
+    app.include_router(wishlist.router)
+    app.include_router(sales.router)
+    app.include_router(payouts.router)
+    app.include_router(order.router)
+    app.include_router(payment.router)
+    app.include_router(ngo.router)
+    app.include_router(search.router)
+    app.include_router(address.router)
+    app.include_router(user.router)
+    app.include_router(reviews.router)
+
+    app.mount("/uploads", CachedStaticFiles(directory="uploads"), name="uploads")  # ✅ Immutable caching for hashed uploads
+
+    @app.get("/")
+    def home():
+        return {"message": "Welcome to Giftible API!"}
+
+    return app
+
+
+# `uvicorn main:app` keeps working
+app = create_app()
@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Column, Integer, String, Boolean, DateTime, Float, ForeignKey,
-    Enum, UniqueConstraint, func, Text
+    Enum, UniqueConstraint, Index, func, Text
 )
 from sqlalchemy.orm import relationship
 from database import Base
@@ -58,6 +58,7 @@ class UniversalUser(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     email_verified = Column(Boolean, default=False)  # Track email verification
     contact_verified = Column(Boolean, default=False)  # Track contact verification
+    deleted_at = Column(DateTime, nullable=True)  # 🗑️ Soft-deleted; rows are purged by a DeletionJob
 
     # ✅ Relationships
     ngo = relationship("NGO", back_populates="universal_user", uselist=False)
@@ -78,14 +79,20 @@ class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
 
     id = Column(Integer, primary_key=True, index=True)
-    universal_user_id = Column(Integer, ForeignKey("universal_users.id", ondelete="CASCADE"), nullable=False)
-    token = Column(String(255), unique=True, nullable=False)
-    expires_at = Column(DateTime, nullable=False)
+    universal_user_id = Column(Integer, ForeignKey("universal_users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False)  # ✅ SHA-256 hex of the JWT; the token itself is never stored
+    family_id = Column(String(32), nullable=False, index=True)  # One family per login; rotation keeps it
+    expires_at = Column(DateTime, nullable=False, index=True)
+    used_at = Column(DateTime, nullable=True)  # Set when rotated; presenting it again revokes the family
     created_at = Column(DateTime, server_default=func.now())
 
     # Relationship to UniversalUser
     user = relationship("UniversalUser", back_populates="refresh_tokens")
 
+    __table_args__ = (
+        Index("ix_refresh_tokens_token_hash", "token_hash", unique=True),
+    )
+
 
 # ✅ Product Model
 class Product(Base):
@@ -100,6 +107,7 @@ class Product(Base):
     stock = Column(Integer, nullable=False, default=0)
     is_approved = Column(Boolean, default=False)  # Admin approval required
     is_live = Column(Boolean, default=False)  # NGOs can publish/unpublish products
+    is_hot = Column(Boolean, default=False, nullable=False)  # 🔥 Flash-sale mode: stock admitted by services/hot_stock.py counters
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -118,9 +126,24 @@ class ProductImage(Base):
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     image_url = Column(String(255), nullable=False)  # Path to image
+    stored_file_id = Column(Integer, ForeignKey("stored_files.id"), nullable=True, index=True)  # ✅ Deduplicated file (NULL for legacy uploads)
 
     # Relationships
     product = relationship("Product", back_populates="images")
+    stored_file = relationship("StoredFile")
+
+
+# ✅ Content-addressed file shared by every ProductImage with the same bytes
+class StoredFile(Base):
+    __tablename__ = "stored_files"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, nullable=False)  # Hash embedded in the file name
+    path = Column(String(255), nullable=False)
+    size = Column(Integer, nullable=False, default=0)
+    ref_count = Column(Integer, nullable=False, default=0)  # Number of ProductImage rows pointing here
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    released_at = Column(DateTime, nullable=True, index=True)  # When ref_count last dropped to 0
 
 class Wishlist(Base):
     __tablename__ = "wishlist"
@@ -139,6 +162,7 @@ class Cart(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     universal_user_id = Column(Integer, ForeignKey("universal_users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # Empty carts past a grace period are purged
 
     # Relationships
     user = relationship("UniversalUser", back_populates="carts")  # ✅ Updated Relationship
@@ -153,6 +177,7 @@ class CartItem(Base):
     cart_id = Column(Integer, ForeignKey("carts.id"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # 🧹 Retention: untouched lines expire
 
     # Relationships
     cart = relationship("Cart", back_populates="cart_items")
@@ -200,15 +225,19 @@ class CouponUsage(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("universal_users.id"), nullable=False)
     coupon_id = Column(Integer, ForeignKey("coupons.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)  # ✅ Order the coupon was redeemed on
+    razorpay_order_id = Column(String(100), nullable=True, index=True)  # ✅ Checkout that claimed it before payment
+    period_key = Column(String(20), nullable=False, default="once")  # "once" or the UTC day for one_per_day coupons
     used_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     # Relationships
     user = relationship("UniversalUser")
     coupon = relationship("Coupon")
 
-    # ✅ Ensure unique coupon usage constraints
+    # ✅ One usage per user, coupon and period: enforced by the DB, not by a read-then-write check
     __table_args__ = (
-        UniqueConstraint("user_id", "coupon_id", name="_user_coupon_uc"),
+        UniqueConstraint("user_id", "coupon_id", "period_key", name="_user_coupon_period_uc"),
+        Index("ix_coupon_usages_user_coupon_used_at", "user_id", "coupon_id", "used_at"),
     )
 
 
@@ -227,8 +256,9 @@ class Order(Base):
     universal_user_id = Column(Integer, ForeignKey("universal_users.id", ondelete="CASCADE"), nullable=False)  # ✅ Ensure this exists
     total_amount = Column(Float, nullable=False)
     address_id = Column(Integer, ForeignKey("addresses.id"), nullable=False)
-    razorpay_order_id = Column(String(100), nullable=True)  # ✅ Razorpay Order ID
+    razorpay_order_id = Column(String(100), nullable=True, unique=True)  # ✅ Razorpay Order ID (one Order per payment; idempotency key)
     payment_id = Column(String(255), nullable=True)  # ✅ Payment ID
+    coupon_conflict = Column(String(255), nullable=True)  # ⚠️ Paid with a coupon that could not be redeemed (admin review)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -281,7 +311,7 @@ class PasswordResetToken(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("universal_users.id", ondelete="CASCADE"), nullable=False)  # ✅ Updated ForeignKey
     token = Column(String(255), nullable=False, unique=True, index=True)
-    expires_at = Column(DateTime, nullable=False, default=lambda: datetime.utcnow() + timedelta(minutes=30))
+    expires_at = Column(DateTime, nullable=False, default=lambda: datetime.utcnow() + timedelta(minutes=30), index=True)
 
     # Relationship
     user = relationship("UniversalUser", back_populates="password_reset_tokens")  # ✅ Added Relationship
@@ -317,3 +347,171 @@ class Review(Base):
     user = relationship("UniversalUser", back_populates="reviews")
     product = relationship("Product", back_populates="reviews")
     order_item = relationship("OrderItem", back_populates="reviews")
+
+
+# ✅ Cheap change stamps for cached/conditional reads (one row per entity tag, e.g. "products")
+class EntityVersion(Base):
+    __tablename__ = "entity_versions"
+
+    entity = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# 🧾 What a Razorpay order is paying for, so a captured payment can become an Order without the browser
+class CheckoutIntent(Base):
+    __tablename__ = "checkout_intents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    razorpay_order_id = Column(String(100), unique=True, nullable=False)
+    universal_user_id = Column(Integer, ForeignKey("universal_users.id", ondelete="CASCADE"), nullable=False)
+    address_id = Column(Integer, ForeignKey("addresses.id"), nullable=True)
+    coupon_code = Column(String(50), nullable=True)
+    amount = Column(Float, nullable=False)
+    receipt = Column(String(40), nullable=True, index=True)  # Looked up to skip checkouts already paid for
+    items = Column(Text, nullable=False)  # JSON snapshot: [{"product_id": 1, "quantity": 2}, ...]
+    status = Column(String(20), nullable=False, default="created", index=True)  # created | completed
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# 📥 Durable inbox for Razorpay webhooks; drained by services/payment_reconciliation.py
+class PaymentEvent(Base):
+    __tablename__ = "payment_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(String(100), unique=True, nullable=False)  # X-Razorpay-Event-Id: redeliveries are dropped
+    event_type = Column(String(50), nullable=False)
+    razorpay_order_id = Column(String(100), nullable=True, index=True)
+    razorpay_payment_id = Column(String(100), nullable=True)
+    amount = Column(Integer, nullable=True)  # Paise
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending | processed | ignored | unmatched | refund_needed | resolved
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String(255), nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_payment_events_status_received_at", "status", "received_at"),
+    )
+
+
+# ⏳ Temporary stock holds between Razorpay order creation and order placement (see services/stock_reservations.py)
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    receipt = Column(String(40), nullable=False, index=True)  # Cart-derived checkout key (services/razorpay_client.cart_receipt)
+    razorpay_order_id = Column(String(100), nullable=True, index=True)
+    universal_user_id = Column(Integer, ForeignKey("universal_users.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_stock_reservations_product_expires_at", "product_id", "expires_at"),
+    )
+
+
+# 🔥 Sales of hot products not yet subtracted from Product.stock (applied in batches by services/hot_stock.py)
+class HotStockSale(Base):
+    __tablename__ = "hot_stock_sales"
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="SET NULL"), nullable=True)
+    quantity = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# 📮 Place-order requests accepted in queue mode, drained in micro-batches by services/order_intake.py
+class OrderIntake(Base):
+    __tablename__ = "order_intakes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    razorpay_order_id = Column(String(100), unique=True, nullable=False)  # One intake per payment
+    payment_id = Column(String(255), nullable=False)
+    universal_user_id = Column(Integer, ForeignKey("universal_users.id", ondelete="CASCADE"), nullable=False, index=True)
+    address_id = Column(Integer, ForeignKey("addresses.id"), nullable=False)
+    coupon_code = Column(String(50), nullable=True)
+    amount = Column(Float, nullable=False)
+    items = Column(Text, nullable=False)  # JSON snapshot of the cart when the request was accepted
+    status = Column(String(20), nullable=False, default="queued")  # queued | placed | failed
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="SET NULL"), nullable=True)
+    error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_order_intakes_status_id", "status", "id"),
+    )
+
+
+class DeletionJob(Base):
+    """Background purge of a soft-deleted NGO or user (services/deletion_jobs.py)."""
+    __tablename__ = "deletion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(10), nullable=False)  # ngo | user
+    target_user_id = Column(Integer, nullable=False, index=True)  # No FK: the row is deleted by the job itself
+    ngo_id = Column(Integer, nullable=True)
+    ngo_was_approved = Column(Boolean, nullable=True)  # Restored if the job fails and an admin undoes it
+    requested_by = Column(Integer, nullable=True)
+    reason = Column(String(255), nullable=True)
+    status = Column(String(20), nullable=False, default="queued")  # queued | running | completed | failed | restored
+    current_step = Column(String(50), nullable=True)
+    progress = Column(Text, nullable=True)  # JSON {step: rows purged}
+    rows_total = Column(Integer, nullable=False, default=0)  # Counted when the job starts
+    rows_done = Column(Integer, nullable=False, default=0)
+    error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_deletion_jobs_status_updated", "status", "updated_at"),
+    )
+
+
+# ⏰ Periodic jobs (services/scheduler.py): one state row per job, one lease row per scheduler
+class ScheduledJob(Base):
+    __tablename__ = "scheduled_jobs"
+
+    name = Column(String(50), primary_key=True)
+    interval_seconds = Column(Integer, nullable=False)
+    enabled = Column(Boolean, nullable=False, default=True)
+    next_run_at = Column(DateTime, nullable=True)
+    last_started_at = Column(DateTime, nullable=True)
+    last_finished_at = Column(DateTime, nullable=True)
+    last_duration_ms = Column(Integer, nullable=True)
+    last_status = Column(String(20), nullable=True)  # running | ok | failed
+    last_error = Column(String(255), nullable=True)
+    last_result = Column(Text, nullable=True)  # JSON of what the job returned
+    last_runner = Column(String(100), nullable=True)
+    run_count = Column(Integer, nullable=False, default=0)
+    failure_count = Column(Integer, nullable=False, default=0)
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+
+
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(100), nullable=False)  # host:pid:random of the leader
+    expires_at = Column(DateTime, nullable=False)
+    acquired_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+# 🎁 "Frequently bought together", rebuilt offline by services/recommendations.py
+class ProductRecommendation(Base):
+    __tablename__ = "product_recommendations"
+
+    # ✅ Clustered on (product_id, rank): a product's neighbours are one short primary-key range read
+    product_id = Column(Integer, primary_key=True, autoincrement=False)  # No FKs: rows are replaced wholesale
+    rank = Column(Integer, primary_key=True, autoincrement=False)  # 1 = strongest
+    related_product_id = Column(Integer, nullable=False)
+    score = Column(Integer, nullable=False)  # Orders containing both products
+    computed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -6,7 +6,6 @@ from database import get_db
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 import os
-from dotenv import load_dotenv
 from sqlalchemy.exc import IntegrityError
 
 router = APIRouter(prefix="/addresses", tags=["Addresses"])
@@ -14,7 +13,6 @@ router = APIRouter(prefix="/addresses", tags=["Addresses"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
-load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
 ALGORITHM = "HS256"
 
@@ -29,7 +27,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise HTTPException(status_code=401, detail="Invalid token payload")
 
         # ✅ Ensure we fetch user from `universal_users`
-        user = db.query(UniversalUser).filter(UniversalUser.id == int(user_id)).first()
+        user = db.query(UniversalUser).filter(UniversalUser.id == int(user_id), UniversalUser.deleted_at.is_(None)).first()
 
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
@@ -1,18 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from dotenv import load_dotenv
-from email.mime.text import MIMEText
-import smtplib
+from services.email_service import send_email as deliver_email
+from services.uploads import save_uploads, public_url, remove_stored_file, file_extension
+from services.serialization import FastJSONResponse, serialize_admin_ngo, serialize_admin_user
+from services.versioning import bump_version, NGOS
+from services.deletion_jobs import (
+    start_deletion, run_deletion_job_task, deletion_job_status, deletion_blocker, restore_deleted_account,
+)
+from services.scheduler import scheduler_status
+from services.payment_reconciliation import payments_needing_attention, resolve_payment_event
 import os
 import logging
 from schemas import NGOResponse, NGOEditRequest, NGORejectionRequest, UserResponse
 from database import get_db
-from models import NGO, UniversalUser, Product, Order, OrderItem
+from models import NGO, UniversalUser, DeletionJob, ScheduledJob
 import jwt
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.exc import IntegrityError
-import shutil
 from datetime import datetime, timedelta
 
 
@@ -26,13 +30,6 @@ logger = logging.getLogger(__name__)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # ✅ Load Environment Variables
-load_dotenv()
-
-# ✅ Email Configuration
-SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-SENDER_EMAIL = os.getenv("SMTP_EMAIL")
-SENDER_PASSWORD = os.getenv("SMTP_PASSWORD")
 
 # ✅ JWT Secret Key and Algorithm
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
@@ -47,6 +44,10 @@ REJECTION_REASONS = [
     "Suspicious activity detected"
 ]
 
+# ✅ Accepted NGO file formats
+LOGO_TYPES = {"jpg", "jpeg", "png"}
+LICENSE_TYPES = {"jpg", "jpeg", "png", "pdf"}
+
 
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
@@ -58,7 +59,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
-        user = db.query(UniversalUser).filter(UniversalUser.id == user_id).first()
+        user = db.query(UniversalUser).filter(UniversalUser.id == user_id, UniversalUser.deleted_at.is_(None)).first()
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
 
@@ -81,16 +82,8 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
 
 def send_email(to_email: str, subject: str, body: str):
     """Send an email with the given subject and body."""
-    msg = MIMEText(body)
-    msg["Subject"] = subject
-    msg["From"] = SENDER_EMAIL
-    msg["To"] = to_email
-
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.sendmail(SENDER_EMAIL, to_email, msg.as_string())
+        deliver_email(to_email, subject, body, subtype="plain")
         logger.info(f"✅ Email sent to {to_email}")
     except Exception as e:
         logger.error(f"❌ Error sending email to {to_email}: {e}")
@@ -159,6 +152,7 @@ def approve_ngo(
     try:
         # ✅ Update NGO Approval Status
         ngo.is_approved = True
+        bump_version(db, NGOS)
         db.commit()
 
         # 📧 Send Approval Email
@@ -211,6 +205,7 @@ def reject_ngo(
         # 🗑️ Remove NGO & Associated Universal User
         db.delete(ngo)
         db.delete(ngo_user)  # ✅ Ensure universal user is also removed
+        bump_version(db, NGOS)
         db.commit()
 
         logger.info(f"✅ NGO '{ngo.ngo_name}' rejected and removed.")
@@ -239,7 +234,7 @@ def get_pending_ngos(
     ngos = (
         db.query(NGO, UniversalUser)
         .join(UniversalUser, UniversalUser.id == NGO.universal_user_id)
-        .filter(NGO.is_approved == False)
+        .filter(NGO.is_approved == False, UniversalUser.deleted_at.is_(None))
         .all()
     )
 
@@ -289,7 +284,11 @@ def get_ngos(
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Unauthorized: Only admins can view NGOs")
 
-    query = db.query(NGO, UniversalUser).join(UniversalUser, UniversalUser.id == NGO.universal_user_id)
+    query = (
+        db.query(NGO, UniversalUser)
+        .join(UniversalUser, UniversalUser.id == NGO.universal_user_id)
+        .filter(UniversalUser.deleted_at.is_(None))  # Soft-deleted NGOs are being purged
+    )
 
     if verified is not None:
         query = query.filter(NGO.is_approved == verified)
@@ -313,29 +312,8 @@ def get_ngos(
     # Apply Pagination
     ngos = query.offset(offset).limit(limit).all()
 
-    response = [
-        NGOResponse(
-            id=ngo.id,
-            universal_user_id= ngo.universal_user_id,  # ✅ Include Universal User ID
-            ngo_name=ngo.ngo_name,
-            is_approved=ngo.is_approved,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            email=user.email,
-            contact_number=user.contact_number,
-            address=ngo.address,
-            city=ngo.city,
-            state=ngo.state,
-            pincode=ngo.pincode,
-            account_holder_name=ngo.account_holder_name,
-            account_number=ngo.account_number,
-            ifsc_code=ngo.ifsc_code,
-            created_at=ngo.created_at.strftime("%Y-%m-%d")  # Ensure formatted date
-        )
-        for ngo, user in ngos
-    ]
-
-    return response
+    # ✅ Plain dicts in `NGOResponse` shape, encoded with orjson (rows are trusted, no re-validation)
+    return FastJSONResponse([serialize_admin_ngo(ngo, ngo_user) for ngo, ngo_user in ngos])
 
 
 
@@ -350,7 +328,10 @@ def delete_ngo(
     user: UniversalUser = Depends(get_current_user)
 ):
     """
-    🗑️ Delete an NGO and all related records (Products, Order Items) & Notify via Email.
+    🗑️ Delete an NGO and all related records (Products, Images, Wishlist, Reviews) & Notify via Email.
+
+    The NGO is soft-deleted right away; its rows and files are purged in the background
+    (services/deletion_jobs.py). Answers 202 with a job id to poll at `/admin/deletion-jobs/{job_id}`.
     """
 
     # ✅ Ensure only admins can delete NGOs
@@ -367,58 +348,36 @@ def delete_ngo(
     if not ngo_user:
         raise HTTPException(status_code=500, detail="Universal user not found for this NGO.")
 
-    # ✅ Get all products linked to this NGO (using universal_user_id)
-    ngo_products = db.query(Product.id).filter(Product.universal_user_id == ngo.universal_user_id).all()
-    product_ids = [product.id for product in ngo_products]
-
-    # ✅ Check if any of these products are in active orders
-    active_order_items = db.query(OrderItem).filter(OrderItem.product_id.in_(product_ids)).count()
-    if active_order_items > 0:
-        raise HTTPException(
-            status_code=400,
-            detail="Unable to delete NGO as its products are currently part of active orders. Please complete or cancel all orders first."
-        )
-
-    try:
-        # ✅ Delete all products associated with this NGO
-        db.query(Product).filter(Product.universal_user_id == ngo.universal_user_id).delete()
-
-        # ✅ Delete NGO and Universal User
-        db.delete(ngo)
-        db.delete(ngo_user)
-        db.commit()
-
-        # 📧 Send Email Notification
-        subject = "🚫 NGO Account Deleted"
-        body = f"""
-        Dear {ngo.ngo_name},
-
-        Your NGO account has been deleted.
+    # ✅ Refuse if the purge would touch orders (its products', or its own in progress)
+    blocker = deletion_blocker(db, ngo_user, requested_by=user.id)
+    if blocker:
+        raise HTTPException(status_code=400, detail=blocker)
 
-        📝 Reason for deletion: {deletion_reason}
+    # ✅ Soft-delete now, purge in small committed chunks after the response
+    job = start_deletion(db, ngo_user, requested_by=user.id, reason=deletion_reason)
+    background_tasks.add_task(run_deletion_job_task, job.id)
 
-        If you believe this was a mistake, please contact support.
+    # 📧 Send Email Notification
+    subject = "🚫 NGO Account Deleted"
+    body = f"""
+    Dear {ngo.ngo_name},
 
-        Best regards,  
-        Giftible Team
-        """
-        background_tasks.add_task(send_email, ngo_user.email, subject, body)
+    Your NGO account has been deleted.
 
-        return {"status": "success", "message": f"✅ NGO '{ngo.ngo_name}' and its products were deleted successfully."}
-
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(
-            status_code=400,
-            detail="Unable to delete NGO due to existing foreign key constraints. Ensure all related records (such as orders) are removed first."
-        )
-
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Deletion failed: {str(e)}")
+    📝 Reason for deletion: {deletion_reason}
 
+    If you believe this was a mistake, please contact support.
 
+    Best regards,  
+    Giftible Team
+    """
+    background_tasks.add_task(send_email, ngo_user.email, subject, body)
 
+    return FastJSONResponse(status_code=202, content={
+        "status": "accepted",
+        "job_id": job.id,
+        "message": f"✅ NGO '{ngo.ngo_name}' was deleted. Its products and files are being removed in the background.",
+    })
 
 
 # ✅ SEARCH NGO Route (by name, city, contact, or email)
@@ -440,6 +399,7 @@ def search_ngos(
     ngos = (
         db.query(NGO, UniversalUser)
         .join(UniversalUser, UniversalUser.id == NGO.universal_user_id)
+        .filter(UniversalUser.deleted_at.is_(None))
         .filter(
             (NGO.ngo_name.ilike(f"%{query}%")) |
             (NGO.city.ilike(f"%{query}%")) |
@@ -526,29 +486,28 @@ async def edit_ngo(
 
         # ✅ Handle File Uploads
         ngo_dir = os.path.join(UPLOAD_DIR, str(ngo_id))
-        os.makedirs(ngo_dir, exist_ok=True)
-
-        if logo:
-            logo_ext = logo.filename.split(".")[-1].lower()
-            if logo_ext not in ["jpg", "jpeg", "png"]:
-                raise HTTPException(status_code=400, detail="Invalid logo format. Only JPG, PNG allowed.")
-            logo_filename = f"logo.{logo_ext}"
-            logo_path = os.path.join(ngo_dir, logo_filename)
-            with open(logo_path, "wb") as buffer:
-                shutil.copyfileobj(logo.file, buffer)
-            ngo.logo = f"/uploads/ngos/{ngo_id}/{logo_filename}"
-
-
-
-        if license:
-            license_ext = license.filename.split(".")[-1].lower()
-            if license_ext not in ["jpg", "jpeg", "png", "pdf"]:
-                raise HTTPException(status_code=400, detail="Invalid license format. Only JPG, PNG, PDF allowed.")
-            license_filename = f"license.{license_ext}"
-            license_path = os.path.join(ngo_dir, license_filename)
-            with open(license_path, "wb") as buffer:
-                shutil.copyfileobj(license.file, buffer)
-            ngo.license = f"/uploads/ngos/{ngo_id}/{license_filename}"
+        superseded_files = []  # New content gets a new URL; old files are dropped after commit
+
+        if logo and file_extension(logo.filename) not in LOGO_TYPES:
+            raise HTTPException(status_code=400, detail="Invalid logo format. Only JPG, PNG allowed.")
+
+        if license and file_extension(license.filename) not in LICENSE_TYPES:
+            raise HTTPException(status_code=400, detail="Invalid license format. Only JPG, PNG, PDF allowed.")
+
+        # ✅ Stream the provided files to disk in parallel (size-capped & content-sniffed)
+        uploads = {field: file for field, file in (("logo", logo), ("license", license)) if file}
+        stored_paths = await save_uploads(
+            list(uploads.values()),
+            ngo_dir,
+            stems=list(uploads.keys()),
+            allowed_types=[LOGO_TYPES if field == "logo" else LICENSE_TYPES for field in uploads],
+        )
+
+        for field, stored_path in zip(uploads.keys(), stored_paths):
+            old_url = getattr(ngo, field)
+            setattr(ngo, field, public_url(stored_path))
+            if old_url and old_url != getattr(ngo, field):
+                superseded_files.append(old_url)
 
         # ✅ Update User details
         ngo_user.first_name = first_name
@@ -556,7 +515,12 @@ async def edit_ngo(
         ngo_user.email = email
         ngo_user.contact_number = contact_number
 
+        bump_version(db, NGOS)
         db.commit()
+
+        for stale_file in superseded_files:
+            remove_stored_file(stale_file)
+
         return {
             "status": "success",
             "message": f"✅ NGO '{ngo.ngo_name}' updated successfully.",
@@ -564,6 +528,10 @@ async def edit_ngo(
             "license_url": ngo.license
         }
 
+    except HTTPException:
+        db.rollback()
+        raise
+
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Update failed: {str(e)}")
@@ -641,7 +609,7 @@ def get_users(
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Unauthorized: Only admins can view users")
 
-    query = db.query(UniversalUser).filter(UniversalUser.role == "user")  # Only normal users
+    query = db.query(UniversalUser).filter(UniversalUser.role == "user", UniversalUser.deleted_at.is_(None))  # Only normal, active users
 
     # ✅ Handle start_date and end_date properly
     if start_date:
@@ -662,23 +630,8 @@ def get_users(
     # Apply Pagination
     users = query.offset(offset).limit(limit).all()
 
-    response = [
-        UserResponse(
-            id=user.id,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            email=user.email,
-            email_verified=user.email_verified if user.email_verified is not None else False,  # ✅ Handle missing field
-            contact_number=user.contact_number,
-            contact_verified=user.contact_verified if user.contact_verified is not None else False,  # ✅ Handle missing field
-            role=user.role,
-            created_at=user.created_at.strftime("%Y-%m-%d") if user.created_at else None,  # ✅ Handle missing created_at
-        )
-
-        for user in users
-    ]
-
-    return response
+    # ✅ Plain dicts in `UserResponse` shape, encoded with orjson (rows are trusted, no re-validation)
+    return FastJSONResponse([serialize_admin_user(row) for row in users])
 
 
 @router.delete("/users/{user_id}")
@@ -694,6 +647,7 @@ def delete_user(
 
     - Admins can delete any user.
     - Users can delete only their own account.
+    - The account is soft-deleted at once and purged in the background (202 + job id).
     """
 
     # ✅ Fetch the User
@@ -706,54 +660,149 @@ def delete_user(
         raise HTTPException(status_code=403, detail="Unauthorized: You can only delete your own account.")
 
     # ✅ Check if user has any active orders
-    active_orders = db.query(Order).filter(Order.user_id == user_id, Order.status.notin_(["completed", "cancelled"])).count()
-    if active_orders > 0:
-        raise HTTPException(
-            status_code=400,
-            detail="Unable to delete account as there are active orders. Please complete or cancel all orders first."
-        )
+    blocker = deletion_blocker(db, user_to_delete, requested_by=current_user.id)
+    if blocker:
+        raise HTTPException(status_code=400, detail=blocker)
 
-    try:
-        # ✅ Delete order items linked to this user
-        db.query(OrderItem).filter(OrderItem.order_id.in_(
-            db.query(Order.id).filter(Order.user_id == user_id)
-        )).delete(synchronize_session=False)
+    # ✅ Soft-delete now; past orders and the rest are purged in the background
+    job = start_deletion(db, user_to_delete, requested_by=current_user.id, reason=deletion_reason)
+    background_tasks.add_task(run_deletion_job_task, job.id)
 
-        # ✅ Delete orders associated with the user
-        db.query(Order).filter(Order.user_id == user_id).delete(synchronize_session=False)
+    # 📧 Send Email Notification
+    subject = "🚫 Account Deleted"
+    body = f"""
+    Dear {user_to_delete.first_name},
 
-        # ✅ Delete the user from UniversalUser table
-        db.delete(user_to_delete)
-        db.commit()
+    Your Giftible account has been deleted.
+
+    📝 Reason for deletion: {deletion_reason}
+
+    If you believe this was a mistake, please contact support.
+
+    Best regards,  
+    Giftible Team
+    """
+    background_tasks.add_task(send_email, user_to_delete.email, subject, body)
+
+    return FastJSONResponse(status_code=202, content={
+        "status": "accepted",
+        "job_id": job.id,
+        "message": f"✅ User '{user_to_delete.first_name} {user_to_delete.last_name}' was deleted successfully.",
+    })
 
-        # 📧 Send Email Notification
-        subject = "🚫 Account Deleted"
-        body = f"""
-        Dear {user_to_delete.first_name},
 
-        Your Giftible account has been deleted.
+# 🗑️ Deletion progress for the admin UI
+@router.get("/deletion-jobs/{job_id}")
+def get_deletion_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    user: UniversalUser = Depends(get_current_user)
+):
+    """📊 Progress of a background NGO/user deletion."""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Unauthorized: Only admins can view deletion jobs.")
 
-        📝 Reason for deletion: {deletion_reason}
+    job = db.query(DeletionJob).filter(DeletionJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found.")
+    return FastJSONResponse(deletion_job_status(job))
 
-        If you believe this was a mistake, please contact support.
 
-        Best regards,  
-        Giftible Team
-        """
-        background_tasks.add_task(send_email, user_to_delete.email, subject, body)
+@router.post("/deletion-jobs/{job_id}/restore")
+def restore_deletion_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    user: UniversalUser = Depends(get_current_user)
+):
+    """↩️ Undoes the soft delete of a failed deletion job (login and NGO approval come back)."""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Unauthorized: Only admins can restore accounts.")
 
-        return {"status": "success", "message": f"✅ User '{user_to_delete.first_name} {user_to_delete.last_name}' was deleted successfully."}
+    job = restore_deleted_account(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No failed deletion job with this ID.")
+    return FastJSONResponse(deletion_job_status(job))
 
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(
-            status_code=400,
-            detail="Unable to delete user due to existing foreign key constraints. Ensure all related records (such as orders) are removed first."
-        )
 
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Deletion failed: {str(e)}")
+@router.get("/deletion-jobs")
+def list_deletion_jobs(
+    status: str | None = Query(None, description="queued | running | completed | failed | restored"),
+    limit: int = Query(20, le=100),
+    db: Session = Depends(get_db),
+    user: UniversalUser = Depends(get_current_user)
+):
+    """📋 Most recent deletion jobs, newest first."""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Unauthorized: Only admins can view deletion jobs.")
+
+    query = db.query(DeletionJob)
+    if status:
+        query = query.filter(DeletionJob.status == status)
+    jobs = query.order_by(DeletionJob.id.desc()).limit(limit).all()
+    return FastJSONResponse([deletion_job_status(job) for job in jobs])
+
+
+# ⏰ Periodic jobs (services/scheduler.py)
+@router.get("/jobs")
+def list_scheduled_jobs(
+    db: Session = Depends(get_db),
+    user: UniversalUser = Depends(get_current_user)
+):
+    """📊 Scheduler leader plus last run, duration and failures of every periodic job."""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Unauthorized: Only admins can view scheduled jobs.")
+    return FastJSONResponse(scheduler_status(db))
+
+
+@router.post("/jobs/{name}/run")
+def run_scheduled_job_now(
+    name: str,
+    db: Session = Depends(get_db),
+    user: UniversalUser = Depends(get_current_user)
+):
+    """▶️ Makes a job due now; the leader runs it on its next tick."""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Unauthorized: Only admins can run scheduled jobs.")
+
+    job = db.query(ScheduledJob).filter(ScheduledJob.name == name).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Scheduled job not found.")
+    job.next_run_at = datetime.utcnow()
+    db.commit()
+    return {"status": "queued", "message": f"✅ '{name}' will run on the scheduler's next tick."}
+
+
+# 🚨 Captured payments that never became an order (services/payment_reconciliation.py)
+@router.get("/payments/attention")
+def list_payments_needing_attention(
+    limit: int = Query(100, le=500),
+    db: Session = Depends(get_db),
+    user: UniversalUser = Depends(get_current_user)
+):
+    """💸 Paid Razorpay orders that need a refund or a manual fix, oldest first."""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Unauthorized: Only admins can view payment issues.")
+    return FastJSONResponse(payments_needing_attention(db, limit))
+
+
+class PaymentResolution(BaseModel):
+    note: str | None = None
+
+
+@router.post("/payments/attention/{event_id}/resolve")
+def resolve_payment_issue(
+    event_id: int,
+    resolution: PaymentResolution,
+    db: Session = Depends(get_db),
+    user: UniversalUser = Depends(get_current_user)
+):
+    """✅ Marks a payment issue as handled (refunded on Razorpay or fixed by hand)."""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Unauthorized: Only admins can resolve payment issues.")
+    if not resolve_payment_event(db, event_id, resolution.note):
+        raise HTTPException(status_code=404, detail="No open payment issue with this ID.")
+    return {"status": "resolved", "message": "✅ Payment issue marked as resolved."}
+
 
 @router.get("/users/{user_id}", response_model=UserResponse)
 def get_user_details(
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func, case
-from database import get_db
+from services.read_routing import get_read_db  # 📖 Reports read from a replica when one is fresh
+from services.trending import RANKINGS_SHARED, top_selling_products
 from models import Order, Product, Payout, UniversalUser, OrderItem, Category, NGO
 from .auth import get_current_user  
 
@@ -13,7 +14,7 @@ router = APIRouter(prefix="/analytics", tags=["Analytics"])
 @router.get("/ngo")
 def get_ngo_analytics(
     current_user: UniversalUser = Depends(get_current_user),  
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Fetches all analytics data for an NGO in a single API response (Raw JSON)."""
     if current_user.role != "ngo":
@@ -93,7 +94,7 @@ def get_ngo_analytics(
 
 
     # 🛒 Top 5 Best-Selling Products (Using OrderItem)
-    top_selling_products = (
+    top_selling_products_rows = (
         db.query(Product.name, func.count(OrderItem.id))
         .join(OrderItem, OrderItem.product_id == Product.id)  # ✅ Join OrderItem
         .filter(Product.universal_user_id == current_user.id)  # ✅ Filter by NGO's Products
@@ -105,7 +106,13 @@ def get_ngo_analytics(
     )
 
     # ✅ Convert results into structured format
-    top_products_data = [{"name": str(name), "sales": int(sales)} for name, sales in top_selling_products]
+    top_products_data = [{"name": str(name), "sales": int(sales)} for name, sales in top_selling_products_rows]
+
+    # 🔥 Recent bestsellers: time-decayed units sold (services/trending.py), only from the shared store
+    recent_top_products_data = [
+        {"name": str(name), "sales_score": round(score, 1)}
+        for name, score in top_selling_products(db, 5, ngo_user_id=current_user.id)
+    ] if RANKINGS_SHARED else []
 
 
     
@@ -157,6 +164,7 @@ def get_ngo_analytics(
         "stock_trends": stock_data,
         "products_per_category": category_data,
         "top_selling_products": top_products_data,
+        "recent_top_selling_products": recent_top_products_data,
         "revenue_growth": revenue_data,
         "order_status_distribution": order_status_data,
         "payout_trends": payout_data
@@ -169,7 +177,7 @@ def get_ngo_analytics(
 @router.get("/admin")
 def get_admin_analytics(
     current_user: UniversalUser = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Fetches all analytics data for Admin in a single API response."""
     
@@ -224,7 +232,7 @@ def get_admin_analytics(
 
 
     # 🛒 **Top 5 Best-Selling Products (Horizontal Bar Chart)**
-    top_selling_products = (
+    top_selling_products_rows = (
         db.query(Product.name, func.count(OrderItem.id))
         .join(OrderItem, OrderItem.product_id == Product.id)
         .filter(OrderItem.status != "Cancelled")  # Exclude cancelled orders
@@ -233,7 +241,11 @@ def get_admin_analytics(
         .limit(5)
         .all()
     )
-    top_products_data = [{"name": str(name), "sales": int(sales)} for name, sales in top_selling_products]
+    top_products_data = [{"name": str(name), "sales": int(sales)} for name, sales in top_selling_products_rows]
+    recent_top_products_data = [
+        {"name": str(name), "sales_score": round(score, 1)}  # Time-decayed units sold (services/trending.py)
+        for name, score in top_selling_products(db, 5)
+    ] if RANKINGS_SHARED else []
 
     # 🏷️ **Category-wise Product Count (Vertical Bar Chart)**
     category_stats = (
@@ -270,6 +282,7 @@ def get_admin_analytics(
         "order_status_distribution": order_status_data,
         "revenue_growth": revenue_data,
         "top_selling_products": top_products_data,
+        "recent_top_selling_products": recent_top_products_data,
         "category_distribution": category_data,
         "payout_trends": payout_data,
         "remaining_payouts": remaining_payout_data
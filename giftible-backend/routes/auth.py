@@ -1,35 +1,36 @@
 import os
 import jwt
-import shutil
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException, Form, File, UploadFile
 from sqlalchemy.orm import Session
-from dotenv import load_dotenv
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from database import get_db
-from models import UniversalUser, RefreshToken, NGO, PasswordResetToken
+from models import UniversalUser, NGO, PasswordResetToken
 from schemas import (
     UserCreate, AdminCreate, UserResponse, UserBase, NGOCreateForm,
     LogoutRequest, RefreshTokenRequest, RegistrationResponse, ForgotPasswordRequest, ResetPasswordRequest
 )
 
 from .utils import (
-    create_access_token, create_refresh_token,
-    save_refresh_token, send_verification_email, send_contact_verification_link, send_forgot_password_mail
+    create_access_token,
+    save_refresh_token, revoke_refresh_token, send_verification_email, send_contact_verification_link, send_forgot_password_mail
 )
+from services.refresh_tokens import rotate_refresh_token, revoke_user_refresh_tokens
+from services.uploads import save_uploads, move_stored_file, public_url, remove_stored_file, IMAGE_TYPES, DOCUMENT_TYPES
+from starlette.concurrency import run_in_threadpool
 from jose import jwt, JWTError
 import re
 import random
+import shutil
 import string
+import uuid
 
 
 # 🚀 Load environment variables
 router = APIRouter()
-load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
-REFRESH_SECRET_KEY = os.getenv("REFRESH_SECRET_KEY", "your_refresh_secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
@@ -40,6 +41,7 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 UPLOAD_DIR = "uploads/ngos"
+STAGING_DIR = os.path.join(UPLOAD_DIR, "_staging")  # Validated uploads wait here until the NGO id exists
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
@@ -52,7 +54,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
-        user = db.query(UniversalUser).filter(UniversalUser.id == user_id).first()
+        user = db.query(UniversalUser).filter(UniversalUser.id == user_id, UniversalUser.deleted_at.is_(None)).first()
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
 
@@ -200,7 +202,7 @@ def register_admin(data: AdminCreate, db: Session = Depends(get_db)):
 
 # ✅ NGO Registration
 @router.post("/register/ngo")
-def register_ngo(
+async def register_ngo(
     ngo_name: str = Form(...),
     first_name: str = Form(...),
     last_name: str = Form(...),
@@ -221,6 +223,9 @@ def register_ngo(
     """Registers an NGO, stores authentication details in `UniversalUser`, 
     and NGO details in `NGO`, saving files in structured directories."""
 
+    staging_dir = os.path.join(STAGING_DIR, uuid.uuid4().hex)  # ✅ Per request: identical uploads never share a path
+    stored_paths = []  # Files to delete if registration does not complete
+
     try:
         # ✅ Validate Form Data
         ngo_data = NGOCreateForm(
@@ -248,41 +253,25 @@ def register_ngo(
             password=ngo_data.password
         )
 
-        # ✅ Register Universal User
-        universal_user_response = register_universal_user(db, universal_user_data, "ngo")
+        # ✅ Stream License & Logo to a staging area first, so bad files are rejected before any account exists
+        stored_paths = await save_uploads(
+            [license, logo],
+            staging_dir,
+            stems=["license", "logo"],
+            allowed_types=[DOCUMENT_TYPES, IMAGE_TYPES],
+        )
+
+        # ✅ Register Universal User (bcrypt + SMTP/SMS are blocking → worker thread)
+        universal_user_response = await run_in_threadpool(register_universal_user, db, universal_user_data, "ngo")
 
         # ✅ Fetch newly created NGO's ID
         ngo_id = universal_user_response.user.id  # Assuming universal_user_response contains the user ID
 
-        # ✅ Create NGO-Specific Directory
+        # ✅ Move License & Logo (content-addressed names) into the NGO directory
         ngo_upload_dir = os.path.join(UPLOAD_DIR, str(ngo_id))
-        os.makedirs(ngo_upload_dir, exist_ok=True)
-
-        # ✅ Define File Paths
-        license_ext = license.filename.split(".")[-1].lower()
-        logo_ext = logo.filename.split(".")[-1].lower()
-
-        license_filename = f"license.{license_ext}"
-        logo_filename = f"logo.{logo_ext}"
-
-        license_path = os.path.join(ngo_upload_dir, license_filename)
-        logo_path = os.path.join(ngo_upload_dir, logo_filename)
-
-        # ✅ Remove old files if they exist (Prevent duplicate issues)
-        if os.path.exists(license_path):
-            os.remove(license_path)
-        if os.path.exists(logo_path):
-            os.remove(logo_path)
-
-
-
-        # ✅ Save License File
-        with open(license_path, "wb") as buffer:
-            shutil.copyfileobj(license.file, buffer)
-
-        # ✅ Save Logo File
-        with open(logo_path, "wb") as buffer:
-            shutil.copyfileobj(logo.file, buffer)
+        for index, path in enumerate(stored_paths):
+            stored_paths[index] = move_stored_file(path, ngo_upload_dir)
+        license_path, logo_path = stored_paths
 
         # ✅ Insert NGO-Specific Details into `NGO` Table
         ngo_profile = NGO(
@@ -295,22 +284,33 @@ def register_ngo(
             city=ngo_data.city,
             state=ngo_data.state,
             pincode=ngo_data.pincode,
-            license=f"/uploads/ngos/{ngo_id}/{license_filename}",  # ✅ Store correct file path
-            logo=f"/uploads/ngos/{ngo_id}/{logo_filename}",        # ✅ Store correct file path
+            license=public_url(license_path),  # ✅ Store correct file path
+            logo=public_url(logo_path),        # ✅ Store correct file path
             is_approved=False
         )
 
         db.add(ngo_profile)
         db.commit()
         db.refresh(ngo_profile)
+        stored_paths = []  # ✅ Owned by the NGO profile now
 
         return {"message": "✅ NGO registered successfully! Awaiting admin approval."}
 
+    except HTTPException:
+        db.rollback()
+        raise
+
     except Exception as e:
         db.rollback()
         print(f"❌ Error during NGO registration: {e}")
         raise HTTPException(status_code=500, detail="Internal server error.")
 
+    finally:
+        # 🧹 Staged uploads are publicly served: never leave them behind a failed registration
+        for path in stored_paths:
+            remove_stored_file(path)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
 
 
 
@@ -333,6 +333,10 @@ def login_for_access_token(
         # ✅ Query user by contact number
         user = db.query(UniversalUser).filter(UniversalUser.contact_number == contact_number).first()
 
+        if user and user.deleted_at:
+            print("❌ Account deleted")
+            raise HTTPException(status_code=403, detail="This account has been deleted. Please contact support.")
+
         if not user:
             print("❌ Contact number not found")
             raise HTTPException(status_code=404, detail="Contact number not found, please register first.")
@@ -363,9 +367,7 @@ def login_for_access_token(
 
         # ✅ Generate tokens
         access_token = create_access_token(data={"sub": str(user.id), "role": user.role})
-        refresh_token, refresh_expiry = create_refresh_token(data={"sub": str(user.id), "role": user.role})
-
-        save_refresh_token(db, user.id, refresh_token, refresh_expiry)
+        refresh_token = save_refresh_token(db, user.id, user.role)  # ✅ New token family for this login
 
         # ✅ Construct the response payload
         response_data = {
@@ -402,20 +404,19 @@ def login_for_access_token(
 # 🚪 Logout & Revoke Token
 @router.post("/logout")
 def logout(request: LogoutRequest, db: Session = Depends(get_db)):
-    """Removes the user's refresh token to log them out."""
+    """Revokes the session (refresh-token family) the given refresh token belongs to."""
     try:
-        refresh_token = request.refresh_token  # ✅ Extract refresh_token
-        print(f"🔒 Logging out refresh token: {refresh_token}")
-
-        # ✅ Correct query to delete refresh token
-        deleted = db.query(RefreshToken).filter(RefreshToken.token == refresh_token).delete()
+        print("🔒 Logging out refresh token")
 
-        if deleted == 0:
+        # ✅ Indexed digest lookup; the family is also added to the revocation set
+        if not revoke_refresh_token(db, request.refresh_token):
             raise HTTPException(status_code=404, detail="Refresh token not found.")
 
-        db.commit()
         return {"message": "✅ Successfully logged out"}
 
+    except HTTPException:
+        raise
+
     except Exception as e:
         print(f"❌ Logout error: {e}")
         db.rollback()
@@ -424,39 +425,14 @@ def logout(request: LogoutRequest, db: Session = Depends(get_db)):
 
 @router.post("/refresh-token")
 def refresh_access_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
-    refresh_token = request.refresh_token
-
-    try:
-        print(f"🔄 Refresh Token Received: {refresh_token}")  # Debug log
-        
-        payload = jwt.decode(refresh_token, REFRESH_SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = str(payload.get("sub"))
-
-        print(f"🔎 Decoded Payload: {payload}")  # Debug log
-
-        # ✅ Correct the query (use `universal_user_id`)
-        token_entry = db.query(RefreshToken).filter_by(token=refresh_token, universal_user_id=user_id).first()
-        if not token_entry:
-            print("❌ Refresh token not found in DB")  # Debug log
-            raise HTTPException(status_code=401, detail="Invalid refresh token.")
-
-        if token_entry.expires_at < datetime.utcnow():
-            print("❌ Refresh token expired!")  # Debug log
-            raise HTTPException(status_code=401, detail="Refresh token expired.")
-
-        # ✅ Generate new access token
-        new_access_token = create_access_token({"sub": user_id, "role": payload.get("role")})
-
-        print(f"✅ New Access Token Generated: {new_access_token}")  # Debug log
-        return {"access_token": new_access_token}
-
-    except jwt.ExpiredSignatureError:
-        print("❌ Refresh token expired!")  # Debug log
-        raise HTTPException(status_code=401, detail="Refresh token expired.")
+    """
+    Exchanges a refresh token for a new access token and a rotated refresh token.
+    """
+    payload, new_refresh_token = rotate_refresh_token(db, request.refresh_token)
 
-    except JWTError as e:
-        print(f"❌ JWT Error: {e}")  # Debug log
-        raise HTTPException(status_code=401, detail="Invalid token.")
+    # ✅ Generate new access token
+    new_access_token = create_access_token({"sub": payload["sub"], "role": payload.get("role")})
+    return {"access_token": new_access_token, "refresh_token": new_refresh_token}
 
 
 
@@ -546,8 +522,9 @@ def reset_password(request: ResetPasswordRequest, db: Session = Depends(get_db))
     hashed_password = pwd_context.hash(request.new_password)
     user.password = hashed_password
 
-    # Remove the used token
+    # Remove the used token and sign out every existing session
     db.delete(token_entry)
+    revoke_user_refresh_tokens(db, user.id)
     db.commit()
 
     return {"message": "Password reset successful. You can now log in."}
@@ -7,6 +7,7 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from sqlalchemy import func  # ✅ Import func here
 from .utils import SECRET_KEY, ALGORITHM
+from services.stock_reservations import available_stock
 
 
 router = APIRouter(prefix="/cart", tags=["Cart"])
@@ -22,7 +23,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token payload")
 
-        user = db.query(UniversalUser).filter(UniversalUser.id == user_id).first()
+        user = db.query(UniversalUser).filter(UniversalUser.id == user_id, UniversalUser.deleted_at.is_(None)).first()
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
 
@@ -45,7 +46,9 @@ def add_to_cart(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    if product.stock < item.quantity:
+    # ✅ Units held by other customers' checkouts are not available
+    stock = available_stock(db, product, exclude_user_id=current_user.id)
+    if stock < item.quantity:
         raise HTTPException(status_code=400, detail="Not enough stock available")
 
     cart = db.query(Cart).filter(Cart.universal_user_id == current_user.id).first()
@@ -58,7 +61,7 @@ def add_to_cart(
     cart_item = db.query(CartItem).filter(CartItem.cart_id == cart.id, CartItem.product_id == item.product_id).first()
     
     if cart_item:
-        if product.stock < (cart_item.quantity + item.quantity):
+        if stock < (cart_item.quantity + item.quantity):
             raise HTTPException(status_code=400, detail="Not enough stock available")
         cart_item.quantity += item.quantity
     else:
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from database import get_db
 from models import Category, UniversalUser, NGO, Product
@@ -6,9 +6,9 @@ from schemas import CategoryCreate, CategoryResponse, CategoryApproval, Category
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 import os
-from dotenv import load_dotenv
-from email.mime.text import MIMEText
-import smtplib
+from services.email_service import send_email as deliver_email
+from services.versioning import bump_version, conditional_get, CATEGORIES
+from services.reference_cache import approved_categories
 import logging
 
 
@@ -18,17 +18,10 @@ import logging
 router = APIRouter(prefix="/categories", tags=["Categories"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
 ALGORITHM = "HS256"
 
 
-# ✅ Load email credentials from environment variables
-SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-SENDER_EMAIL = os.getenv("SMTP_EMAIL")
-SENDER_PASSWORD = os.getenv("SMTP_PASSWORD")
-
 logger = logging.getLogger(__name__)
 
 
@@ -46,7 +39,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         print(f"🛠️ DEBUG: Token Decoded - Contact Number/ID: {contact_number}, Role: {role}")
 
         # ✅ Check if user exists
-        user = db.query(UniversalUser).filter(UniversalUser.id == int(contact_number)).first()
+        user = db.query(UniversalUser).filter(UniversalUser.id == int(contact_number), UniversalUser.deleted_at.is_(None)).first()
 
         if not user:
             print("❌ User not found in database.")  # Debugging line
@@ -63,16 +56,8 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
 
 def send_email(to_email: str, subject: str, body: str):
     """Send an email with the given subject and body."""
-    msg = MIMEText(body, "html")
-    msg["Subject"] = subject
-    msg["From"] = SENDER_EMAIL
-    msg["To"] = to_email
-
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.sendmail(SENDER_EMAIL, to_email, msg.as_string())
+        deliver_email(to_email, subject, body, subtype="html")
         logger.info(f"✅ Email sent to {to_email}")
     except Exception as e:
         logger.error(f"❌ Error sending email to {to_email}: {e}")
@@ -180,8 +165,9 @@ def create_category(
 
 # 📥 Public: Get only approved categories
 @router.get("/", response_model=list[CategoryResponse], summary="Public: Fetch only approved categories")
-def get_approved_categories(db: Session = Depends(get_db)):
-    return db.query(Category).filter(Category.is_approved == True).all()
+def get_approved_categories(request: Request, response: Response, db: Session = Depends(get_db)):
+    response.headers.update(conditional_get(request, db, (CATEGORIES,)))  # ✅ 304 if unchanged
+    return approved_categories.get(db)  # ✅ Served from the per-worker reference cache
 
 
 
@@ -273,6 +259,7 @@ def approve_category(
         raise HTTPException(status_code=404, detail="Category not found.")
 
     category.is_approved = approval.is_approved
+    bump_version(db, CATEGORIES)
     db.commit()
     db.refresh(category)
 
@@ -328,6 +315,7 @@ def reject_category(
 
         # ✅ Delete the Category
         db.delete(category)
+        bump_version(db, CATEGORIES)
         db.commit()
         
         return {"message": f"🚫 Category '{category.name}' rejected and removed.", "reason": rejection_reason}
@@ -1,21 +1,21 @@
 import os
 import jwt
-from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from database import get_db
-from models import Address, Coupon, Cart, CartItem, CouponUsage, UniversalUser
+from models import Address, Coupon, Cart, CartItem, UniversalUser
 from schemas import AddressCreate, CouponApply, CouponCreate, CouponResponse, CouponToggle
 from fastapi.security import OAuth2PasswordBearer
-from dotenv import load_dotenv
 from jose import JWTError
 from .utils import SECRET_KEY, ALGORITHM
+from services.versioning import bump_version, conditional_get, COUPONS
+from services.reference_cache import live_coupons
+from services.coupon_engine import compiled_coupons, evaluate_coupon
 from typing import Optional
 
 router = APIRouter(prefix="/checkout", tags=["Checkout"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-load_dotenv()
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> UniversalUser:
     try:
@@ -25,7 +25,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token payload")
 
-        user = db.query(UniversalUser).filter(UniversalUser.id == user_id).first()
+        user = db.query(UniversalUser).filter(UniversalUser.id == user_id, UniversalUser.deleted_at.is_(None)).first()
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
 
@@ -36,11 +36,6 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         raise HTTPException(status_code=401, detail="Invalid token.")
 
 
-# ✅ Calculate Discount (Max Cap Applied)
-def calculate_discount(coupon: Coupon, order_amount: float) -> float:
-    potential_discount = (coupon.discount_percentage / 100) * order_amount
-    return min(potential_discount, coupon.max_discount)
-
 # ✅ Apply Coupon During Checkout
 @router.post("/apply-coupon", summary="User: Apply a coupon during checkout")
 def apply_coupon(
@@ -48,9 +43,7 @@ def apply_coupon(
     db: Session = Depends(get_db),
     current_user: UniversalUser = Depends(get_current_user)
 ):
-    coupon_entry = db.query(Coupon).filter(Coupon.code == coupon.code, Coupon.is_active == True).first()
-
-    if not coupon_entry:
+    if coupon.code not in compiled_coupons(db):
         raise HTTPException(status_code=404, detail="Invalid or inactive coupon code")
 
     cart = db.query(Cart).filter(Cart.universal_user_id == current_user.id).first()
@@ -58,13 +51,9 @@ def apply_coupon(
         raise HTTPException(status_code=400, detail="Your cart is empty")
 
     total = sum(item.product.price * item.quantity for item in cart.cart_items)
-    if total < coupon_entry.minimum_order_amount:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Minimum order amount is ₹{coupon_entry.minimum_order_amount}"
-        )
 
-    discount = calculate_discount(coupon_entry, total)  
+    # ✅ Rules from the compiled coupon table + per-period usage check (the actual redemption happens at place-order)
+    coupon_entry, discount = evaluate_coupon(db, coupon.code, current_user.id, total)
     return {
         "message": "Coupon applied successfully",
         "discount_percentage": coupon_entry.discount_percentage,
@@ -92,11 +81,11 @@ def get_cart_summary(
 
     # ✅ Check if a valid coupon is applied
     if coupon_code:
-        coupon = db.query(Coupon).filter(Coupon.code == coupon_code, Coupon.is_active == True).first()
+        coupon = compiled_coupons(db).get(coupon_code)
 
         # ✅ Apply discount only if the coupon exists and meets the minimum order amount
         if coupon and total >= coupon.minimum_order_amount:
-            discount = calculate_discount(coupon, total)
+            discount = coupon.discount_for(total)
         else:
             discount = 0  # Coupon invalid or does not meet the minimum order amount
 
@@ -130,6 +119,7 @@ def create_coupon(
     )
 
     db.add(new_coupon)
+    bump_version(db, COUPONS)
     db.commit()
     db.refresh(new_coupon)
     return {"message": "Coupon created successfully", "coupon": new_coupon}
@@ -139,29 +129,11 @@ def create_coupon(
 def get_all_coupons(db: Session = Depends(get_db), current_admin: UniversalUser = Depends(get_current_user)):
     return db.query(Coupon).all()
 
-# ✅ Check Coupon Eligibility (Prevent Multiple Uses)
-def check_coupon_eligibility(db: Session, coupon: Coupon, user: UniversalUser):
-    usage = db.query(CouponUsage).filter(CouponUsage.universal_user_id == user.id, CouponUsage.coupon_id == coupon.id).first()
-
-    if coupon.usage_limit == "one_time" and usage:
-        raise HTTPException(status_code=400, detail="Coupon can be used only once per user.")
-
-    if coupon.usage_limit == "one_per_day" and usage and (datetime.utcnow() - usage.used_at) < timedelta(days=1):
-        raise HTTPException(status_code=400, detail="Coupon can be used only once in 24 hours.")
-
-# ✅ Apply Coupon and Track Usage
-def apply_coupon_usage(coupon: Coupon, user: UniversalUser, db: Session):
-    check_coupon_eligibility(db, coupon, user)
-
-    usage = CouponUsage(universal_user_id=user.id, coupon_id=coupon.id)
-    db.add(usage)
-    db.commit()
-
 # ✅ Fetch Live Coupons (For Users)
 @router.get("/coupons/live", response_model=list[CouponResponse], summary="Fetch all active coupons")
-def get_live_coupons(db: Session = Depends(get_db)):
-    coupons = db.query(Coupon).filter(Coupon.is_active == True).all()
-    return coupons
+def get_live_coupons(request: Request, response: Response, db: Session = Depends(get_db)):
+    response.headers.update(conditional_get(request, db, (COUPONS,)))  # ✅ 304 if unchanged
+    return live_coupons.get(db)  # ✅ Served from the per-worker reference cache
 
 # 🔄 API to Toggle Coupon Status
 @router.patch("/toggle-coupon-status/{coupon_id}", summary="Admin: Toggle coupon live/unlive status")
@@ -180,6 +152,7 @@ def toggle_coupon_status(
 
     # ✅ Update is_active status
     coupon.is_active = toggle_data.is_active
+    bump_version(db, COUPONS)
 
     db.commit()
     db.refresh(coupon)
@@ -3,14 +3,15 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, extract, distinct, case
 from datetime import datetime, timedelta
 from models import UniversalUser, Product, Order, Category, Payout, OrderItem, NGO
-from database import get_db
+from services.read_routing import get_read_db  # 📖 Reports read from a replica when one is fresh
+from services.trending import RANKINGS_SHARED, top_ngos_by_revenue, top_categories_by_revenue, top_selling_products
 from .auth import get_current_user
 
 router = APIRouter(prefix="/dashboard", tags=["Admin Dashboard"])
 
 @router.get("/admin")
 def get_dashboard_metrics(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: UniversalUser = Depends(get_current_user)
 ):
     # ✅ Only Admins can access this data
@@ -208,6 +209,14 @@ def get_dashboard_metrics(
         .all()
     )
 
+    # 🔥 Recent leaders: time-decayed revenue (services/trending.py), only from the shared store
+    recent_top_ngos = [
+        {"ngo_name": name, "sales_score": round(score, 2)} for name, score in top_ngos_by_revenue(db, 5)
+    ] if RANKINGS_SHARED else []
+    recent_top_categories = [
+        {"category": name, "sales_score": round(score, 2)} for name, score in top_categories_by_revenue(db, 5)
+    ] if RANKINGS_SHARED else []
+
     # ✅ Format Data for Frontend
     top_categories_data = [{"category_name": name, "total_sales": float(sales) if sales is not None else 0.0} for name, sales in top_categories]
 
@@ -252,7 +261,9 @@ def get_dashboard_metrics(
         "sales_trends": sales_trends,
         "top_ngos": [{"ngo_name": r[0], "total_sales": r[1]} for r in top_ngos],
         "payout_trends": payout_trends,
-        "top_categories": [{"category": r[0], "total_sales": r[1]} for r in top_categories]
+        "top_categories": [{"category": r[0], "total_sales": r[1]} for r in top_categories],
+        "recent_top_ngos": recent_top_ngos,
+        "recent_top_categories": recent_top_categories,
     }
 
 
@@ -261,7 +272,7 @@ def get_dashboard_metrics(
 
 @router.get("/ngo")
 def get_ngo_dashboard(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: UniversalUser = Depends(get_current_user)
 ):
     # ✅ Only NGOs can access this
@@ -375,6 +386,11 @@ def get_ngo_dashboard(
     # ✅ Convert response to JSON format
     top_products = [{"name": name, "total_sold": int(total_sold)} for name, total_sold in top_products]
 
+    # 🔥 Recent bestsellers: time-decayed units sold (services/trending.py), only from the shared store
+    recent_top_products = [
+        {"name": name, "sales_score": round(score, 1)} for name, score in top_selling_products(db, 5, ngo_user_id=ngo_id)
+    ] if RANKINGS_SHARED else []
+
 
     # ✅ Payout Trends (Last 6 Months)
     payout_trends = db.query(
@@ -467,6 +483,7 @@ def get_ngo_dashboard(
         "sales_trends": sales_trends,
         "order_trends": order_trends,
         "top_products": top_products,
+        "recent_top_products": recent_top_products,
         "payout_trends": payout_trends,
         "recent_orders": recent_orders,
         "recent_approvals": recent_approvals,
@@ -7,6 +7,8 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 import os
 from .auth import get_current_user 
+from services.versioning import bump_version, PRODUCTS
+from services.hot_stock import stock_changed_by_hand
 
 router = APIRouter(prefix="/inventory", tags=["Inventory"])
 
@@ -47,6 +49,8 @@ def update_stock(product_id: int, stock_data: InventoryUpdate, db: Session = Dep
         raise HTTPException(status_code=400, detail="Stock quantity cannot be negative.")
 
     product.stock = stock_data.stock  # ✅ Update stock
+    stock_changed_by_hand(db, product)  # 🔥 Rebuild the flash-sale counter, if any
+    bump_version(db, PRODUCTS)
     db.commit()
     db.refresh(product)
 
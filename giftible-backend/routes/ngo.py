@@ -1,55 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from database import get_db
 from models import NGO, UniversalUser
 from schemas import NGOResponse, UserResponse, UserProfileUpdate, PaginatedNGOResponse
 from .auth import get_current_user
+from services.versioning import bump_version, conditional_get, NGOS
+from services.reference_cache import approved_ngos
 
 router = APIRouter(prefix="/ngo", tags=["NGO"])
 
 
 @router.get("/approved", response_model=PaginatedNGOResponse)  # ✅ Use new response model
 def get_approved_ngos(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     limit: int = Query(10, ge=1),  # ✅ Limit for pagination
     offset: int = Query(0, ge=0),  # ✅ Offset for pagination
 ):
     """Retrieve paginated list of approved NGOs with relevant details."""
+    response.headers.update(conditional_get(request, db, (NGOS,)))  # ✅ 304 if unchanged
 
-    # ✅ Get total count of approved NGOs
-    total_ngos = db.query(NGO).filter(NGO.is_approved == True).count()
-
-    ngos = (
-        db.query(NGO, UniversalUser)
-        .join(UniversalUser, UniversalUser.id == NGO.universal_user_id)
-        .filter(NGO.is_approved == True)
-        .limit(limit)
-        .offset(offset)
-        .all()
-    )
+    # ✅ Page through the per-worker reference cache instead of querying MySQL
+    ngos = approved_ngos.get(db)
 
     return {
-        "total": total_ngos,  # ✅ Pagination metadata
+        "total": len(ngos),  # ✅ Pagination metadata
         "limit": limit,
         "offset": offset,
-        "ngos": [
-            NGOResponse(
-                id=ngo.id,
-                universal_user_id=ngo.universal_user_id,
-                ngo_name=ngo.ngo_name,
-                is_approved=ngo.is_approved,
-                logo=ngo.logo,
-                first_name=user.first_name,
-                last_name=user.last_name,
-                email=user.email,
-                contact_number=user.contact_number,
-                address=ngo.address,
-                city=ngo.city,
-                state=ngo.state,
-                pincode=ngo.pincode,
-            )
-            for ngo, user in ngos
-        ],
+        "ngos": ngos[offset:offset + limit],
     }
 
 
@@ -113,6 +92,7 @@ def edit_ngo_profile(
     if updated_data.pincode:
         ngo_profile.pincode = updated_data.pincode
 
+    bump_version(db, NGOS)
     db.commit()
     db.refresh(current_user)
     db.refresh(ngo_profile)
@@ -2,14 +2,21 @@ import os
 import jwt
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager
 from database import get_db
-from models import Order, OrderItem, Cart, CartItem, UniversalUser, Product, ProductImage, NGO, Address
+from models import Order, OrderItem, OrderIntake, UniversalUser, Product, ProductImage, NGO, Address
 from schemas import OrderResponse, UpdateOrderItemStatusRequest, OrderItemResponse, OrderStatus, CancelOrderItemRequest, ProductResponse
 from fastapi.security import OAuth2PasswordBearer
 from services.razorpay_client import verify_payment_signature
+from services.serialization import FastJSONResponse, serialize_address
+from services.versioning import bump_version_after_commit, STOCK
+from services.order_placement import cart_lines, place_order_from_lines, find_placed_order, placed_order_response
+from sqlalchemy.exc import IntegrityError
+from services.hot_stock import release_hot_stock_on_commit
+from services.trending import record_sale_on_commit, record_cancellation_on_commit
+from services.order_intake import enqueue_order, intake_status
+from settings import ORDER_INTAKE_MODE
 from pydantic import BaseModel
-from dotenv import load_dotenv
 from jose import JWTError
 from sqlalchemy.sql import func
 from typing import Optional
@@ -19,7 +26,6 @@ from typing import Optional
 router = APIRouter(prefix="/orders", tags=["Orders"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
 ALGORITHM = "HS256"
 
@@ -36,7 +42,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         if not user_id or not role:
             raise HTTPException(status_code=401, detail="Invalid token payload.")
 
-        user = db.query(UniversalUser).filter(UniversalUser.id == user_id).first()
+        user = db.query(UniversalUser).filter(UniversalUser.id == user_id, UniversalUser.deleted_at.is_(None)).first()
         if not user:
             raise HTTPException(status_code=404, detail="User not found.")
 
@@ -54,7 +60,19 @@ class PlaceOrderRequest(BaseModel):
     amount: float
     signature: str
 
+def replay_placed_order(db: Session, razorpay_order_id: str, user_id: int) -> dict | None:
+    """Stored result for a Razorpay order that already became an Order (client retry / webhook got there first)."""
+    placed = find_placed_order(db, razorpay_order_id)
+    if not placed:
+        return None
+    if placed.universal_user_id != user_id:
+        raise HTTPException(status_code=409, detail="This payment is already linked to another order.")
+    print(f"🔁 Order {placed.id} already placed for {razorpay_order_id}, returning stored result")
+    return placed_order_response(placed.id)
+
+
 # ✅ Route to place an order after payment verification
+# The Razorpay order id is the idempotency key: retries return the stored result instead of re-running the transaction
 @router.post("/place-order", summary="User: Place an order after payment verification")
 def place_order(
     order_request: PlaceOrderRequest,
@@ -64,6 +82,11 @@ def place_order(
     try:
         print(f"📦 Incoming Order Request: {order_request.dict()}")
 
+        # ⚡ Fast path for retries: one unique-index lookup, no signature check or cart work
+        replay = replay_placed_order(db, order_request.order_id, current_user.id)
+        if replay:
+            return replay
+
         # ✅ Verify payment signature
         is_verified = verify_payment_signature(
             order_request.order_id,
@@ -78,82 +101,60 @@ def place_order(
         print("✅ Payment verified successfully!")
 
         # ✅ Fetch the user's cart
-        user_cart = db.query(Cart).filter(Cart.universal_user_id == current_user.id).first()
-
-        if not user_cart:
-            print("⚠️ No cart found for this user.")
-            raise HTTPException(status_code=404, detail="No cart found for this user.")
-
-        # ✅ Fetch cart items linked to this cart
-        cart_items = db.query(CartItem).filter(CartItem.cart_id == user_cart.id).all()
+        lines = cart_lines(db, current_user.id)
 
-        if not cart_items:
+        if not lines:
             print("⚠️ No items in the cart. Cannot proceed with order placement.")
             raise HTTPException(status_code=400, detail="❌ Cannot place an empty order!")
 
-        print(f"🛒 Cart Items Found: {len(cart_items)}")
-
-        # ✅ Create a new order
-        order = Order(
-            universal_user_id=current_user.id,
+        print(f"🛒 Cart Items Found: {len(lines)}")
+
+        # 📮 Queue mode: accept durably and let the order workers place it in a micro-batch
+        if ORDER_INTAKE_MODE == "queue":
+            intake = enqueue_order(
+                db,
+                user_id=current_user.id,
+                address_id=order_request.address_id,
+                amount=order_request.amount,
+                razorpay_order_id=order_request.order_id,
+                payment_id=order_request.payment_id,
+                lines=lines,
+                coupon_code=order_request.coupon_code,
+            )
+            if intake.universal_user_id != current_user.id:
+                raise HTTPException(status_code=409, detail="This payment is already linked to another order.")
+            print(f"📮 Order request queued as intake {intake.id}")
+            return FastJSONResponse(status_code=202 if intake.status == "queued" else 200, content=intake_status(intake))
+
+        # ✅ One transaction: order, items, stock, coupon usage, cart
+        order = place_order_from_lines(
+            db,
+            user_id=current_user.id,
             address_id=order_request.address_id,
-            total_amount=order_request.amount,
+            amount=order_request.amount,
             razorpay_order_id=order_request.order_id,
-            payment_id=order_request.payment_id
+            payment_id=order_request.payment_id,
+            lines=lines,
+            coupon_code=order_request.coupon_code,
         )
-        db.add(order)
-        db.commit()
-        db.refresh(order)
-
-        print(f"✅ Order ID: {order.id} created successfully!")
-
-        # ✅ Insert order items and update stock
-        for item in cart_items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
-
-            if not product:
-                raise HTTPException(status_code=404, detail=f"Product with ID {item.product_id} not found")
-
-            # ✅ Ensure stock is available
-            if product.stock < item.quantity:
-                raise HTTPException(status_code=400, detail=f"❌ Not enough stock for {product.name}")
-
-            # ✅ Deduct stock
-            product.stock -= item.quantity
-            print(f"⚡ Stock Updated | {product.name} Remaining: {product.stock}")
-
-            # ✅ Create OrderItem
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item.product_id,
-                quantity=item.quantity,
-                price=product.price,
-                status="Pending"
-            )
-            db.add(order_item)
-            db.commit()  # Commit after adding each order item
-            db.refresh(order_item)
-            print(f"🛍️ OrderItem Added | Product: {product.name}, Quantity: {item.quantity}")
-
-        # ✅ Check cart items before deletion
-        cart_count_before = db.query(CartItem).filter(CartItem.cart_id == user_cart.id).count()
-        print(f"🔍 Cart Items Before Deletion: {cart_count_before}")
-
-        # ✅ Clear user's cart after order is placed
-        db.query(CartItem).filter(CartItem.cart_id == user_cart.id).delete()
         db.commit()
 
-        # ✅ Check cart items after deletion
-        cart_count_after = db.query(CartItem).filter(CartItem.cart_id == user_cart.id).count()
-        print(f"🗑️ Cart Items After Deletion: {cart_count_after}")
-
         print(f"✅ Order placed with ID: {order.id} | Cart cleared.")
 
-        return {"message": "✅ Order placed successfully!", "order_id": order.id}
+        return placed_order_response(order.id)
 
     except HTTPException as http_err:
+        db.rollback()
         raise http_err
 
+    except IntegrityError:
+        # A concurrent retry (or the payment webhook) placed this order first
+        db.rollback()
+        replay = replay_placed_order(db, order_request.order_id, current_user.id)
+        if replay:
+            return replay
+        raise HTTPException(status_code=409, detail="Order could not be placed. Please try again.")
+
     except Exception as e:
         db.rollback()
         print(f"❌ Order placement failed | Error: {e}")
@@ -163,6 +164,21 @@ def place_order(
 
 
 
+# 📮 Poll a queued place-order request (queue mode)
+@router.get("/intake/{intake_id}", summary="User: Status of a queued order request")
+def get_order_intake(
+    intake_id: int,
+    db: Session = Depends(get_db),
+    current_user: UniversalUser = Depends(get_current_user),
+):
+    intake = db.query(OrderIntake).filter(
+        OrderIntake.id == intake_id, OrderIntake.universal_user_id == current_user.id
+    ).first()
+    if not intake:
+        raise HTTPException(status_code=404, detail="Order request not found.")
+    return intake_status(intake)
+
+
 # 📦 Fetch user order history
 @router.get("/user", response_model=list[OrderResponse], summary="User: Fetch order history")
 def user_order_history(db: Session = Depends(get_db), current_user: UniversalUser = Depends(get_current_user)):
@@ -195,6 +211,7 @@ def view_orders(
         db.query(OrderItem)
         .join(Order, OrderItem.order_id == Order.id)
         .join(Product, OrderItem.product_id == Product.id)
+        .options(contains_eager(OrderItem.order), contains_eager(OrderItem.product))  # ✅ Reuse the joins, no per-item lazy loads
     )
 
     # ✅ Restrict NGOs to only their order items
@@ -228,24 +245,23 @@ def view_orders(
     if not order_items:
         raise HTTPException(status_code=404, detail="No order items found with given filters.")
 
+    # ✅ Batch-load addresses & NGO names for the page instead of querying per item
+    address_ids = {item.order.address_id for item in order_items}
+    addresses = {a.id: a for a in db.query(Address).filter(Address.id.in_(address_ids)).all()} if address_ids else {}
+
+    ngo_names = {}
+    if current_user.role == "admin":
+        product_ids = {item.product_id for item in order_items}
+        ngo_names = dict(
+            db.query(Product.id, NGO.ngo_name)
+            .join(NGO, NGO.universal_user_id == Product.universal_user_id)
+            .filter(Product.id.in_(product_ids))
+            .all()
+        )
+
     # ✅ Process order items based on role
     filtered_order_items = []
     for item in order_items:
-        # ✅ Fetch Full Address Object
-        address = db.query(Address).filter(Address.id == item.order.address_id).first()
-
-        address_response = {
-            "id": address.id if address else None,
-            "full_name": address.full_name if address else None,
-            "contact_number": address.contact_number if address else None,
-            "address_line": address.address_line if address else None,
-            "landmark": address.landmark if address else None,
-            "city": address.city if address else None,
-            "state": address.state if address else None,
-            "pincode": address.pincode if address else None,
-            "is_default": address.is_default if address else False
-        } if address else None
-
         # ✅ Construct Order Item Response
         order_item_data = {
             "id": item.id,
@@ -263,18 +279,12 @@ def view_orders(
                 "price": item.product.price,
                 "description": item.product.description,
             },
-            "delivery_address": address_response  # ✅ Fixed Address Issue
+            "delivery_address": serialize_address(addresses.get(item.order.address_id))  # ✅ Fixed Address Issue
         }
 
         # ✅ Add NGO Name for Admins
         if current_user.role == "admin":
-            ngo_name = (
-                db.query(NGO.ngo_name)
-                .join(Product, Product.universal_user_id == NGO.universal_user_id)
-                .filter(Product.id == item.product_id)
-                .scalar()
-            )
-            order_item_data["ngo_name"] = ngo_name if ngo_name else "N/A"
+            order_item_data["ngo_name"] = ngo_names.get(item.product_id) or "N/A"
 
         filtered_order_items.append(order_item_data)
 
@@ -301,14 +311,15 @@ def view_orders(
         for product in products
     ]
 
-    return {
+    # ✅ Datetimes & enums are encoded natively by orjson
+    return FastJSONResponse({
         "total_order_items": total_order_items,
         "current_page": page,
         "page_size": page_size,
         "total_pages": (total_order_items + page_size - 1) // page_size,
         "order_items": filtered_order_items,
         "products": filtered_products
-    }
+    })
 
 
 
@@ -345,6 +356,13 @@ def update_order_item_status(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid order status provided.")
 
+    # 📈 Cancelling (or restoring) a line takes it out of (or back into) the rankings
+    was_cancelled = order_item.status == OrderStatus.cancelled.value
+    if was_cancelled != (new_status == OrderStatus.cancelled):
+        product = db.query(Product).filter(Product.id == order_item.product_id).first()
+        record = record_sale_on_commit if was_cancelled else record_cancellation_on_commit
+        record(db, product, order_item.quantity, order_item.price * order_item.quantity, order_item.order.created_at)
+
     # ✅ Update status for the specific order item
     order_item.status = new_status.value  # Store the string value from the Enum
     order_item.updated_at = datetime.utcnow()
@@ -480,6 +498,13 @@ def cancel_order_item(
     product = db.query(Product).filter(Product.id == order_item.product_id).first()
     if product:
         product.stock += order_item.quantity  # ✅ Add back the quantity to stock
+        if product.is_hot:
+            release_hot_stock_on_commit(db, product.id, order_item.quantity)  # 🔥 Sellable again right away
+        bump_version_after_commit(db, STOCK)
+        if order_item.status != OrderStatus.cancelled.value:
+            record_cancellation_on_commit(  # 📈 Out of the trending / bestseller rankings
+                db, product, order_item.quantity, order_item.price * order_item.quantity, order_item.order.created_at
+            )
 
     # ✅ Update order item status & store cancellation reason
     order_item.status = OrderStatus.cancelled.value
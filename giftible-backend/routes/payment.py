@@ -1,9 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends
-from services.razorpay_client import create_order, verify_payment_signature
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt, JWTError
+from services.razorpay_client import (
+    create_order, verify_payment_signature, verify_webhook_signature, cart_receipt, forget_orders, get_gateway,
+    RazorpayError, RazorpayUnavailableError,
+)
+from services import razorpay_client
+from services.fakes import sign_payment, payment_captured_webhook
+from services.order_placement import cart_lines, cart_subtotal, consumed_receipts, record_checkout_intent
+from services.coupon_engine import evaluate_coupon
+from services.payment_reconciliation import store_payment_event
+from services.stock_reservations import reserve_stock, attach_razorpay_order, release_holds
+from settings import PAYMENT_BACKEND
 from pydantic import BaseModel, confloat
+import hashlib
 import logging
 from database import get_db
 from sqlalchemy.orm import Session
+from .utils import SECRET_KEY, ALGORITHM
 import os
 
 
@@ -14,6 +29,18 @@ logger = logging.getLogger(__name__)
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
 
+# 🔓 Token is optional here: it only scopes the order receipt to the caller's cart
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+
+def get_optional_user_id(token: str = Depends(optional_oauth2_scheme)) -> int | None:
+    if not token:
+        return None
+    try:
+        user_id = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        return int(user_id) if user_id else None
+    except (JWTError, ValueError):
+        return None
 
 
 class PaymentOrderRequest(BaseModel):
@@ -23,15 +50,68 @@ class PaymentOrderRequest(BaseModel):
 # 📝 Create Razorpay Order
 class PaymentRequest(BaseModel):
     amount: float  # ✅ Amount should be a float
+    address_id: int | None = None  # ✅ Lets a webhook finish the order if the browser never comes back
+    coupon_code: str | None = None
 
 @router.post("/razorpay/order")
-def create_razorpay_order(payment: PaymentRequest):
+async def create_razorpay_order(
+    payment: PaymentRequest,
+    db: Session = Depends(get_db),
+    user_id: int | None = Depends(get_optional_user_id),
+):
     print(f"Received Payment Payload: {payment}")
+    if payment.amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be greater than zero.")
+
+    # ✅ DB work stays off the event loop; the gateway call itself is async and pooled
+    lines, receipt, created_holds = [], None, []
+    if user_id:
+        lines = await run_in_threadpool(cart_lines, db, user_id)
+        # Derived from the cart, so a retried checkout reuses its Razorpay order
+        items = [(line["product_id"], line["quantity"]) for line in lines]
+        receipt = cart_receipt(user_id, items, payment.amount)
+        # ✅ Buying the same cart again: skip generations already paid for (and their memoized orders)
+        consumed = await run_in_threadpool(consumed_receipts, db, user_id, receipt)
+        forget_orders(consumed)
+        generation = 0
+        while receipt in consumed:
+            generation += 1
+            receipt = cart_receipt(user_id, items, payment.amount, generation)
+    if lines and payment.coupon_code:
+        # 🎟️ Reject an unusable coupon before holding stock or creating a payable order
+        subtotal = await run_in_threadpool(cart_subtotal, db, lines)
+        await run_in_threadpool(evaluate_coupon, db, payment.coupon_code, user_id, subtotal)
+    if lines:
+        # ⏳ Hold the cart before anyone can pay for it: 409 if the last units are already held or sold
+        created_holds = await run_in_threadpool(reserve_stock, db, receipt, user_id, lines)
+
     try:
-        order = create_order(amount=payment.amount)
-        return {"order_id": order["id"], "amount": order["amount"] / 100}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        order = await create_order(
+            amount=payment.amount,
+            receipt=receipt,
+            notes={"universal_user_id": str(user_id)} if user_id else None,
+        )
+    except RazorpayError as e:
+        if lines:
+            await run_in_threadpool(release_holds, db, created_holds)  # Only ours: retries share the receipt
+        if isinstance(e, RazorpayUnavailableError):
+            print(f"❌ Razorpay unavailable: {e}")
+            raise HTTPException(status_code=504, detail="Payment gateway is not responding. Please try again.")
+        print(f"❌ Razorpay rejected order: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+
+    if lines:
+        await run_in_threadpool(attach_razorpay_order, db, receipt, order["id"])
+        try:
+            # 🎟️ The coupon is claimed here, before payment, so placing the paid order cannot fail on it
+            await run_in_threadpool(
+                record_checkout_intent, db, order["id"], user_id, payment.amount, lines,
+                payment.address_id, payment.coupon_code, receipt,
+            )
+        except HTTPException:
+            await run_in_threadpool(release_holds, db, created_holds)  # The unpaid Razorpay order just lapses
+            raise
+    return {"order_id": order["id"], "amount": order["amount"] / 100}
 
 class PaymentVerificationRequest(BaseModel):
     razorpay_order_id: str
@@ -51,4 +131,44 @@ def verify_razorpay_payment(request: PaymentVerificationRequest):
         return {"status": "success", "message": "Payment verified successfully."}
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error verifying payment: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error verifying payment: {str(e)}")
+
+
+# 📥 Razorpay webhooks: verify, store, acknowledge. Orders are finished by services/payment_reconciliation.py
+@router.post("/razorpay/webhook", include_in_schema=False)
+async def razorpay_webhook(request: Request, db: Session = Depends(get_db)):
+    body = await request.body()
+    try:
+        is_valid = verify_webhook_signature(body, request.headers.get("X-Razorpay-Signature"))
+    except ValueError as e:
+        print(e)
+        raise HTTPException(status_code=503, detail="Webhook secret not configured.")
+    if not is_valid:
+        raise HTTPException(status_code=400, detail="Invalid webhook signature.")
+
+    event_id = request.headers.get("X-Razorpay-Event-Id") or hashlib.sha256(body).hexdigest()
+    try:
+        created = await run_in_threadpool(store_payment_event, db, event_id, body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed webhook body.")
+    return {"status": "ok", "duplicate": not created}
+
+
+# 🧪 Fake gateway only: stands in for the Razorpay checkout widget during offline / load-test runs
+if PAYMENT_BACKEND == "fake":
+    @router.post("/fake/pay/{order_id}", include_in_schema=False)
+    async def fake_checkout_payment(order_id: str, db: Session = Depends(get_db)):
+        """
+        Returns a payment id and valid signature for a fake Razorpay order, and queues the
+        `payment.captured` webhook Razorpay would send (so reconciliation runs offline too).
+        """
+        try:
+            order = await get_gateway().fetch_order(order_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Fake Razorpay order not found.")
+        payment = sign_payment(order_id, razorpay_client.RAZORPAY_KEY_SECRET)
+        event_id, body, _ = payment_captured_webhook(
+            order_id, payment["razorpay_payment_id"], order["amount"], razorpay_client.RAZORPAY_WEBHOOK_SECRET
+        )
+        await run_in_threadpool(store_payment_event, db, event_id, body)
+        return payment
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from database import get_db
+from services.read_routing import get_read_db
 from models import Payout, UniversalUser, NGO
 from schemas import PayoutRequest, PayoutResponse
 from .sales import get_pending_payouts
@@ -124,7 +125,7 @@ def get_payout_history(
     search_query: Optional[str] = Query(None, description="Search by NGO name or payout ID"),
     ngo_id: Optional[int] = None,
     current_user: UniversalUser = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """
     Retrieve payout history:
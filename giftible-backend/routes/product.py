@@ -1,17 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, BackgroundTasks, Request, Response
 from sqlalchemy.orm import Session, joinedload
 from database import get_db
 from models import Product, ProductImage, Category, UniversalUser, NGO, OrderItem, Review
 from typing import List, Optional
-import shutil
 import os
 from datetime import datetime, timedelta
 from schemas import ProductResponse
+from services.uploads import save_uploads, remove_stored_file, IMAGE_TYPES
+from services.file_store import acquire_stored_file, release_product_images, collect_orphans_task
+from services.serialization import FastJSONResponse, serialize_browse_product, serialize_related_product
+from services.versioning import bump_version, conditional_get, NO_STORE_HEADERS, CATEGORIES, NGOS, PRODUCTS, RECOMMENDATIONS, REVIEWS, STOCK
+from services.recommendations import related_products, RECOMMENDATION_TOP_K
+from services.trending import record_view, trending_product_ids
+from services.facets import browse_facets
+from services.reference_cache import get_approved_category
+from services.stock_reservations import available_stock
+from services.hot_stock import stock_changed_by_hand, reconcile_hot_stock, reset_hot_stock_on_commit
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 import os
-from dotenv import load_dotenv
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, case
 from sqlalchemy.sql.expression import func
 
 
@@ -21,7 +29,6 @@ UPLOAD_DIR = "uploads/products/"
 os.makedirs(UPLOAD_DIR, exist_ok=True)  # Ensure upload directory exists
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
 ALGORITHM = "HS256"
 
@@ -39,7 +46,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         if not user_id or not role:
             raise HTTPException(status_code=401, detail="Invalid token payload.")
 
-        user = db.query(UniversalUser).filter(UniversalUser.id == user_id).first()
+        user = db.query(UniversalUser).filter(UniversalUser.id == user_id, UniversalUser.deleted_at.is_(None)).first()
         if not user:
             raise HTTPException(status_code=404, detail="User not found.")
 
@@ -56,6 +63,7 @@ from sqlalchemy import or_
 
 @router.get("/browse", summary="Browse products with filters")
 def browse_products(
+    request: Request,
     status: str = Query("all", description="Filter by product status: all, approved, unapproved, live, unlive"),
     ngo_ids: List[int] = Query([], description="Filter by multiple NGO IDs"),
     category_ids: List[int] = Query([], description="Filter by multiple Category IDs"),
@@ -67,6 +75,8 @@ def browse_products(
     limit: int = Query(10, description="Number of products per page"),
     offset: int = Query(0, description="Pagination offset"),
     randomize: bool = Query(False, description="Set to `true` to fetch products randomly"),
+    sort: Optional[str] = Query(None, description="`trending` → most viewed / ordered lately first"),
+    include_facets: bool = Query(False, description="Set to `true` to add category / NGO / price counts"),
     db: Session = Depends(get_db),
 ):
     """
@@ -78,7 +88,16 @@ def browse_products(
     - `start_date=2024-01-01&end_date=2024-02-01` → Date range filter
     - `search_query=bag` → Search products by name, description, or NGO name
     - `randomize=true` → Fetch products randomly
+    - `sort=trending` → Fetch products by time-decayed views and orders (services/trending.py)
+    - `include_facets=true` → Also return sidebar counts per category, NGO and price bucket (services/facets.py)
     """
+    trending = sort == "trending" and not randomize
+
+    # ✅ Conditional GET: 304 without running the listing query (random and trending orders are never cached)
+    cache_headers = (
+        NO_STORE_HEADERS if randomize or trending
+        else conditional_get(request, db, (PRODUCTS, STOCK, CATEGORIES, NGOS, REVIEWS))
+    )
 
     query = (
         db.query(Product)
@@ -91,15 +110,18 @@ def browse_products(
         )
     )
 
+    # 🧮 Status / date / search criteria are collected apart so the facet counts can reuse them
+    base_filters = []
+
     # ✅ Apply Status Filters
     if status == "approved":
-        query = query.filter(Product.is_approved == True)
+        base_filters.append(Product.is_approved == True)
     elif status == "unapproved":
-        query = query.filter(Product.is_approved == False)
+        base_filters.append(Product.is_approved == False)
     elif status == "live":
-        query = query.filter(Product.is_approved == True, Product.is_live == True)
+        base_filters += [Product.is_approved == True, Product.is_live == True]
     elif status == "unlive":
-        query = query.filter(Product.is_live == False)
+        base_filters.append(Product.is_live == False)
 
     # ✅ Apply Multiple NGO Filters
     if ngo_ids:
@@ -116,17 +138,18 @@ def browse_products(
         query = query.filter(Product.price <= max_price)
 
     # ✅ Apply Date Filter
+    start_date_parsed = None
     try:
         if start_date:
             start_date_parsed = datetime.strptime(start_date, "%Y-%m-%d")
-            query = query.filter(Product.created_at >= start_date_parsed)
+            base_filters.append(Product.created_at >= start_date_parsed)
 
         if end_date:
             end_date_parsed = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(hours=23, minutes=59, seconds=59)
         else:
             end_date_parsed = datetime.utcnow().replace(hour=23, minute=59, second=59)
 
-        query = query.filter(Product.created_at <= end_date_parsed)
+        base_filters.append(Product.created_at <= end_date_parsed)
 
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
@@ -139,12 +162,23 @@ def browse_products(
             NGO.ngo_name.ilike(f"%{search_query}%"),
             UniversalUser.email.ilike(f"%{search_query}%")
         )
-        query = query.filter(search_filter)
+        base_filters.append(search_filter)
+
+    query = query.filter(*base_filters)
 
     # ✅ Randomize results if `randomize=true`
     if randomize:
         query = query.order_by(func.random())
 
+    # 📈 Ranked products first, in ranking order (read from memory / Redis, no aggregation); the rest after
+    if trending:
+        ranked = trending_product_ids(category_ids, ngo_ids)
+        if ranked:
+            query = query.order_by(
+                case({product_id: rank for rank, product_id in enumerate(ranked)}, value=Product.id, else_=len(ranked)),
+                Product.id.desc(),
+            )
+
     # ✅ Apply Pagination
     total_count = query.count()
     products = query.limit(limit).offset(offset).all()
@@ -156,40 +190,32 @@ def browse_products(
     ).filter(Review.product_id.in_(product_ids)).group_by(Review.product_id).all()
 
     # ✅ Convert Ratings to Dictionary {product_id: avg_rating}
-    ratings_map = {r.product_id: round(r.average_rating, 1) for r in ratings_query}
+    ratings_map = {r.product_id: round(float(r.average_rating), 1) for r in ratings_query}
 
-    # ✅ Corrected response format with `universal_user_id`
-    return {
+    # ✅ Built straight from the eager-loaded rows and encoded with orjson (no re-validation pass)
+    payload = {
         "message": "✅ Products fetched successfully" if products else "⚠️ No products found.",
         "total": total_count,
         "products": [
-            {
-                "id": product.id,
-                "name": product.name,
-                "price": product.price,
-                "stock": product.stock,
-                "is_approved": product.is_approved,
-                "is_live": product.is_live,
-                "created_at": product.created_at.strftime("%Y-%m-%d"),
-                "average_rating": ratings_map.get(product.id, 5.0),  # ✅ Added Average Rating
-                "category": {
-                    "id": product.category.id,
-                    "name": product.category.name
-                } if product.category else None,
-                "ngo": {
-                    "id": product.universal_user.ngo.id if product.universal_user.ngo else None,
-                    "universal_user_id": product.universal_user.id,
-                    "ngo_name": product.universal_user.ngo.ngo_name if product.universal_user.ngo else "No NGO",
-                    "logo": product.universal_user.ngo.logo,
-                    "contact_number": product.universal_user.contact_number,
-                    "email": product.universal_user.email,
-                } if product.universal_user.ngo else None,
-                "images": [{"image_url": img.image_url} for img in product.images],
-            }
+            serialize_browse_product(product, ratings_map.get(product.id, 5.0))  # ✅ Default rating 5.0
             for product in products
-        ]
+        ],
     }
 
+    # 🧮 One grouped query for all facets, cached per normalized filter set
+    if include_facets:
+        filter_key = (
+            status if status in ("approved", "unapproved", "live", "unlive") else "all",
+            start_date_parsed,
+            end_date_parsed.replace(microsecond=0),  # The default end is "today 23:59:59" + now's microseconds
+            (search_query or "").lower(),  # ilike: case does not change the result
+        )
+        payload["facets"] = browse_facets(
+            db, base_filters, filter_key, category_ids, ngo_ids, min_price=min_price, max_price=max_price
+        )
+
+    return FastJSONResponse(payload, headers=cache_headers)
+
 
 
 
@@ -220,10 +246,13 @@ async def add_product(
     if current_user.role != "ngo":
         raise HTTPException(status_code=403, detail="Unauthorized. Only NGOs can add products.")
 
-    category = db.query(Category).filter(Category.id == category_id, Category.is_approved == True).first()
+    category = get_approved_category(db, category_id)  # ✅ Reference cache lookup
     if not category:
         raise HTTPException(status_code=400, detail="Invalid category or category not approved.")
 
+    # ✅ Stream all images to disk in parallel (size-capped & type-checked) before touching the DB
+    image_paths = await save_uploads(images, UPLOAD_DIR, allowed_types=IMAGE_TYPES)
+
     new_product = Product(
         universal_user_id=current_user.id,  # 🔄 Updated
         category_id=category_id,
@@ -235,18 +264,15 @@ async def add_product(
         is_live=False,     
     )
     db.add(new_product)
-    db.commit()
-    db.refresh(new_product)
+    db.flush()  # ✅ Assigns new_product.id without a separate commit
 
-    # ✅ Save images
-    for image in images:
-        image_path = os.path.join(UPLOAD_DIR, f"{new_product.id}_{image.filename}")
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-
-        product_image = ProductImage(product_id=new_product.id, image_url=image_path)
+    # ✅ Save images (content-addressed names → immutable, cacheable URLs; duplicates share one file)
+    for image_path in image_paths:
+        stored_file = acquire_stored_file(db, image_path)
+        product_image = ProductImage(product_id=new_product.id, image_url=stored_file.path, stored_file_id=stored_file.id)
         db.add(product_image)
 
+    bump_version(db, PRODUCTS)
     db.commit()
     return {"message": "Product added. Awaiting admin approval."}
 
@@ -277,7 +303,7 @@ def edit_product(
         raise HTTPException(status_code=403, detail="Unauthorized. NGOs can only edit their own products.")
 
     # ✅ Validate Category
-    category = db.query(Category).filter(Category.id == category_id, Category.is_approved == True).first()
+    category = get_approved_category(db, category_id)  # ✅ Reference cache lookup
     if not category:
         raise HTTPException(status_code=400, detail="Invalid category or category not approved.")
 
@@ -286,7 +312,9 @@ def edit_product(
     product.name = name
     product.description = description
     product.price = price
-    product.stock = stock
+    if stock != product.stock:
+        product.stock = stock
+        stock_changed_by_hand(db, product)  # 🔥 Rebuild the flash-sale counter, if any
     product.updated_at = datetime.utcnow()
 
     # 🚨 If the product is edited by an NGO, reset approval status to 0
@@ -294,6 +322,7 @@ def edit_product(
         product.is_approved = False  # ✅ Reset approval status
         product.is_live = False  # ✅ Reset approval status
 
+    bump_version(db, PRODUCTS)
     db.commit()
 
     return {
@@ -353,6 +382,7 @@ def approve_product(
         raise HTTPException(status_code=404, detail="Product not found.")
 
     product.is_approved = True
+    bump_version(db, PRODUCTS)
     db.commit()
     return {"message": f"Product '{product.name}' approved successfully."}
 
@@ -361,6 +391,7 @@ def approve_product(
 @router.post("/reject/{product_id}", summary="Admin: Reject product")
 def reject_product(
     product_id: int,
+    background_tasks: BackgroundTasks,
     reason: str = Form(...),
     db: Session = Depends(get_db),
     current_user: UniversalUser = Depends(get_current_user),
@@ -373,11 +404,45 @@ def reject_product(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found.")
 
+    legacy_paths = release_product_images(db, product_id)
     db.delete(product)
+    bump_version(db, PRODUCTS)
     db.commit()
+
+    for path in legacy_paths:
+        remove_stored_file(path)
+    background_tasks.add_task(collect_orphans_task)
     return {"message": f"Product rejected. Reason: {reason}"}
 
 
+# 🔥 Toggle flash-sale (high-contention) stock mode (Admin Only)
+@router.post("/{product_id}/hot", summary="Admin: Enable or disable flash-sale stock mode")
+def set_hot_mode(
+    product_id: int,
+    enabled: bool = True,
+    db: Session = Depends(get_db),
+    current_user: UniversalUser = Depends(get_current_user),
+):
+    """Hot products are admitted by an atomic counter instead of a row lock (see services/hot_stock.py)."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can change stock mode.")
+
+    product = db.query(Product).filter(Product.id == product_id).first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found.")
+
+    if product.is_hot and not enabled:
+        while reconcile_hot_stock(db, product_id=product.id):  # ✅ Fold pending sales into stock before leaving counter mode
+            pass
+        db.refresh(product)
+
+    product.is_hot = enabled
+    reset_hot_stock_on_commit(db, product.id)
+    bump_version(db, PRODUCTS)
+    db.commit()
+    return {"message": f"Flash-sale mode {'enabled' if enabled else 'disabled'} for '{product.name}'.", "is_hot": product.is_hot}
+
+
 # ----------------------------- USER ROUTES ----------------------------- #
 
 # 🚀 Browse All Approved & Live Products
@@ -412,6 +477,7 @@ def make_product_live(
         raise HTTPException(status_code=400, detail="Product must be approved before making it live.")
 
     product.is_live = True
+    bump_version(db, PRODUCTS)
     db.commit()
     return {"message": f"✅ Product '{product.name}' is now live."}
 
@@ -433,6 +499,7 @@ def make_product_unlive(
         raise HTTPException(status_code=404, detail="Product not found or unauthorized.")
 
     product.is_live = False
+    bump_version(db, PRODUCTS)
     db.commit()
     return {"message": f"🚫 Product '{product.name}' is now unlive."}
 
@@ -482,6 +549,7 @@ def get_approved_products_by_ngo(
 @router.delete("/delete/{product_id}", summary="Admin/NGO: Delete a product")
 def delete_product(
     product_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: UniversalUser = Depends(get_current_user),
 ):
@@ -502,21 +570,40 @@ def delete_product(
     if existing_orders > 0:
         return {"message": "⚠️ Cannot delete this product because orders are already placed. Please complete or cancel orders before deleting."}
 
-    # ✅ Delete associated product images from storage
-    images = db.query(ProductImage).filter(ProductImage.product_id == product_id).all()
-    for image in images:
-        if os.path.exists(image.image_url):
-            os.remove(image.image_url)  # Remove image file from storage
-        db.delete(image)  # Delete image record from DB
+    # ✅ Release image references (shared files stay until no product uses them)
+    legacy_paths = release_product_images(db, product_id)
 
     # ✅ Delete the product
     db.delete(product)
+    bump_version(db, PRODUCTS)
     db.commit()
 
+    for path in legacy_paths:
+        remove_stored_file(path)  # Remove untracked image file from storage
+    background_tasks.add_task(collect_orphans_task)  # 🧹 Unreferenced files are removed after a grace period
+
     return {"message": f"✅ Product '{product.name}' deleted successfully."}
 
 
 
+@router.get("/{product_id}/related", summary="User: Products frequently bought together")
+def get_related_products(
+    product_id: int,
+    request: Request,
+    limit: int = Query(RECOMMENDATION_TOP_K, ge=1, le=RECOMMENDATION_TOP_K),
+    db: Session = Depends(get_db),
+):
+    """Live products most often ordered together with this one, precomputed by services/recommendations.py."""
+    cache_headers = conditional_get(request, db, (PRODUCTS, STOCK, RECOMMENDATIONS))  # ✅ 304 until a rebuild or catalogue change
+
+    # ✅ One primary-key range read of precomputed neighbours; no aggregation per request
+    related = related_products(db, product_id, limit)
+    return FastJSONResponse({
+        "product_id": product_id,
+        "related": [serialize_related_product(product, score) for product, score in related],
+    }, headers=cache_headers)
+
+
 @router.get("/{product_id}", summary="User: View product details")
 def get_product_details(
     product_id: int,
@@ -528,6 +615,8 @@ def get_product_details(
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found or not available.")
+    if product.is_approved and product.is_live:
+        record_view(product)  # 📈 Trending score
 
     # 🔍 Fetch related images
     images = db.query(ProductImage).filter(ProductImage.product_id == product_id).all()
@@ -588,7 +677,7 @@ def get_product_details(
             "name": product.name,
             "description": product.description,
             "price": product.price,
-            "stock": product.stock,
+            "stock": available_stock(db, product),  # ✅ Minus units held by checkouts in progress
             "is_live": product.is_live,
             "is_approved": product.is_approved,
             "created_at": product.created_at,
@@ -608,10 +697,11 @@ def get_product_details(
 
 
 @router.get("/ngo/{universal_user_id}", summary="View all products by a specific NGO")
-def get_products_by_ngo(universal_user_id: int, db: Session = Depends(get_db)):
+def get_products_by_ngo(universal_user_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Fetch all products added by a specific NGO using the Universal User ID.
     """
+    response.headers.update(conditional_get(request, db, (PRODUCTS, STOCK, CATEGORIES, NGOS)))  # ✅ 304 if unchanged
 
     # ✅ Step 1: Fetch NGO details (Retrieve Universal User ID from UniversalUser, NGO Name from NGOs table)
     ngo_details = (
@@ -6,6 +6,7 @@ from schemas import ReviewCreate, ReviewResponse
 from typing import List
 from datetime import datetime
 from .auth import get_current_user
+from services.versioning import bump_version, REVIEWS
 
 router = APIRouter(prefix="/reviews", tags=["Reviews"])
 
@@ -54,6 +55,7 @@ def add_review(
 
     try:
         db.add(new_review)
+        bump_version(db, REVIEWS)
         db.commit()
         db.refresh(new_review)
     except Exception as e:
@@ -117,6 +119,7 @@ def delete_review(
 
     # ✅ Delete the review
     db.delete(review)
+    bump_version(db, REVIEWS)
     db.commit()
 
     return {"message": "Review deleted successfully!"}
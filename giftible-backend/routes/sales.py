@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from database import get_db
+from services.read_routing import get_read_db  # 📖 Reports read from a replica when one is fresh
 from models import Order, OrderItem, NGO, UniversalUser, Product, ProductImage, Payout, Category
 from schemas import OrderResponse, ProductResponse, ImageResponse
 from typing import List, Optional
@@ -17,7 +17,7 @@ router = APIRouter(prefix="/sales", tags=["Sales"])
 @router.get("/total", response_model=float)
 def get_total_sales(
     current_user: UniversalUser = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     # ✅ Restrict access to only NGOs and Admins
     if current_user.role not in ["admin", "ngo"]:
@@ -53,7 +53,7 @@ def get_total_sales(
 def get_ngo_sales(
     universal_user_id: int,
     current_user: UniversalUser = Depends(get_current_user),  # ✅ Ensure authenticated user
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     # ✅ Check if the current user is authorized (Only Admin & NGO)
     if current_user.role not in ["admin", "ngo"]:
@@ -94,7 +94,7 @@ def get_ngo_sales(
 def get_product_sales(
     product_id: int,
     current_user: UniversalUser = Depends(get_current_user),  # ✅ Ensure authenticated user
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     # ✅ Restrict access to only Admins and NGOs
     if current_user.role not in ["admin", "ngo"]:
@@ -128,7 +128,7 @@ def get_sales_in_date_range(
     category_id: Optional[int] = None,
     search_query: Optional[str] = Query(None, description="Search for products by name"),
     current_user: UniversalUser = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     # ✅ Restrict access to only Admins and NGOs
     if current_user.role not in ["admin", "ngo"]:
@@ -226,7 +226,7 @@ def get_sales_in_date_range(
 @router.get("/pending-payouts/{universal_user_id}", response_model=float)
 def get_pending_payouts(
     universal_user_id: int, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: UniversalUser = Depends(get_current_user)  # ✅ Ensure user is logged in
 ):
     # ✅ Restrict access: Only Admins & NGOs can access this route
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.orm import Session
 from database import get_db
 from models import UniversalUser
 from schemas import UserResponse, UserProfileUpdate
 from .auth import get_current_user
+from services.versioning import bump_version, NGOS
+from services.deletion_jobs import start_deletion, run_deletion_job_task, deletion_blocker
 
 router = APIRouter(prefix="/user", tags=["User"])
 
@@ -49,6 +51,8 @@ def edit_user_profile(
     if updated_data.contact_number:
         current_user.contact_number = updated_data.contact_number
 
+    if current_user.role == "ngo":
+        bump_version(db, NGOS)  # ✅ NGO contact details appear in public listings
     db.commit()
     db.refresh(current_user)
 
@@ -58,7 +62,17 @@ def edit_user_profile(
 
 # ✅ Delete Account
 @router.delete("/profile/delete")
-def delete_account(db: Session = Depends(get_db), current_user: UniversalUser = Depends(get_current_user)):
-    db.delete(current_user)
-    db.commit()
-    return {"message": "Account deleted successfully"}
+def delete_account(
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: UniversalUser = Depends(get_current_user),
+):
+    # ✅ Same checks as the admin delete: never purge orders still in progress
+    blocker = deletion_blocker(db, current_user)
+    if blocker:
+        raise HTTPException(status_code=400, detail=blocker)
+
+    # ✅ Soft-delete now; everything the account owns is purged in the background
+    job = start_deletion(db, current_user, reason="Deleted by account owner")
+    background_tasks.add_task(run_deletion_job_task, job.id)
+    return {"message": "Account deleted successfully", "job_id": job.id}
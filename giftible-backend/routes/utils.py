@@ -2,29 +2,23 @@ import os
 import jwt
 import secrets
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 from models import (
     PasswordResetToken,
     UniversalUser,
-    RefreshToken
 )
 
 from fastapi import HTTPException
-import smtplib
-from email.mime.text import MIMEText
-from twilio.rest import Client
-from email.mime.multipart import MIMEMultipart
+from services.email_service import send_email
+from services.sms_service import send_sms
+from services.refresh_tokens import issue_refresh_token, revoke_refresh_token as revoke_session
 
 # 🔐 Load environment variables
-load_dotenv()
 
 # 🔑 JWT & Token Settings
 SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_key")
-REFRESH_SECRET_KEY = os.getenv("REFRESH_SECRET_KEY", "default_refresh_secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
-REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
 
 
 # 🚀 Generate Access Token
@@ -43,42 +37,19 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
 
 
 
-# 🚀 Generate Refresh Token
-# 🚀 Generate Refresh Token
-def create_refresh_token(data: dict) -> tuple[str, datetime]:
-    """Generates a JWT refresh token with expiration."""
-    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode = {**data, "exp": expire}
-    refresh_token = jwt.encode(to_encode, REFRESH_SECRET_KEY, algorithm=ALGORITHM)
-    
-    return refresh_token, expire  # ✅ Now returning both token and expiry time
-
-
-
-# 💾 Save Refresh Token
-# 💾 Save Refresh Token
-def save_refresh_token(db: Session, user_id: int, token: str, expires_at: datetime):
-    """Stores the refresh token in the database."""
-    refresh_token = RefreshToken(
-        universal_user_id=user_id,  # ✅ Ensure correct column name
-        token=token,
-        expires_at=expires_at
-    )
-    db.add(refresh_token)
+# 🚀 Generate & Save Refresh Token (digest stored, see services/refresh_tokens.py)
+def save_refresh_token(db: Session, user_id: int, role: str) -> str:
+    """Starts a new refresh-token family for a login and returns the token. Commits."""
+    token = issue_refresh_token(db, user_id, role)
     db.commit()
+    return token
 
 
 
 # ❌ Revoke Refresh Token
 def revoke_refresh_token(db: Session, token: str) -> bool:
-    """Deletes the refresh token from the database."""
-    
-    # ✅ Remove expired refresh tokens automatically
-    db.query(RefreshToken).filter(RefreshToken.expires_at < datetime.utcnow()).delete()
-
-    deleted = db.query(RefreshToken).filter_by(token=token).delete()
-    db.commit()
-    return bool(deleted)
+    """Revokes the session the token belongs to. Indexed digest lookup; expired rows are left to the janitor."""
+    return revoke_session(db, token)
 
 
 
@@ -112,11 +83,6 @@ def verify_reset_token(db: Session, token: str) -> PasswordResetToken | None:
 
 def send_verification_email(to_email: str, user_id: int):
     """Sends an email verification link to the user."""
-    SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-    SENDER_EMAIL = os.getenv("SMTP_EMAIL")
-    SENDER_PASSWORD = os.getenv("SMTP_PASSWORD")
-
     verification_link = f"http://giftible.in/verify-email/{user_id}"
 
     subject = "Verify Your Email - Giftible"
@@ -132,16 +98,8 @@ def send_verification_email(to_email: str, user_id: int):
     Giftible Team
     """
 
-    msg = MIMEText(body)
-    msg["Subject"] = subject
-    msg["From"] = SENDER_EMAIL
-    msg["To"] = to_email
-
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.sendmail(SENDER_EMAIL, to_email, msg.as_string())
+        send_email(to_email, subject, body)
         print(f"✅ Email verification link sent to {to_email}")
     except Exception as e:
         print(f"❌ Error sending email verification: {e}")
@@ -149,29 +107,19 @@ def send_verification_email(to_email: str, user_id: int):
 
 
 
-# Load Twilio credentials from environment variables
-TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 BASE_URL = os.getenv("BASE_URL")  # Your frontend/backend domain
 
 def send_contact_verification_link(contact_number: str, user_id: int):
-    """Send a contact verification link via Twilio SMS."""
+    """Send a contact verification link via SMS (Twilio by default)."""
     try:
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-
         # Generate the verification link
         verification_link = f"http://giftible.in/verify-contact/{user_id}"
 
         message_body = f"Verify your phone number for Giftible: {verification_link}"
 
-        message = client.messages.create(
-            body=message_body,
-            from_=TWILIO_PHONE_NUMBER,
-            to=f"+91{contact_number}"  # Ensure correct country code
-        )
+        message_id = send_sms(contact_number, message_body, provider="twilio")
 
-        print(f"✅ Contact verification link sent to {contact_number}: {message.sid}")
+        print(f"✅ Contact verification link sent to {contact_number}: {message_id}")
         return {"message": "Verification link sent successfully!"}
 
     except Exception as e:
@@ -183,29 +131,11 @@ def send_contact_verification_link(contact_number: str, user_id: int):
 
 def send_forgot_password_mail(to_email: str, subject: str, body: str):
     """Sends a password reset email."""
-    
-    SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-    SENDER_EMAIL = os.getenv("SMTP_EMAIL")
-    SENDER_PASSWORD = os.getenv("SMTP_PASSWORD")
-
-    sender_email = SENDER_EMAIL
-    receiver_email = to_email
-
-    msg = MIMEMultipart()
-    msg["From"] = sender_email
-    msg["To"] = receiver_email
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain"))
 
     try:
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(SENDER_EMAIL, SENDER_PASSWORD)
-        server.sendmail(sender_email, receiver_email, msg.as_string())
-        server.quit()
+        send_email(to_email, subject, body)
 
-        print(f"✅ Password reset email sent to {receiver_email}")
+        print(f"✅ Password reset email sent to {to_email}")
 
     except Exception as e:
         print(f"❌ Failed to send email: {e}")
@@ -0,0 +1,191 @@
+"""
+Coupon rules and usage enforcement.
+
+Rules are evaluated against an in-memory table compiled from the live-coupon
+reference cache (services/reference_cache.py), so validating a code costs no
+query. Usage limits are enforced by a `CouponUsage` row keyed by
+(user, coupon, period): the unique constraint turns a concurrent double-use
+into an IntegrityError → 400.
+
+The row is claimed before the customer pays (`claim_coupon`, when the Razorpay
+order is created), linked to that Razorpay order. Placing the paid order only
+attaches the order id to the claim (`settle_coupon`). It never fails because of
+the coupon: a claim that was lost (coupon used up by another checkout, switched
+off, checkout paid twice) is returned as a conflict for the order to record.
+A user's own unplaced claim is handed over to their newest checkout, so an
+abandoned payment never locks them out of the coupon.
+
+Periods: `one_time` coupons use the single period "once"; `one_per_day`
+coupons use the UTC calendar day, so "once per day" means once per date.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import and_, not_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Coupon, CouponUsage, UsageLimit
+from services.reference_cache import live_coupons
+
+ONE_TIME_PERIOD = "once"
+
+
+@dataclass(frozen=True)
+class CompiledCoupon:
+    id: int
+    code: str
+    discount_percentage: float
+    max_discount: float
+    usage_limit: str
+    minimum_order_amount: float
+
+    def discount_for(self, order_amount: float) -> float:
+        # ✅ Percentage off, capped at max_discount
+        return min((self.discount_percentage / 100) * order_amount, self.max_discount)
+
+    def period_key(self, now: datetime = None) -> str:
+        return period_key(self.usage_limit, now)
+
+
+def period_key(usage_limit: str, now: datetime = None) -> str:
+    if usage_limit == UsageLimit.one_per_day.value:
+        return (now or datetime.utcnow()).date().isoformat()
+    return ONE_TIME_PERIOD
+
+
+def _pending_claim():
+    """Claimed for a Razorpay order that has not become an Order yet (legacy rows have neither id → used)."""
+    return and_(CouponUsage.order_id.is_(None), CouponUsage.razorpay_order_id.isnot(None))
+
+
+_compiled_source = None
+_compiled_table: dict[str, CompiledCoupon] = {}
+
+
+def compiled_coupons(db: Session) -> dict[str, CompiledCoupon]:
+    """{code: CompiledCoupon} for live coupons; rebuilt only when the reference cache reloads."""
+    global _compiled_source, _compiled_table
+    source = live_coupons.get(db)
+    if source is not _compiled_source:
+        _compiled_table = {
+            c["code"]: CompiledCoupon(
+                id=c["id"],
+                code=c["code"],
+                discount_percentage=c["discount_percentage"],
+                max_discount=c["max_discount"],
+                usage_limit=c["usage_limit"],
+                minimum_order_amount=c["minimum_order_amount"],
+            )
+            for c in source
+        }
+        _compiled_source = source
+    return _compiled_table
+
+
+def has_used(db: Session, coupon: CompiledCoupon, user_id: int, now: datetime = None) -> bool:
+    """Unique-index lookup on (user_id, coupon_id, period_key); the user's own pending claim does not count."""
+    return db.query(CouponUsage.id).filter(
+        CouponUsage.user_id == user_id,
+        CouponUsage.coupon_id == coupon.id,
+        CouponUsage.period_key == coupon.period_key(now),
+        not_(_pending_claim()),
+    ).first() is not None
+
+
+def evaluate_coupon(db: Session, code: str, user_id: int, order_amount: float) -> tuple[CompiledCoupon, float]:
+    """Returns (coupon, discount) or raises 404 (unknown/inactive) / 400 (rule not met or already used)."""
+    coupon = compiled_coupons(db).get(code)
+    if not coupon:
+        raise HTTPException(status_code=404, detail="Invalid or inactive coupon code")
+
+    if order_amount < coupon.minimum_order_amount:
+        raise HTTPException(status_code=400, detail=f"Minimum order amount is ₹{coupon.minimum_order_amount}")
+
+    if has_used(db, coupon, user_id):
+        raise HTTPException(status_code=400, detail=usage_limit_message(coupon))
+
+    return coupon, coupon.discount_for(order_amount)
+
+
+def claim_coupon(db: Session, code: str, user_id: int, order_amount: float,
+                 razorpay_order_id: str) -> tuple[CompiledCoupon, float]:
+    """
+    Validates the coupon and claims this period's usage for `razorpay_order_id`, before payment.
+    Raises 404 / 400 like `evaluate_coupon`, and 400 if a concurrent checkout claimed it first.
+    Does not commit.
+    """
+    coupon, discount = evaluate_coupon(db, code, user_id, order_amount)
+    now = datetime.utcnow()
+    key = coupon.period_key(now)
+
+    # ✅ The user's earlier unpaid checkout hands its claim over to this one
+    taken_over = db.execute(
+        update(CouponUsage)
+        .where(
+            CouponUsage.user_id == user_id,
+            CouponUsage.coupon_id == coupon.id,
+            CouponUsage.period_key == key,
+            _pending_claim(),
+        )
+        .values(razorpay_order_id=razorpay_order_id, used_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if taken_over:
+        return coupon, discount
+
+    try:
+        with db.begin_nested():
+            db.add(CouponUsage(
+                user_id=user_id,
+                coupon_id=coupon.id,
+                razorpay_order_id=razorpay_order_id,
+                period_key=key,
+                used_at=now,
+            ))
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail=usage_limit_message(coupon))
+    return coupon, discount
+
+
+def settle_coupon(db: Session, code: str, user_id: int, razorpay_order_id: str, order_id: int) -> str | None:
+    """
+    Attaches a paid order to its coupon claim, or records the usage now if there was no claim.
+    Never raises for coupon rules: returns why the coupon could not be redeemed, or None.
+    Does not commit.
+    """
+    settled = db.execute(
+        update(CouponUsage)
+        .where(CouponUsage.razorpay_order_id == razorpay_order_id, CouponUsage.order_id.is_(None))
+        .values(order_id=order_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if settled:
+        return None
+
+    # No claim (checkout created before claims existed, or handed over to a newer checkout)
+    coupon = db.query(Coupon.id, Coupon.usage_limit).filter(Coupon.code == code).first()
+    if coupon is None:
+        return f"Coupon {code} does not exist"
+    now = datetime.utcnow()
+    usage_limit = getattr(coupon.usage_limit, "value", coupon.usage_limit)
+    try:
+        with db.begin_nested():
+            db.add(CouponUsage(
+                user_id=user_id,
+                coupon_id=coupon.id,
+                order_id=order_id,
+                razorpay_order_id=razorpay_order_id,
+                period_key=period_key(usage_limit, now),
+                used_at=now,
+            ))
+    except IntegrityError:
+        return f"Coupon {code} was already used in this period"
+    return None
+
+
+def usage_limit_message(coupon: CompiledCoupon) -> str:
+    if coupon.usage_limit == UsageLimit.one_per_day.value:
+        return "Coupon can be used only once per day."
+    return "Coupon can be used only once per user."
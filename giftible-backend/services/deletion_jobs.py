@@ -0,0 +1,455 @@
+"""
+Background deletion of NGO and user accounts.
+
+Deleting a large NGO used to remove every product, image, wishlist entry and
+review in the request transaction, holding locks on those tables until it
+finished (or the request timed out). Now the request only soft-deletes:
+
+- `UniversalUser.deleted_at` is set, refresh tokens are dropped and an NGO is
+  un-approved, so the account can no longer log in and disappears from listings;
+- a `DeletionJob` row is queued and run right after the response.
+
+The job purges dependent rows step by step in chunks of `DELETION_CHUNK_SIZE`,
+committing (and pausing `DELETION_CHUNK_PAUSE_SECONDS`) after every chunk, so
+each transaction holds its locks only briefly. Every step re-queries what is
+left, so a job interrupted by a crash simply continues where it stopped when it
+is picked up again. Progress (rows purged per step) is stored on the job for the
+admin UI (`GET /admin/deletion-jobs/{id}`).
+
+Both the admin and the self-service delete endpoints refuse up front, through
+`deletion_blocker`, when the purge would destroy orders still in progress or
+orders of the NGO's products. A job that fails anyway (e.g. something was
+ordered in between) stops where it was. An admin can then restore the
+account with `restore_deleted_account`: login and NGO approval come back. Rows
+already purged stay purged, and unlisted products stay unlisted until the NGO
+publishes them again.
+
+Run `python -m services.deletion_jobs` to resume queued or stalled jobs, or add
+`--loop` to keep doing so every `DELETION_POLL_SECONDS`.
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from models import (
+    NGO, UniversalUser, Product, Wishlist, Review, Cart, CartItem, StockReservation, HotStockSale,
+    CheckoutIntent, OrderIntake, CouponUsage, Order, OrderItem, Payout, Address, Category,
+    RefreshToken, PasswordResetToken, DeletionJob,
+)
+from services.file_store import release_product_images
+from services.refresh_tokens import revoke_user_refresh_tokens
+from services.stock_reservations import _delete_holds
+from services.uploads import remove_stored_file
+from services.versioning import bump_version, NGOS, PRODUCTS
+
+DELETION_CHUNK_SIZE = int(os.getenv("DELETION_CHUNK_SIZE", 200))
+DELETION_CHUNK_PAUSE_SECONDS = float(os.getenv("DELETION_CHUNK_PAUSE_SECONDS", 0.05))
+DELETION_STALE_SECONDS = int(os.getenv("DELETION_STALE_SECONDS", 300))  # A running job untouched this long is resumed
+DELETION_POLL_SECONDS = int(os.getenv("DELETION_POLL_SECONDS", 30))
+
+
+class DeletionBlocked(Exception):
+    """Something created since the request prevents the purge (e.g. a product was ordered)."""
+
+
+# ---------------------------- #
+# 🗑️ SOFT DELETE
+# ---------------------------- #
+
+def deletion_blocker(db: Session, account: UniversalUser, requested_by: int = None) -> str | None:
+    """Why `account` cannot be deleted right now, or None. Checked before `start_deletion`."""
+    active_orders = (
+        db.query(OrderItem.id)
+        .join(Order, Order.id == OrderItem.order_id)
+        .filter(Order.universal_user_id == account.id, OrderItem.status.notin_(["Delivered", "Cancelled"]))
+        .first()
+    )
+    if active_orders:
+        return "Unable to delete account as there are active orders. Please complete or cancel all orders first."
+
+    if account.role == "ngo":
+        # ✅ One indexed EXISTS, no product list
+        ordered = (
+            db.query(OrderItem.id)
+            .join(Product, Product.id == OrderItem.product_id)
+            .filter(Product.universal_user_id == account.id)
+            .first()
+        )
+        if ordered:
+            return "Unable to delete NGO as its products are currently part of active orders. Please complete or cancel all orders first."
+
+    # Categories are handed to the deleting admin; nobody can take them over from a self-service deletion
+    if (not requested_by or requested_by == account.id) and db.query(Category.id).filter(
+        Category.universal_user_id == account.id
+    ).first():
+        return "This account created categories; ask an admin to delete it."
+    return None
+
+
+def start_deletion(db: Session, account: UniversalUser, requested_by: int = None, reason: str = None) -> DeletionJob:
+    """
+    Soft-deletes `account` and queues the job that purges it. Commits.
+    A repeated request for an account already being deleted returns the existing job.
+    """
+    existing = (
+        db.query(DeletionJob)
+        .filter(DeletionJob.target_user_id == account.id, DeletionJob.status.in_(["queued", "running"]))
+        .first()
+    )
+    if existing:
+        return existing
+
+    ngo = db.query(NGO).filter(NGO.universal_user_id == account.id).first() if account.role == "ngo" else None
+    ngo_was_approved = bool(ngo.is_approved) if ngo else None
+
+    account.deleted_at = datetime.utcnow()
+    revoke_user_refresh_tokens(db, account.id)  # ✅ Also blocks refreshes on every node via the revocation set
+    if ngo:
+        ngo.is_approved = False  # ✅ Hidden from public NGO pages right away
+        bump_version(db, NGOS)
+
+    job = DeletionJob(
+        kind="ngo" if ngo else "user",
+        target_user_id=account.id,
+        ngo_id=ngo.id if ngo else None,
+        ngo_was_approved=ngo_was_approved,
+        requested_by=requested_by,
+        reason=reason[:255] if reason else None,
+        progress=json.dumps({}),
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def restore_deleted_account(db: Session, job_id: int) -> DeletionJob | None:
+    """
+    Undoes the soft delete of a failed job: the account can log in again and an NGO
+    gets its approval back. Rows purged before the failure stay purged. Commits;
+    None if there is no failed job with this id or its account is already gone.
+    """
+    job = (
+        db.query(DeletionJob)
+        .filter(DeletionJob.id == job_id, DeletionJob.status == "failed")
+        .with_for_update()
+        .first()
+    )
+    if job is None:
+        return None
+    account = db.query(UniversalUser).filter(UniversalUser.id == job.target_user_id).first()
+    if account is None:
+        db.rollback()
+        return None
+
+    account.deleted_at = None
+    if job.ngo_id:
+        ngo = db.query(NGO).filter(NGO.id == job.ngo_id).first()
+        if ngo and job.ngo_was_approved:
+            ngo.is_approved = True
+            bump_version(db, NGOS)
+    job.status = "restored"
+    job.current_step = None
+    job.finished_at = datetime.utcnow()
+    db.commit()
+    print(f"↩️ Deletion job {job.id}: {job.kind} {job.target_user_id} restored")
+    return job
+
+
+def deletion_job_status(job: DeletionJob) -> dict:
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "current_step": job.current_step,
+        "progress": json.loads(job.progress or "{}"),
+        "rows_done": job.rows_done,
+        "rows_total": job.rows_total,
+        "percent": 100 if job.status == "completed" else (
+            min(99, int(job.rows_done * 100 / job.rows_total)) if job.rows_total else 0
+        ),
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# ---------------------------- #
+# 🧹 PURGE STEPS
+# ---------------------------- #
+# Each step has a counter (for the progress total) and a purger that handles at
+# most `limit` rows, returns how many it handled and never commits. Upload paths
+# to delete once the chunk commits are appended to `files`.
+
+def _ids(db: Session, column, *conditions, limit: int) -> list[int]:
+    return [row[0] for row in db.query(column).filter(*conditions).order_by(column).limit(limit)]
+
+
+def _delete_ids(db: Session, model, ids: list[int]) -> int:
+    if not ids:
+        return 0
+    return db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+
+
+def _user_rows(model, column):
+    """A step that deletes `model` rows whose `column` is the account being purged."""
+    def count(db, job):
+        return db.query(model).filter(column == job.target_user_id).count()
+
+    def purge(db, job, limit, files):
+        return _delete_ids(db, model, _ids(db, model.id, column == job.target_user_id, limit=limit))
+    return count, purge
+
+
+def _cart_items_count(db, job):
+    return db.query(CartItem).join(Cart, Cart.id == CartItem.cart_id).filter(Cart.universal_user_id == job.target_user_id).count()
+
+
+def _cart_items_purge(db, job, limit, files):
+    cart_ids = db.query(Cart.id).filter(Cart.universal_user_id == job.target_user_id)
+    return _delete_ids(db, CartItem, _ids(db, CartItem.id, CartItem.cart_id.in_(cart_ids), limit=limit))
+
+
+def _holds_purge(db, job, limit, files):
+    holds = (
+        db.query(StockReservation)
+        .filter(StockReservation.universal_user_id == job.target_user_id)
+        .order_by(StockReservation.id)
+        .limit(limit)
+        .with_for_update()
+        .all()
+    )
+    _delete_holds(db, holds)  # ✅ Hot products get their units back on commit
+    return len(holds)
+
+
+def _unlist_count(db, job):
+    return db.query(Product).filter(Product.universal_user_id == job.target_user_id, Product.is_live == True).count()
+
+
+def _unlist_purge(db, job, limit, files):
+    """Takes the NGO's products off the storefront first, in chunks of plain updates."""
+    ids = _ids(db, Product.id, Product.universal_user_id == job.target_user_id, Product.is_live == True, limit=limit)
+    if ids:
+        db.query(Product).filter(Product.id.in_(ids)).update({"is_live": False}, synchronize_session=False)
+        bump_version(db, PRODUCTS)
+    return len(ids)
+
+
+def _products_count(db, job):
+    return db.query(Product).filter(Product.universal_user_id == job.target_user_id).count()
+
+
+def _products_purge(db, job, limit, files):
+    product_ids = _ids(db, Product.id, Product.universal_user_id == job.target_user_id, limit=limit)
+    if not product_ids:
+        return 0
+    if db.query(OrderItem.id).filter(OrderItem.product_id.in_(product_ids)).first():
+        raise DeletionBlocked("Products of this NGO are part of orders; they cannot be purged.")
+
+    for product_id in product_ids:
+        files.extend(release_product_images(db, product_id))
+    holds = db.query(StockReservation).filter(StockReservation.product_id.in_(product_ids)).with_for_update().all()
+    _delete_holds(db, holds)
+    for model in (Wishlist, Review, CartItem, HotStockSale):
+        db.query(model).filter(model.product_id.in_(product_ids)).delete(synchronize_session=False)
+    db.query(Product).filter(Product.id.in_(product_ids)).delete(synchronize_session=False)
+    bump_version(db, PRODUCTS)
+    return len(product_ids)
+
+
+def _orders_purge(db, job, limit, files):
+    order_ids = _ids(db, Order.id, Order.universal_user_id == job.target_user_id, limit=limit)
+    if not order_ids:
+        return 0
+    item_ids = db.query(OrderItem.id).filter(OrderItem.order_id.in_(order_ids))
+    db.query(Review).filter(Review.order_item_id.in_(item_ids)).delete(synchronize_session=False)
+    db.query(OrderItem).filter(OrderItem.order_id.in_(order_ids)).delete(synchronize_session=False)
+    db.query(CouponUsage).filter(CouponUsage.order_id.in_(order_ids)).delete(synchronize_session=False)
+    db.query(HotStockSale).filter(HotStockSale.order_id.in_(order_ids)).update({"order_id": None}, synchronize_session=False)
+    db.query(Order).filter(Order.id.in_(order_ids)).delete(synchronize_session=False)
+    return len(order_ids)
+
+
+def _account_count(db, job):
+    return 1
+
+
+def _account_purge(db, job, limit, files):
+    """Last step: the small per-account rows, the NGO profile and the user row itself."""
+    account = db.query(UniversalUser).filter(UniversalUser.id == job.target_user_id).first()
+    if account is None:
+        return 0
+
+    # Categories are shared with other NGOs' products: hand them to the admin instead of cascading
+    if job.requested_by and job.requested_by != account.id:
+        db.query(Category).filter(Category.universal_user_id == account.id).update(
+            {"universal_user_id": job.requested_by}, synchronize_session=False
+        )
+    elif db.query(Category.id).filter(Category.universal_user_id == account.id).first():
+        raise DeletionBlocked("This account created categories; ask an admin to delete it.")
+
+    for model, column in (
+        (Address, Address.universal_user_id),
+        (Payout, Payout.universal_user_id),
+        (RefreshToken, RefreshToken.universal_user_id),
+        (PasswordResetToken, PasswordResetToken.user_id),
+    ):
+        db.query(model).filter(column == account.id).delete(synchronize_session=False)
+
+    ngo = db.query(NGO).filter(NGO.universal_user_id == account.id).first()
+    if ngo:
+        files.extend(path for path in (ngo.logo, ngo.license) if path)
+        db.query(NGO).filter(NGO.id == ngo.id).delete(synchronize_session=False)
+        bump_version(db, NGOS)
+    db.query(UniversalUser).filter(UniversalUser.id == account.id).delete(synchronize_session=False)
+    return 1
+
+
+_wishlist = _user_rows(Wishlist, Wishlist.user_id)
+_carts = _user_rows(Cart, Cart.universal_user_id)
+_checkout_intents = _user_rows(CheckoutIntent, CheckoutIntent.universal_user_id)
+_order_intakes = _user_rows(OrderIntake, OrderIntake.universal_user_id)
+_reviews = _user_rows(Review, Review.universal_user_id)
+_coupon_usages = _user_rows(CouponUsage, CouponUsage.user_id)
+_holds_count = _user_rows(StockReservation, StockReservation.universal_user_id)[0]
+_orders_count = _user_rows(Order, Order.universal_user_id)[0]
+
+# (step, count, purge) in purge order: children before the rows they point at
+USER_STEPS = [
+    ("wishlist", *_wishlist),
+    ("cart_items", _cart_items_count, _cart_items_purge),
+    ("carts", *_carts),
+    ("stock_holds", _holds_count, _holds_purge),
+    ("checkout_intents", *_checkout_intents),
+    ("order_intakes", *_order_intakes),
+    ("reviews", *_reviews),
+    ("coupon_usages", *_coupon_usages),
+    ("orders", _orders_count, _orders_purge),
+]
+NGO_STEPS = [
+    ("unlist_products", _unlist_count, _unlist_purge),
+    ("products", _products_count, _products_purge),
+]
+ACCOUNT_STEP = ("account", _account_count, _account_purge)
+
+
+def job_steps(job: DeletionJob) -> list:
+    return (NGO_STEPS if job.kind == "ngo" else []) + USER_STEPS + [ACCOUNT_STEP]
+
+
+# ---------------------------- #
+# 🏃 RUNNER
+# ---------------------------- #
+
+def _claim(db: Session, job_id: int):
+    """Locks the job if it is queued, or running but stalled (its worker died)."""
+    stale_before = datetime.utcnow() - timedelta(seconds=DELETION_STALE_SECONDS)
+    job = (
+        db.query(DeletionJob)
+        .filter(
+            DeletionJob.id == job_id,
+            (DeletionJob.status == "queued")
+            | ((DeletionJob.status == "running") & (DeletionJob.updated_at < stale_before)),
+        )
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        return None
+    job.status = "running"
+    job.updated_at = datetime.utcnow()
+    if not job.rows_total:
+        job.rows_total = sum(count(db, job) for _, count, _ in job_steps(job))
+    db.commit()
+    return job
+
+
+def run_deletion_job(db: Session, job_id: int, chunk_size: int = DELETION_CHUNK_SIZE) -> DeletionJob | None:
+    """Purges everything the job covers, one committed chunk at a time; returns the finished job."""
+    job = _claim(db, job_id)
+    if job is None:
+        return None  # Finished, or another worker has it
+
+    progress = json.loads(job.progress or "{}")
+    try:
+        for step, _, purge in job_steps(job):
+            job.current_step = step
+            while True:
+                files = []
+                removed = purge(db, job, chunk_size, files)
+                if not removed:
+                    break
+                progress[step] = progress.get(step, 0) + removed
+                job.progress = json.dumps(progress)
+                job.rows_done += removed
+                job.updated_at = datetime.utcnow()  # ✅ Heartbeat: keeps other workers from resuming it
+                db.commit()
+                for path in files:
+                    remove_stored_file(path)
+                if removed < chunk_size:
+                    break
+                time.sleep(DELETION_CHUNK_PAUSE_SECONDS)  # Let other transactions get at the tables
+    except Exception as e:
+        failed_step = job.current_step
+        db.rollback()
+        job.status = "failed"
+        job.current_step = failed_step  # ✅ Kept for the admin UI; the rollback expired it
+        job.error = str(e)[:255]
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        print(f"❌ Deletion job {job.id} failed at {job.current_step}: {e}")
+        return job
+
+    job.status = "completed"
+    job.current_step = None
+    job.finished_at = datetime.utcnow()
+    db.commit()
+    print(f"🗑️ Deletion job {job.id} ({job.kind} {job.target_user_id}) purged {job.rows_done} row(s)")
+
+    from services.file_store import collect_orphans_task
+
+    collect_orphans_task()  # 🧹 Image files released above are removed after their grace period
+    return job
+
+
+def run_deletion_job_task(job_id: int):
+    """Background-task entry point with its own session."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        run_deletion_job(db, job_id)
+    finally:
+        db.close()
+
+
+def resume_deletion_jobs_task() -> int:
+    """Scheduler entry point: runs queued jobs and takes over stalled ones; returns how many ran."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        stale_before = datetime.utcnow() - timedelta(seconds=DELETION_STALE_SECONDS)
+        job_ids = [
+            row.id for row in db.query(DeletionJob.id).filter(
+                (DeletionJob.status == "queued")
+                | ((DeletionJob.status == "running") & (DeletionJob.updated_at < stale_before))
+            ).order_by(DeletionJob.id)
+        ]
+        db.rollback()
+        return sum(1 for job_id in job_ids if run_deletion_job(db, job_id))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    if "--loop" in sys.argv:
+        while True:
+            resume_deletion_jobs_task()
+            time.sleep(DELETION_POLL_SECONDS)
+    else:
+        resume_deletion_jobs_task()
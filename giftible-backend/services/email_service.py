@@ -1,14 +1,34 @@
 import smtplib
 import os
-import requests
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from settings import EMAIL_BACKEND
+from services.fakes import send_fake_email
 
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SMTP_EMAIL = os.getenv("SMTP_EMAIL")  # Your Gmail address
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")  # Your app password
 
+
+def send_email(to_email: str, subject: str, body: str, subtype: str = "plain"):
+    """Sends an email through the configured backend. Raises on delivery failure."""
+    if EMAIL_BACKEND == "fake":
+        send_fake_email(to_email, subject, body)
+        return
+
+    msg = MIMEMultipart()
+    msg["From"] = SMTP_EMAIL
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body, subtype))
+
+    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+        server.starttls()
+        server.login(SMTP_EMAIL, SMTP_PASSWORD)
+        server.sendmail(SMTP_EMAIL, to_email, msg.as_string())
+
+
 def send_reset_email(to_email: str, reset_link: str):
     """Sends a password reset email after validating the email address"""
     if not is_valid_email(to_email):
@@ -18,18 +38,8 @@ def send_reset_email(to_email: str, reset_link: str):
         subject = "Password Reset Link"
         body = f"Click the link below to reset your password:\n{reset_link}"
 
-        msg = MIMEMultipart()
-        msg["From"] = SMTP_EMAIL
-        msg["To"] = to_email
-        msg["Subject"] = subject
-
-        msg.attach(MIMEText(body, "plain"))
+        send_email(to_email, subject, body)
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_EMAIL, SMTP_PASSWORD)
-            server.send_message(msg)
-        
         return {"message": "Email sent successfully!"}
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,143 @@
+"""
+Facet counts for the storefront filter sidebar (`/products/browse?include_facets=true`).
+
+All three facets come from ONE grouped query over the products that match the
+non-facet filters (status, dates, search):
+
+    GROUP BY category, owner (NGO universal_user_id), price bucket, in price range
+
+It returns at most categories × NGOs × buckets × 2 rows. The facets are then
+folded from those rows in Python. Each facet ignores its own filter
+(disjunctive faceting), so the sidebar keeps showing the other options while one
+is selected:
+
+- categories: rows matching the NGO filter and the price range;
+- NGOs: rows matching the category filter and the price range;
+- price buckets (edges from `FACET_PRICE_BUCKETS`): rows matching the category
+  and NGO filters.
+
+The grouped rows are cached per worker (LRU, `FACET_CACHE_MAX_ENTRIES`). The key
+is the normalized non-facet filters and price range plus the products / NGOs
+version stamps, so any catalogue change makes old entries unreachable. Picking
+categories or NGOs in the sidebar only re-folds cached rows.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import and_, case, func, true
+from sqlalchemy.orm import Session
+
+from models import NGO, Product, UniversalUser
+from services.reference_cache import approved_categories, approved_ngos
+from services.versioning import get_versions, NGOS, PRODUCTS
+
+FACET_PRICE_BUCKETS = [float(edge) for edge in os.getenv("FACET_PRICE_BUCKETS", "0,250,500,1000,2500,5000").split(",")]
+FACET_CACHE_MAX_ENTRIES = int(os.getenv("FACET_CACHE_MAX_ENTRIES", 1000))
+
+_cache = OrderedDict()  # key → grouped rows
+_cache_lock = threading.Lock()
+
+
+def _bucket_expression():
+    """Index of the price bucket: 0 below the second edge … last for the open-ended top bucket."""
+    upper_edges = FACET_PRICE_BUCKETS[1:]
+    return case(
+        *[(Product.price < edge, index) for index, edge in enumerate(upper_edges)],
+        else_=len(upper_edges),
+    )
+
+
+def _in_range_expression(min_price, max_price):
+    bounds = []
+    if min_price is not None:
+        bounds.append(Product.price >= min_price)
+    if max_price is not None:
+        bounds.append(Product.price <= max_price)
+    return case((and_(*bounds) if bounds else true(), 1), else_=0)
+
+
+def _grouped_rows(db: Session, base_filters: list, min_price, max_price) -> list[tuple]:
+    """[(category_id, owner_id, bucket, in_range, count)] for the products matching `base_filters`."""
+    return [
+        tuple(row)
+        for row in (
+            db.query(
+                Product.category_id,
+                Product.universal_user_id,
+                _bucket_expression().label("bucket"),
+                _in_range_expression(min_price, max_price).label("in_range"),
+                func.count(Product.id),
+            )
+            .select_from(Product)
+            .join(UniversalUser, UniversalUser.id == Product.universal_user_id)  # Same joins as browse (search filters)
+            .outerjoin(NGO, NGO.universal_user_id == UniversalUser.id)
+            .filter(*base_filters)
+            .group_by(Product.category_id, Product.universal_user_id, "bucket", "in_range")  # ✅ By label: MySQL-safe
+            .all()
+        )
+    ]
+
+
+def _cached_rows(db: Session, base_filters: list, filter_key: tuple, min_price, max_price) -> list[tuple]:
+    versions = get_versions(db, PRODUCTS, NGOS)
+    key = (filter_key, min_price, max_price, versions[PRODUCTS][0], versions[NGOS][0])
+    with _cache_lock:
+        rows = _cache.get(key)
+        if rows is not None:
+            _cache.move_to_end(key)
+            return rows
+
+    rows = _grouped_rows(db, base_filters, min_price, max_price)
+    with _cache_lock:
+        _cache[key] = rows
+        while len(_cache) > FACET_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return rows
+
+
+def browse_facets(db: Session, base_filters: list, filter_key: tuple, category_ids, ngo_ids,
+                  min_price=None, max_price=None) -> dict:
+    """
+    {"categories": [...], "ngos": [...], "price": [...]} for a browse request.
+    `base_filters` are its status / date / search criteria and `filter_key` a hashable
+    description of them. Category, NGO and price filters are passed separately so each
+    facet can leave its own out.
+    """
+    rows = _cached_rows(db, base_filters, filter_key, min_price, max_price)
+    wanted_categories = set(category_ids or ())
+    wanted_ngos = set(ngo_ids or ())
+
+    by_category, by_ngo, by_bucket = {}, {}, {}
+    for category_id, owner_id, bucket, in_range, count in rows:
+        category_ok = not wanted_categories or category_id in wanted_categories
+        ngo_ok = not wanted_ngos or owner_id in wanted_ngos
+        if ngo_ok and in_range:
+            by_category[category_id] = by_category.get(category_id, 0) + count
+        if category_ok and in_range:
+            by_ngo[owner_id] = by_ngo.get(owner_id, 0) + count
+        if category_ok and ngo_ok:
+            by_bucket[bucket] = by_bucket.get(bucket, 0) + count
+
+    # ✅ Names from the per-worker reference cache: no extra query
+    category_names = {c["id"]: c["name"] for c in approved_categories.get(db)}
+    ngo_names = {n["universal_user_id"]: n["ngo_name"] for n in approved_ngos.get(db)}
+    edges = FACET_PRICE_BUCKETS
+    return {
+        "categories": [
+            {"id": category_id, "name": category_names.get(category_id), "count": count}
+            for category_id, count in sorted(by_category.items(), key=lambda item: (-item[1], item[0] or 0))
+        ],
+        "ngos": [
+            {"id": owner_id, "ngo_name": ngo_names.get(owner_id), "count": count}
+            for owner_id, count in sorted(by_ngo.items(), key=lambda item: (-item[1], item[0]))
+        ],
+        "price": [
+            {
+                "min": edges[index],
+                "max": edges[index + 1] if index + 1 < len(edges) else None,
+                "count": by_bucket.get(index, 0),
+            }
+            for index in range(len(edges))
+        ],
+    }
@@ -0,0 +1,167 @@
+"""
+In-process stand-ins for Razorpay, Twilio, SNS and SMTP.
+
+Selected through the *_BACKEND settings so the full register → browse → cart →
+pay → place-order flow can run offline (e.g. under a load generator) without
+touching a real provider.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from settings import FAKE_PROVIDER_LATENCY_MS
+
+# 🔑 Used to sign fake payments when no real Razorpay secret is configured
+FAKE_RAZORPAY_KEY_ID = "rzp_test_fake"
+FAKE_RAZORPAY_KEY_SECRET = "fake_razorpay_secret"
+FAKE_RAZORPAY_WEBHOOK_SECRET = "fake_webhook_secret"
+
+# 📬 Every fake email / SMS ends up here (newest last)
+OUTBOX = []
+OUTBOX_LIMIT = 10000  # Keep memory bounded during long load runs
+_outbox_lock = threading.Lock()
+
+
+def simulate_latency():
+    """Sleep for the configured artificial provider latency (0 = full speed)."""
+    if FAKE_PROVIDER_LATENCY_MS > 0:
+        time.sleep(FAKE_PROVIDER_LATENCY_MS / 1000)
+
+
+def _record(channel: str, to: str, body: str, subject: str = None) -> str:
+    message_id = f"{channel}_fake_{secrets.token_hex(8)}"
+    with _outbox_lock:
+        OUTBOX.append({
+            "id": message_id,
+            "channel": channel,
+            "to": to,
+            "subject": subject,
+            "body": body,
+            "sent_at": datetime.utcnow(),
+        })
+        if len(OUTBOX) > OUTBOX_LIMIT:
+            del OUTBOX[: len(OUTBOX) - OUTBOX_LIMIT]
+    return message_id
+
+
+def outbox_for(to: str) -> list:
+    """Return all captured messages sent to an email address or phone number."""
+    with _outbox_lock:
+        return [message for message in OUTBOX if message["to"] == to]
+
+
+def clear_outbox():
+    with _outbox_lock:
+        OUTBOX.clear()
+
+
+# ---------------------------- #
+# 💳 RAZORPAY
+# ---------------------------- #
+
+async def simulate_latency_async():
+    """Non-blocking `simulate_latency` for the async gateway fake."""
+    if FAKE_PROVIDER_LATENCY_MS > 0:
+        await asyncio.sleep(FAKE_PROVIDER_LATENCY_MS / 1000)
+
+
+class FakeRazorpayGateway:
+    """
+    Drop-in for `services.razorpay_client.RazorpayGateway` that never leaves the process.
+    Orders live in memory; like Razorpay, receipts are not deduplicated by the gateway.
+    """
+
+    def __init__(self, auth: tuple = None):
+        self.auth = auth or (FAKE_RAZORPAY_KEY_ID, FAKE_RAZORPAY_KEY_SECRET)
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    async def create_order(self, data: dict, timeout: float = None) -> dict:
+        await simulate_latency_async()
+        order = {
+            "id": f"order_fake_{secrets.token_hex(7)}",
+            "entity": "order",
+            "amount": data["amount"],
+            "amount_paid": 0,
+            "currency": data.get("currency", "INR"),
+            "receipt": data.get("receipt"),
+            "notes": data.get("notes", {}),
+            "status": "created",
+            "created_at": int(time.time()),
+        }
+        with self._lock:
+            self._orders[order["id"]] = order
+        return order
+
+    async def fetch_order(self, order_id: str, timeout: float = None) -> dict:
+        await simulate_latency_async()
+        with self._lock:
+            return self._orders[order_id]
+
+    async def find_orders_by_receipt(self, receipt: str, timeout: float = None) -> list:
+        await simulate_latency_async()
+        with self._lock:
+            return [order for order in self._orders.values() if order["receipt"] == receipt]
+
+    async def close(self):
+        pass
+
+
+def sign_payment(order_id: str, key_secret: str, payment_id: str = None) -> dict:
+    """Simulate the Razorpay checkout step: returns a payment id with a valid HMAC signature."""
+    simulate_latency()
+    payment_id = payment_id or f"pay_fake_{secrets.token_hex(7)}"
+    signature = hmac.new(
+        key=key_secret.encode("utf-8"),
+        msg=f"{order_id}|{payment_id}".encode("utf-8"),
+        digestmod=hashlib.sha256,
+    ).hexdigest()
+    return {
+        "razorpay_order_id": order_id,
+        "razorpay_payment_id": payment_id,
+        "razorpay_signature": signature,
+    }
+
+
+def payment_captured_webhook(order_id: str, payment_id: str, amount_paise: int, webhook_secret: str) -> tuple[str, bytes, str]:
+    """Simulate Razorpay's `payment.captured` webhook: returns (event id, raw body, X-Razorpay-Signature)."""
+    event_id = f"evt_fake_{secrets.token_hex(7)}"
+    body = json.dumps({
+        "entity": "event",
+        "event": "payment.captured",
+        "contains": ["payment"],
+        "payload": {"payment": {"entity": {
+            "id": payment_id,
+            "entity": "payment",
+            "order_id": order_id,
+            "amount": amount_paise,
+            "currency": "INR",
+            "status": "captured",
+        }}},
+        "created_at": int(time.time()),
+    }).encode("utf-8")
+    signature = hmac.new(webhook_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return event_id, body, signature
+
+
+# ---------------------------- #
+# 📱 SMS (Twilio / SNS)
+# ---------------------------- #
+
+def send_fake_sms(phone_number: str, message: str) -> str:
+    simulate_latency()
+    return _record("sms", phone_number, message)
+
+
+# ---------------------------- #
+# 📧 EMAIL (SMTP)
+# ---------------------------- #
+
+def send_fake_email(to_email: str, subject: str, body: str) -> str:
+    simulate_latency()
+    return _record("email", to_email, body, subject=subject)
@@ -0,0 +1,152 @@
+"""
+Reference-counted store for content-addressed product images.
+
+`save_upload` names files after their content hash, so identical photos land
+on the same path and are written once. Each distinct file has one `StoredFile`
+row whose `ref_count` is the number of `ProductImage` rows pointing at it.
+Deleting products only releases references; files whose count drops to zero
+are removed later by `collect_orphans`, after a grace period that protects
+uploads still in flight (a re-upload refreshes the file's mtime).
+
+Run `python -m services.file_store` to collect orphans by hand.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import StoredFile, ProductImage
+from services.uploads import content_hash_from_name, remove_stored_file
+
+ORPHAN_GRACE_SECONDS = int(os.getenv("ORPHAN_GRACE_SECONDS", 300))
+ORPHAN_BATCH_SIZE = int(os.getenv("ORPHAN_BATCH_SIZE", 200))
+
+
+def acquire_stored_file(db: Session, path: str) -> StoredFile:
+    """Adds one reference to the stored file at `path`, creating its row on first use. Does not commit."""
+    content_hash = content_hash_from_name(path)
+    if not content_hash:
+        raise ValueError(f"{path} is not a content-addressed file")
+
+    for _ in range(2):
+        stored = db.query(StoredFile).filter(StoredFile.content_hash == content_hash).first()
+        if not stored:
+            try:
+                with db.begin_nested():  # ✅ Savepoint: a concurrent insert of the same hash only rolls back this row
+                    stored = StoredFile(content_hash=content_hash, path=path, size=os.path.getsize(path), ref_count=0)
+                    db.add(stored)
+            except IntegrityError:
+                continue
+
+        # ✅ Atomic increment; 0 rows means the collector removed it in between → recreate
+        result = db.execute(
+            update(StoredFile)
+            .where(StoredFile.id == stored.id)
+            .values(ref_count=StoredFile.ref_count + 1, released_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            db.refresh(stored)
+            return stored
+
+    raise RuntimeError(f"Could not acquire stored file for {path}")
+
+
+def release_stored_file(db: Session, stored_file_id: int):
+    """Drops one reference. The file itself is left for `collect_orphans`. Does not commit."""
+    db.execute(
+        update(StoredFile)
+        .where(StoredFile.id == stored_file_id, StoredFile.ref_count > 0)
+        .values(ref_count=StoredFile.ref_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        update(StoredFile)
+        .where(StoredFile.id == stored_file_id, StoredFile.ref_count == 0)
+        .values(released_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def release_product_images(db: Session, product_id: int) -> list[str]:
+    """
+    Deletes a product's image rows and releases their stored files.
+    Returns legacy (untracked) image paths that are no longer referenced and can
+    be removed from disk once the transaction commits.
+    """
+    legacy_paths = []
+    images = db.query(ProductImage).filter(ProductImage.product_id == product_id).all()
+    for image in images:
+        if image.stored_file_id:
+            release_stored_file(db, image.stored_file_id)
+        else:
+            # Uploads from before reference counting: fall back to checking other rows for the same path
+            shared = db.query(ProductImage).filter(
+                ProductImage.image_url == image.image_url, ProductImage.product_id != product_id
+            ).first()
+            if not shared:
+                legacy_paths.append(image.image_url)
+        db.delete(image)
+    return legacy_paths
+
+
+def _recently_touched(path: str) -> bool:
+    """A fresh mtime means someone just re-uploaded these bytes and is about to acquire them."""
+    return os.path.exists(path) and time.time() - os.path.getmtime(path) < ORPHAN_GRACE_SECONDS
+
+
+def collect_orphans(db: Session, limit: int = ORPHAN_BATCH_SIZE) -> int:
+    """Removes files (and rows) that have had no references for longer than the grace period."""
+    cutoff = datetime.utcnow() - timedelta(seconds=ORPHAN_GRACE_SECONDS)
+    orphans = (
+        db.query(StoredFile)
+        .filter(
+            StoredFile.ref_count == 0,
+            or_(StoredFile.released_at < cutoff, and_(StoredFile.released_at.is_(None), StoredFile.created_at < cutoff)),
+        )
+        .order_by(StoredFile.id)
+        .limit(limit)
+        .with_for_update()  # ✅ Blocks a concurrent acquire until we decide
+        .all()
+    )
+
+    paths = []
+    for stored in orphans:
+        path = stored.path.lstrip("/")
+        if _recently_touched(path):
+            continue
+        db.delete(stored)
+        paths.append(path)
+
+    # ✅ Rows go first: a failed commit leaves files without rows (harmless), never rows without files
+    db.commit()
+    removed = 0
+    for path in paths:
+        if _recently_touched(path):
+            continue  # Re-uploaded since the check above; its new row needs the file
+        try:
+            remove_stored_file(path)
+            removed += 1
+        except OSError as e:
+            print(f"⚠️ Could not remove orphaned file {path}: {e}")
+    if removed:
+        print(f"🧹 Removed {removed} orphaned file(s)")
+    return removed
+
+
+def collect_orphans_task():
+    """Background-task entry point with its own session."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        collect_orphans(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    collect_orphans_task()
@@ -0,0 +1,338 @@
+"""
+High-contention stock mode for flash-sale products (`Product.is_hot`).
+
+Normally every checkout locks the product row (`SELECT ... FOR UPDATE`) to check
+and decrement stock, so buyers of one popular product queue up on one MySQL
+row. For hot products admission is decided by an atomic counter instead:
+
+- The counter holds the units still available. Reserving a checkout or placing an
+  order takes units with one atomic check-and-decrement (an in-process lock
+  striped per product, or a Redis Lua script across nodes); no product row lock.
+- Sales are recorded as `HotStockSale` rows (plain inserts, no contention) in
+  the order transaction. `reconcile_hot_stock` folds them into `Product.stock`
+  in batches: one UPDATE per product per batch.
+- A counter is (re)built on demand from the database as
+  `stock - pending sales - stock holds`, so it survives restarts and can be
+  reset whenever stock is edited by hand.
+
+Counter changes made inside a transaction are undone if it rolls back and
+releases are applied only after it commits (see the Session hooks below).
+Editing stock during a sale resets the counter; units taken by checkouts that
+have not committed yet at that moment can be counted twice, so prefer editing
+stock of hot products before or after the rush. Pending sales are not discarded
+by an edit: they still come off the new value when folded in.
+
+Backends: "redis" (default) keeps one counter shared by every worker, host and
+order-intake process. "memory" keeps a counter per process, each built from the
+same database stock, so with several processes every one of them would admit the
+full stock. It is therefore refused unless `HOT_STOCK_SINGLE_PROCESS=true` declares
+that one process serves all checkouts (one uvicorn worker, no separate
+`services.order_intake --loop` worker), e.g. for local development.
+Run `python -m services.hot_stock` to fold pending sales into stock by hand.
+"""
+import os
+import threading
+
+from fastapi import HTTPException
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models import Product, HotStockSale, StockReservation
+
+HOT_STOCK_BACKEND = os.getenv("HOT_STOCK_BACKEND", "redis")  # redis | memory (single process only)
+HOT_STOCK_SINGLE_PROCESS = os.getenv("HOT_STOCK_SINGLE_PROCESS", "false").lower() == "true"
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+HOT_STOCK_RECONCILE_BATCH_SIZE = int(os.getenv("HOT_STOCK_RECONCILE_BATCH_SIZE", 5000))
+
+MEMORY_LOCK_STRIPES = 64
+
+if HOT_STOCK_BACKEND == "memory" and not HOT_STOCK_SINGLE_PROCESS:
+    # ❌ Per-process counters oversell once there is more than one process; refuse to start
+    raise RuntimeError(
+        "HOT_STOCK_BACKEND=memory keeps a separate counter per process. Use HOT_STOCK_BACKEND=redis, "
+        "or set HOT_STOCK_SINGLE_PROCESS=true if exactly one process places orders."
+    )
+
+# Session.info keys: counter effects waiting for the transaction outcome
+TAKEN_KEY = "hot_stock_taken"  # [(product_id, qty)] given back on rollback
+RELEASE_KEY = "hot_stock_release"  # [(product_id, qty)] given back on commit
+RESET_KEY = "hot_stock_reset"  # {product_id} rebuilt from the DB after commit
+
+
+# ---------------------------- #
+# 🧮 COUNTER STORES
+# ---------------------------- #
+
+class MemoryCounterStore:
+    """Per-process counters; one lock per stripe so different products never contend."""
+
+    def __init__(self, stripes: int = MEMORY_LOCK_STRIPES):
+        self._counters = {}
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _lock(self, product_id: int) -> threading.Lock:
+        return self._locks[product_id % len(self._locks)]
+
+    def take(self, product_id: int, quantity: int, initial) -> bool:
+        with self._lock(product_id):
+            if product_id not in self._counters:
+                self._counters[product_id] = initial()
+            if self._counters[product_id] < quantity:
+                return False
+            self._counters[product_id] -= quantity
+            return True
+
+    def give(self, product_id: int, quantity: int):
+        with self._lock(product_id):
+            if product_id in self._counters:  # Missing → rebuilt from the DB on next use
+                self._counters[product_id] += quantity
+
+    def peek(self, product_id: int, initial) -> int:
+        with self._lock(product_id):
+            if product_id not in self._counters:
+                self._counters[product_id] = initial()
+            return self._counters[product_id]
+
+    def reset(self, product_id: int):
+        with self._lock(product_id):
+            self._counters.pop(product_id, None)
+
+
+class RedisCounterStore:
+    """Shared counters for multi-node deployments; check-and-decrement is one Lua call."""
+
+    # KEYS[1]=counter, ARGV[1]=quantity → -1 missing, 0 not enough, 1 taken
+    TAKE_SCRIPT = """
+    local available = redis.call('GET', KEYS[1])
+    if not available then return -1 end
+    if tonumber(available) < tonumber(ARGV[1]) then return 0 end
+    redis.call('DECRBY', KEYS[1], ARGV[1])
+    return 1
+    """
+    # Only adjust counters that exist; a missing one is rebuilt from the DB
+    GIVE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then return redis.call('INCRBY', KEYS[1], ARGV[1]) end
+    return nil
+    """
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis  # Only needed for the multi-node setup
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.take_script = self.client.register_script(self.TAKE_SCRIPT)
+        self.give_script = self.client.register_script(self.GIVE_SCRIPT)
+
+    @staticmethod
+    def _key(product_id: int) -> str:
+        return f"hotstock:{product_id}"
+
+    def take(self, product_id: int, quantity: int, initial) -> bool:
+        key = self._key(product_id)
+        result = self.take_script(keys=[key], args=[quantity])
+        if result == -1:
+            self.client.set(key, initial(), nx=True)  # ✅ First writer wins; others retry against its value
+            result = self.take_script(keys=[key], args=[quantity])
+        return result == 1
+
+    def give(self, product_id: int, quantity: int):
+        self.give_script(keys=[self._key(product_id)], args=[quantity])
+
+    def peek(self, product_id: int, initial) -> int:
+        value = self.client.get(self._key(product_id))
+        if value is None:
+            self.client.set(self._key(product_id), initial(), nx=True)
+            value = self.client.get(self._key(product_id))
+        return int(value)
+
+    def reset(self, product_id: int):
+        self.client.delete(self._key(product_id))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RedisCounterStore() if HOT_STOCK_BACKEND == "redis" else MemoryCounterStore()
+    return _store
+
+
+# ---------------------------- #
+# 🔥 COUNTER OPERATIONS
+# ---------------------------- #
+
+def _initial_available(product_id: int):
+    """Loader for a missing counter: stock − pending sales − every hold row (expired holds return when swept)."""
+    def load() -> int:
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            stock = db.query(Product.stock).filter(Product.id == product_id).scalar() or 0
+            pending = db.query(func.coalesce(func.sum(HotStockSale.quantity), 0)).filter(
+                HotStockSale.product_id == product_id).scalar()
+            held = db.query(func.coalesce(func.sum(StockReservation.quantity), 0)).filter(
+                StockReservation.product_id == product_id).scalar()
+            return max(int(stock) - int(pending) - int(held), 0)
+        finally:
+            db.close()
+    return load
+
+
+def _call(operation, *args):
+    try:
+        return operation(*args)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Hot stock counter unavailable: {e}")
+        raise HTTPException(status_code=503, detail="Checkout is busy right now. Please try again.")
+
+
+def take_hot_stock(db: Session, product_id: int, quantity: int) -> bool:
+    """Atomically takes units; they are given back automatically if `db`'s transaction rolls back."""
+    store = get_store()
+    if not _call(store.take, product_id, quantity, _initial_available(product_id)):
+        return False
+    db.info.setdefault(TAKEN_KEY, []).append((product_id, quantity))
+    return True
+
+
+def pending_releases(db: Session) -> int:
+    """Marker for `undo_hot_stock`: how many after-commit releases `db` has registered so far."""
+    return len(db.info.get(RELEASE_KEY, ()))
+
+
+def undo_hot_stock(db: Session, taken: list, releases_from: int = None):
+    """
+    Gives back units taken earlier in this transaction and, with `releases_from`
+    (a `pending_releases` marker), drops releases registered since then
+    (e.g. a savepoint was rolled back).
+    """
+    pending = db.info.get(TAKEN_KEY, [])
+    for entry in taken:
+        if entry in pending:
+            pending.remove(entry)
+        get_store().give(*entry)
+    if releases_from is not None and RELEASE_KEY in db.info:
+        del db.info[RELEASE_KEY][releases_from:]
+
+
+def release_hot_stock_on_commit(db: Session, product_id: int, quantity: int):
+    """Returns units to the counter once `db` commits (cancelled sale, swept or replaced hold)."""
+    db.info.setdefault(RELEASE_KEY, []).append((product_id, quantity))
+
+
+def reset_hot_stock_on_commit(db: Session, product_id: int):
+    """Rebuilds the counter from the DB after `db` commits (stock edited by hand, mode toggled)."""
+    db.info.setdefault(RESET_KEY, set()).add(product_id)
+
+
+def hot_available(product_id: int) -> int:
+    return _call(get_store().peek, product_id, _initial_available(product_id))
+
+
+def record_hot_sale(db: Session, product_id: int, quantity: int, order_id: int = None):
+    """Logs a sale to subtract from `Product.stock` later. Does not commit."""
+    db.add(HotStockSale(product_id=product_id, order_id=order_id, quantity=quantity))
+
+
+def stock_changed_by_hand(db: Session, product: Product):
+    """
+    Call after `Product.stock` of a hot product is edited; the counter is rebuilt once `db` commits.
+    Pending sales still apply on top of the new value, matching the stock the NGO was shown.
+    """
+    if product.is_hot:
+        reset_hot_stock_on_commit(db, product.id)
+
+
+# ---------------------------- #
+# 🔁 RECONCILIATION
+# ---------------------------- #
+
+def reconcile_hot_stock(db: Session, batch_size: int = HOT_STOCK_RECONCILE_BATCH_SIZE, product_id: int = None) -> int:
+    """Folds one batch of pending sales (optionally of one product) into `Product.stock`; returns rows applied."""
+    query = db.query(HotStockSale.id, HotStockSale.product_id, HotStockSale.quantity)
+    if product_id is not None:
+        query = query.filter(HotStockSale.product_id == product_id)
+    sales = (
+        query
+        .order_by(HotStockSale.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not sales:
+        return 0
+
+    totals = {}
+    for sale in sales:
+        totals[sale.product_id] = totals.get(sale.product_id, 0) + sale.quantity
+
+    for sold_product_id in sorted(totals):
+        db.query(Product).filter(Product.id == sold_product_id).update(
+            {"stock": Product.stock - totals[sold_product_id]}, synchronize_session=False
+        )
+    db.query(HotStockSale).filter(HotStockSale.id.in_([sale.id for sale in sales])).delete(synchronize_session=False)
+
+    from services.versioning import bump_version, STOCK
+
+    bump_version(db, STOCK)
+    db.commit()
+    print(f"🔥 Applied {len(sales)} hot sale(s) to {len(totals)} product(s)")
+    return len(sales)
+
+
+def reconcile_hot_stock_task():
+    """Background-task / scheduler entry point with its own session; drains everything pending."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        applied = 0
+        while True:
+            batch = reconcile_hot_stock(db)
+            applied += batch
+            if batch < HOT_STOCK_RECONCILE_BATCH_SIZE:
+                return applied
+    finally:
+        db.close()
+
+
+# ---------------------------- #
+# 🪝 TRANSACTION HOOKS
+# ---------------------------- #
+
+@event.listens_for(Session, "after_commit")
+def _apply_hot_stock_effects(session):
+    if session.in_nested_transaction():
+        return  # ✅ A SAVEPOINT release is not the commit
+    session.info.pop(TAKEN_KEY, None)  # Kept for good
+    if not (RELEASE_KEY in session.info or RESET_KEY in session.info):
+        return
+    store = get_store()
+    for product_id, quantity in session.info.pop(RELEASE_KEY, ()):
+        store.give(product_id, quantity)
+    for product_id in session.info.pop(RESET_KEY, ()):
+        store.reset(product_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _undo_hot_stock_effects(session):
+    if session.in_nested_transaction():
+        return  # Only a SAVEPOINT rolled back; callers undo their own takes (`undo_hot_stock`)
+    session.info.pop(RELEASE_KEY, None)
+    session.info.pop(RESET_KEY, None)
+    taken = session.info.pop(TAKEN_KEY, None)
+    if taken:
+        store = get_store()
+        for product_id, quantity in taken:
+            store.give(product_id, quantity)
+
+
+if __name__ == "__main__":
+    reconcile_hot_stock_task()
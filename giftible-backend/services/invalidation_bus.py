@@ -0,0 +1,215 @@
+"""
+Cross-worker invalidation bus for per-worker in-memory caches.
+
+Each uvicorn/gunicorn worker keeps its own caches (services/reference_cache.py),
+so a change committed on one worker has to reach every other one. Caches
+`subscribe(entity, callback)` by entity tag (services/versioning.py); write
+paths need nothing new: every `bump_version(db, ...)` they already make is
+published once the transaction commits (the `after_commit` hook below).
+
+Delivery, per `INVALIDATION_BACKEND`:
+
+- `poll` (default, no extra infrastructure): a thread in each worker reads the
+  subscribed `entity_versions` stamps every `INVALIDATION_POLL_SECONDS` (one
+  primary-key lookup for all tags) and calls the subscribers of the ones that
+  moved. This also catches writes from processes that never publish (cron, SQL).
+- `redis`: commits are published on the `INVALIDATION_CHANNEL` pub/sub channel
+  and delivered to every worker at once. Pub/sub drops messages while a worker
+  is disconnected, so the thread polls while Redis is unreachable and once more
+  after every (re)connect to catch up.
+
+The committing worker's own subscribers are called synchronously, so its own
+writes are visible on the next read. `is_healthy()` tells caches whether the bus
+is currently delivering; while it is not, they go back to checking versions
+themselves.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from services.versioning import BUMPED_ENTITIES_KEY, get_versions
+
+INVALIDATION_BACKEND = os.getenv("INVALIDATION_BACKEND", "poll")  # poll | redis
+INVALIDATION_POLL_SECONDS = float(os.getenv("INVALIDATION_POLL_SECONDS", 2))
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "giftible:invalidate")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+ORIGIN = uuid.uuid4().hex  # Lets a worker skip its own messages (already delivered locally)
+REDIS_RETRY_SECONDS = 5
+
+_subscribers = defaultdict(list)  # entity → [callback()]
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(entity: str, callback):
+    """Calls `callback()` (no arguments, must be cheap and not raise) whenever `entity` changes anywhere."""
+    with _subscribers_lock:
+        _subscribers[entity].append(callback)
+
+
+def _deliver(entities, source: str):
+    for entity in entities:
+        for callback in list(_subscribers.get(entity, ())):
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Invalidation subscriber for {entity} ({source}) failed: {e!r}")
+
+
+# ---------------------------- #
+# 📣 PUBLISHING
+# ---------------------------- #
+
+_redis = None
+_redis_lock = threading.Lock()
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        with _redis_lock:
+            if _redis is None:
+                import redis  # Only needed for the multi-node setup
+
+                _redis = redis.Redis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _redis
+
+
+def publish(entities):
+    """Invalidates `entities` here right away and on every other worker."""
+    entities = sorted(set(entities))
+    if not entities:
+        return
+    _deliver(entities, "local")
+    if INVALIDATION_BACKEND != "redis":
+        return  # Other workers see the version stamp on their next poll
+    try:
+        _redis_client().publish(INVALIDATION_CHANNEL, json.dumps({"origin": ORIGIN, "entities": entities}))
+    except Exception as e:
+        print(f"⚠️ Could not publish invalidation of {entities}; other workers will catch up by polling: {e}")
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_bumped_entities(session):
+    if session.in_nested_transaction():
+        return  # ✅ A SAVEPOINT release (e.g. a first `bump_version`) is not the commit
+    entities = session.info.pop(BUMPED_ENTITIES_KEY, None)
+    if entities:
+        publish(entities)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_bumped_entities(session):
+    if session.in_nested_transaction():
+        return  # Only the SAVEPOINT rolled back; the outer transaction still commits its bumps
+    session.info.pop(BUMPED_ENTITIES_KEY, None)
+
+
+# ---------------------------- #
+# 👂 LISTENING
+# ---------------------------- #
+
+_seen_versions = {}  # entity → last version delivered by polling
+_last_sync = 0.0  # monotonic time the bus last confirmed it is up to date
+_stop = threading.Event()
+_thread = None
+
+
+def poll_once(db: Session) -> list[str]:
+    """Delivers every subscribed entity whose version moved since the last poll; returns them."""
+    global _last_sync
+    entities = list(_subscribers)
+    if not entities:
+        _last_sync = time.monotonic()
+        return []
+    versions = get_versions(db, *entities)
+    # ✅ A first poll delivers everything: caches filled before it may predate the baseline
+    changed = [entity for entity in entities if _seen_versions.get(entity) != versions[entity][0]]
+    _seen_versions.update({entity: versions[entity][0] for entity in entities})
+    _last_sync = time.monotonic()
+    if changed:
+        _deliver(changed, "poll")
+    return changed
+
+
+def _poll():
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        poll_once(db)
+    except Exception as e:
+        print(f"⚠️ Invalidation poll failed: {e!r}")
+    finally:
+        db.close()
+
+
+def _poll_loop():
+    _poll()
+    while not _stop.wait(INVALIDATION_POLL_SECONDS):
+        _poll()
+
+
+def _redis_loop():
+    global _last_sync
+    while not _stop.is_set():
+        pubsub = None
+        try:
+            pubsub = _redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            _poll()  # ✅ Catch up on whatever was published while we were not subscribed
+            print(f"📡 Invalidation bus listening on {INVALIDATION_CHANNEL}")
+            while not _stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                _last_sync = time.monotonic()
+                if not message or message.get("type") != "message":
+                    continue
+                try:
+                    payload = json.loads(message["data"])
+                except (TypeError, ValueError):
+                    continue
+                if payload.get("origin") != ORIGIN:
+                    _deliver(payload.get("entities", ()), "redis")
+        except Exception as e:
+            print(f"⚠️ Invalidation bus lost Redis, polling until it is back: {e!r}")
+            retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+            while not _stop.is_set() and time.monotonic() < retry_at:
+                _poll()
+                _stop.wait(INVALIDATION_POLL_SECONDS)
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+def is_healthy() -> bool:
+    """True while the listener thread is running and has synced within a couple of poll periods."""
+    if not (_thread and _thread.is_alive()):
+        return False
+    return time.monotonic() - _last_sync <= max(2 * INVALIDATION_POLL_SECONDS, 3.0)
+
+
+def start_invalidation_bus():
+    """Starts this worker's listener thread (called from the app lifespan)."""
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    target = _redis_loop if INVALIDATION_BACKEND == "redis" else _poll_loop
+    _thread = threading.Thread(target=target, name="giftible-invalidation", daemon=True)
+    _thread.start()
+
+
+def stop_invalidation_bus(timeout: float = 5):
+    if not _thread:
+        return
+    _stop.set()
+    _thread.join(timeout)
@@ -0,0 +1,155 @@
+"""
+Queued order intake for checkout spikes (`ORDER_INTAKE_MODE=queue`).
+
+`/orders/place-order` then only verifies the payment signature, snapshots the
+cart into an `OrderIntake` row and answers 202 with the intake id; the client
+polls `/orders/intake/{id}`. Order workers drain the queue in micro-batches:
+
+- a batch of queued intakes is claimed with `FOR UPDATE SKIP LOCKED`, so any
+  number of workers can run side by side and a crashed worker's batch simply
+  becomes visible again;
+- every intake is placed with the regular rules (services/order_placement.py)
+  inside its own savepoint, so one bad intake never sinks the batch: whatever
+  it raises, its ledger entries are restored and only that intake is failed;
+- regular stock is tracked in a per-batch ledger and written with one UPDATE per
+  product, and the whole batch commits once.
+
+Run `python -m services.order_intake` for one batch, or `--loop` for a worker.
+"""
+import json
+import os
+import sys
+import time
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import OrderIntake, Product
+from services.order_placement import place_order_from_lines, find_placed_order
+
+ORDER_INTAKE_BATCH_SIZE = int(os.getenv("ORDER_INTAKE_BATCH_SIZE", 50))
+ORDER_INTAKE_POLL_SECONDS = float(os.getenv("ORDER_INTAKE_POLL_SECONDS", 0.5))
+
+
+def intake_status(intake: OrderIntake) -> dict:
+    return {
+        "intake_id": intake.id,
+        "status": intake.status,
+        "order_id": intake.order_id,
+        "error": intake.error,
+    }
+
+
+def enqueue_order(db: Session, user_id: int, address_id: int, amount: float, razorpay_order_id: str,
+                  payment_id: str, lines: list[dict], coupon_code: str = None) -> OrderIntake:
+    """Durably queues a verified place-order request; a repeat for the same payment returns the first intake."""
+    intake = OrderIntake(
+        razorpay_order_id=razorpay_order_id,
+        payment_id=payment_id,
+        universal_user_id=user_id,
+        address_id=address_id,
+        coupon_code=coupon_code,
+        amount=amount,
+        items=json.dumps(lines),
+    )
+    db.add(intake)
+    try:
+        db.commit()
+        return intake
+    except IntegrityError:
+        db.rollback()
+        return db.query(OrderIntake).filter(OrderIntake.razorpay_order_id == razorpay_order_id).first()
+
+
+def _fail(intake: OrderIntake, detail: str):
+    intake.status = "failed"
+    intake.error = str(detail)[:255]
+    print(f"❌ Intake {intake.id} failed (refund needed for {intake.razorpay_order_id}): {detail}")
+
+
+def process_intake_batch(db: Session, batch_size: int = ORDER_INTAKE_BATCH_SIZE) -> int:
+    """Places one micro-batch of queued orders; returns how many intakes were handled."""
+    intakes = (
+        db.query(OrderIntake)
+        .filter(OrderIntake.status == "queued")
+        .order_by(OrderIntake.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not intakes:
+        return 0
+
+    stock_ledger = {}  # product_id → units sold by this batch (regular products)
+    placed = 0
+    for intake in intakes:
+        ledger_before = dict(stock_ledger)
+        try:
+            with db.begin_nested():
+                order = place_order_from_lines(
+                    db,
+                    user_id=intake.universal_user_id,
+                    address_id=intake.address_id,
+                    amount=intake.amount,
+                    razorpay_order_id=intake.razorpay_order_id,
+                    payment_id=intake.payment_id,
+                    lines=json.loads(intake.items),
+                    coupon_code=intake.coupon_code,
+                    stock_ledger=stock_ledger,
+                )
+            intake.status = "placed"
+            intake.order_id = order.id
+            placed += 1
+        except IntegrityError:
+            # The payment webhook (or an earlier sync request) already placed it
+            stock_ledger.clear()
+            stock_ledger.update(ledger_before)
+            existing = find_placed_order(db, intake.razorpay_order_id)
+            if existing:
+                intake.status, intake.order_id = "placed", existing.id
+            else:
+                _fail(intake, "Order could not be created")
+        except HTTPException as e:
+            stock_ledger.clear()
+            stock_ledger.update(ledger_before)
+            _fail(intake, e.detail)
+        except Exception as e:
+            # 🔥 Any other error (bad snapshot, DB error in the savepoint) fails this intake only
+            stock_ledger.clear()
+            stock_ledger.update(ledger_before)
+            _fail(intake, f"{type(e).__name__}: {e}")
+
+    # ✅ One grouped stock write per product for the whole batch
+    for product_id in sorted(stock_ledger):
+        db.query(Product).filter(Product.id == product_id).update(
+            {"stock": Product.stock - stock_ledger[product_id]}, synchronize_session=False
+        )
+    db.commit()
+    print(f"📮 Intake batch: {placed}/{len(intakes)} placed, stock written for {len(stock_ledger)} product(s)")
+    return len(intakes)
+
+
+def process_intake_task():
+    """Background-task / scheduler entry point with its own session; drains what is queued now."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        handled = 0
+        while True:
+            batch = process_intake_batch(db)
+            handled += batch
+            if batch < ORDER_INTAKE_BATCH_SIZE:
+                return handled
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    if "--loop" in sys.argv:
+        while True:
+            if not process_intake_task():
+                time.sleep(ORDER_INTAKE_POLL_SECONDS)
+    else:
+        process_intake_task()
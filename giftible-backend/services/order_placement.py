@@ -0,0 +1,259 @@
+"""
+Turns paid cart lines into an Order.
+
+Shared by `/orders/place-order` (browser returns from Razorpay) and the payment
+reconciliation worker (webhook arrived but the browser never came back), so both
+paths apply the same stock, coupon and cart rules. Nothing here commits: the
+caller owns the transaction.
+"""
+import json
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Order, OrderItem, Cart, CartItem, Product, CheckoutIntent, OrderIntake, PaymentEvent
+from services.versioning import bump_version_after_commit, STOCK
+from services.coupon_engine import claim_coupon, settle_coupon
+from services.stock_reservations import held_quantities, consume_holds, lock_own_holds
+from services.hot_stock import (
+    take_hot_stock, undo_hot_stock, pending_releases, release_hot_stock_on_commit, record_hot_sale,
+)
+from services.trending import record_sale_on_commit
+
+
+def cart_lines(db: Session, user_id: int) -> list[dict]:
+    """[{"product_id", "quantity"}] for the user's current cart (empty if there is none)."""
+    rows = (
+        db.query(CartItem.product_id, CartItem.quantity)
+        .join(Cart, Cart.id == CartItem.cart_id)
+        .filter(Cart.universal_user_id == user_id)
+        .order_by(CartItem.product_id)
+        .all()
+    )
+    return [{"product_id": product_id, "quantity": quantity} for product_id, quantity in rows]
+
+
+def cart_subtotal(db: Session, lines: list[dict]) -> float:
+    """Current price of `lines` (what coupon rules are checked against)."""
+    prices = dict(db.query(Product.id, Product.price).filter(Product.id.in_([line["product_id"] for line in lines])))
+    return sum(prices.get(line["product_id"], 0) * line["quantity"] for line in lines)
+
+
+def find_placed_order(db: Session, razorpay_order_id: str):
+    """(order id, user id) of the Order already placed for this Razorpay order, if any. Unique-index lookup."""
+    return db.query(Order.id, Order.universal_user_id).filter(Order.razorpay_order_id == razorpay_order_id).first()
+
+
+def placed_order_response(order_id: int) -> dict:
+    return {"message": "✅ Order placed successfully!", "order_id": order_id}
+
+
+def place_order_from_lines(
+    db: Session,
+    user_id: int,
+    address_id: int,
+    amount: float,
+    razorpay_order_id: str,
+    payment_id: str,
+    lines: list[dict],
+    coupon_code: str = None,
+    stock_ledger: dict = None,
+) -> Order:
+    """
+    Creates the order and its items, deducts stock, redeems the coupon and removes
+    the ordered lines from the user's cart. Raises HTTPException (400/404) on any rule violation,
+    and IntegrityError if an Order for `razorpay_order_id` already exists.
+
+    With `stock_ledger` ({product_id: units}) regular stock is not decremented on the rows;
+    this order's units are added to the ledger instead and checked against it, so a batch
+    caller can apply one UPDATE per product (see services/order_intake.py).
+    """
+    if not lines:
+        raise HTTPException(status_code=400, detail="❌ Cannot place an empty order!")
+
+    order = Order(
+        universal_user_id=user_id,
+        address_id=address_id,
+        total_amount=amount,
+        razorpay_order_id=razorpay_order_id,
+        payment_id=payment_id,
+    )
+    db.add(order)
+    db.flush()  # ✅ Assigns order.id without committing
+
+    print(f"✅ Order ID: {order.id} created (pending commit)")
+
+    taken_hot = []  # Counter units taken by this call, given back if it fails
+    releases_from = pending_releases(db)  # Releases registered by this call are dropped if it fails
+    try:
+        _add_items_and_redeem(db, order, user_id, razorpay_order_id, lines, coupon_code, taken_hot, stock_ledger)
+    except Exception:
+        undo_hot_stock(db, taken_hot, releases_from)  # ✅ Also covers callers that only roll back a savepoint
+        raise
+
+    # ✅ Remove the ordered lines from the cart
+    cart_ids = db.query(Cart.id).filter(Cart.universal_user_id == user_id)
+    db.query(CartItem).filter(
+        CartItem.cart_id.in_(cart_ids),
+        CartItem.product_id.in_([line["product_id"] for line in lines]),
+    ).delete(synchronize_session=False)
+
+    # ✅ The intent behind this Razorpay order is fulfilled
+    db.query(CheckoutIntent).filter(CheckoutIntent.razorpay_order_id == razorpay_order_id).update(
+        {"status": "completed", "order_id": order.id}, synchronize_session=False
+    )
+    return order
+
+
+def _hot_product_ids(db: Session, product_ids) -> set[int]:
+    return {row.id for row in db.query(Product.id).filter(Product.id.in_(product_ids), Product.is_hot == True)}
+
+
+def _add_items_and_redeem(db: Session, order: Order, user_id: int, razorpay_order_id: str,
+                          lines: list[dict], coupon_code: str, taken_hot: list, stock_ledger: dict = None):
+    product_ids = sorted({line["product_id"] for line in lines})
+    own_holds = lock_own_holds(db, razorpay_order_id)
+
+    # ✅ Lock the regular products (fixed order); hot products are admitted by their counter, unlocked
+    hot_ids = _hot_product_ids(db, product_ids)
+    products = {
+        p.id: p for p in db.query(Product).filter(Product.id.in_([pid for pid in product_ids if pid not in hot_ids]))
+        .order_by(Product.id).with_for_update().all()
+    }
+    if hot_ids:
+        products.update({p.id: p for p in db.query(Product).filter(Product.id.in_(hot_ids))})
+    held_by_others = held_quantities(db, product_ids, exclude_razorpay_order_id=razorpay_order_id)
+
+    # ✅ Insert order items and update stock
+    ledger_units = {}
+    for line in lines:
+        product = products.get(line["product_id"])
+
+        if not product:
+            raise HTTPException(status_code=404, detail=f"Product with ID {line['product_id']} not found")
+
+        if product.id in hot_ids:
+            # 🔥 Units held for this order were taken from the counter at checkout; take only what is missing
+            missing = line["quantity"] - own_holds.get(product.id, 0)
+            if missing > 0:
+                if not take_hot_stock(db, product.id, missing):
+                    raise HTTPException(status_code=400, detail=f"❌ Not enough stock for {product.name}")
+                taken_hot.append((product.id, missing))
+            elif missing < 0:
+                release_hot_stock_on_commit(db, product.id, -missing)
+            record_hot_sale(db, product.id, line["quantity"], order_id=order.id)  # Folded into stock in batches
+            print(f"🔥 Hot sale recorded | {product.name} x{line['quantity']}")
+        else:
+            # ✅ Ensure stock is available (our own hold, if any, is part of it)
+            already_taken = (stock_ledger or {}).get(product.id, 0) + ledger_units.get(product.id, 0)
+            if product.stock - already_taken - held_by_others.get(product.id, 0) < line["quantity"]:
+                raise HTTPException(status_code=400, detail=f"❌ Not enough stock for {product.name}")
+
+            # ✅ Deduct stock
+            if stock_ledger is not None:
+                ledger_units[product.id] = ledger_units.get(product.id, 0) + line["quantity"]
+            else:
+                product.stock -= line["quantity"]
+                print(f"⚡ Stock Updated | {product.name} Remaining: {product.stock}")
+
+        db.add(OrderItem(
+            order_id=order.id,
+            product_id=line["product_id"],
+            quantity=line["quantity"],
+            price=product.price,
+            status="Pending",
+        ))
+        record_sale_on_commit(  # 📈 Rankings; stamped like the order so a cancellation takes back exactly this
+            db, product, line["quantity"], product.price * line["quantity"], ordered_at=order.created_at
+        )
+        print(f"🛍️ OrderItem Added | Product: {product.name}, Quantity: {line['quantity']}")
+
+    # 🔥 Hot units held for lines no longer in the cart go back to the counter
+    ordered_ids = set(product_ids)
+    for product_id, quantity in own_holds.items():
+        if product_id not in ordered_ids and product_id in _hot_product_ids(db, [product_id]):
+            release_hot_stock_on_commit(db, product_id, quantity)
+
+    consume_holds(db, razorpay_order_id)  # ✅ The holds became this sale
+    if len(hot_ids) < len(product_ids):
+        # ✅ Stock changed; bumped after commit, coalesced (hot sales bump it when they are folded in)
+        bump_version_after_commit(db, STOCK)
+
+    # 🎟️ Claimed before payment; the customer has paid now, so a coupon problem is recorded, never fatal
+    if coupon_code:
+        conflict = settle_coupon(db, coupon_code, user_id, razorpay_order_id, order.id)
+        if conflict:
+            order.coupon_conflict = conflict[:255]
+            print(f"⚠️ Order {order.id} paid with coupon {coupon_code} that could not be redeemed: {conflict}")
+        else:
+            print(f"🎟️ Coupon {coupon_code} redeemed on order {order.id}")
+
+    if stock_ledger is not None:
+        for product_id, units in ledger_units.items():
+            stock_ledger[product_id] = stock_ledger.get(product_id, 0) + units
+
+
+def consumed_receipts(db: Session, user_id: int, base_receipt: str) -> set[str]:
+    """
+    Receipts of `base_receipt`'s generations whose Razorpay order was paid for or placed
+    (captured payment, queued intake or Order). A new checkout must not reuse them.
+    """
+    intents = db.query(CheckoutIntent.receipt, CheckoutIntent.razorpay_order_id, CheckoutIntent.status).filter(
+        CheckoutIntent.universal_user_id == user_id,
+        CheckoutIntent.receipt.like(f"{base_receipt}%"),  # ✅ Prefix range on ix_checkout_intents_receipt
+    ).all()
+    if not intents:
+        return set()
+    from services.payment_reconciliation import CAPTURE_EVENTS  # Imports this module
+
+    order_ids = [intent.razorpay_order_id for intent in intents]
+    paid = {row[0] for row in db.query(Order.razorpay_order_id).filter(Order.razorpay_order_id.in_(order_ids))}
+    paid |= {row[0] for row in db.query(OrderIntake.razorpay_order_id).filter(OrderIntake.razorpay_order_id.in_(order_ids))}
+    paid |= {
+        row[0] for row in db.query(PaymentEvent.razorpay_order_id).filter(
+            PaymentEvent.razorpay_order_id.in_(order_ids),
+            PaymentEvent.event_type.in_(CAPTURE_EVENTS),
+        )
+    }
+    return {
+        intent.receipt for intent in intents
+        if intent.status != "created" or intent.razorpay_order_id in paid
+    }
+
+
+def record_checkout_intent(
+    db: Session,
+    razorpay_order_id: str,
+    user_id: int,
+    amount: float,
+    lines: list[dict],
+    address_id: int = None,
+    coupon_code: str = None,
+    receipt: str = None,
+):
+    """
+    Stores (or refreshes, when the gateway order was reused) what this Razorpay order pays for,
+    and claims its coupon in the same commit. Raises 404 / 400 if the coupon cannot be claimed. Commits.
+    """
+    intent = db.query(CheckoutIntent).filter(CheckoutIntent.razorpay_order_id == razorpay_order_id).first()
+    if intent is None:
+        intent = CheckoutIntent(razorpay_order_id=razorpay_order_id, universal_user_id=user_id)
+        db.add(intent)
+    elif intent.status != "created":
+        return intent
+    intent.amount = amount
+    intent.items = json.dumps(lines)
+    intent.address_id = address_id
+    intent.coupon_code = coupon_code
+    intent.receipt = receipt
+    try:
+        if coupon_code:
+            claim_coupon(db, coupon_code, user_id, cart_subtotal(db, lines), razorpay_order_id)
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # A concurrent request for the same reused order recorded it first
+    except Exception:
+        db.rollback()
+        raise
+    return intent
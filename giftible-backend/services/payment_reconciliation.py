@@ -0,0 +1,232 @@
+"""
+Razorpay webhook inbox and reconciliation worker.
+
+The webhook endpoint only verifies the signature and inserts the raw event into
+`payment_events` (unique on Razorpay's event id, so redeliveries are no-ops),
+then acknowledges. `reconcile_payments` drains that inbox in batches: for every
+captured payment whose order was never placed (the browser closed, timed out or
+lost its connection after paying) it places the order from the `CheckoutIntent`
+recorded when the Razorpay order was created, using the same rules as
+`/orders/place-order`.
+
+Events younger than `RECONCILE_GRACE_SECONDS` are left alone so the normal
+browser path gets to finish first.
+
+Captured money that cannot become an order (wrong amount, or the order still
+fails after `RECONCILE_MAX_ATTEMPTS`, whatever the error) is settled as
+`refund_needed`. An event counts as processed only once its order exists, and
+one failing event never holds back the rest of the batch. Those events
+and `unmatched` ones are listed for admins by `payments_needing_attention`
+(`GET /admin/payments/attention`) until someone marks them resolved.
+
+Run `python -m services.payment_reconciliation` for one batch, or add `--loop`
+to keep draining every `RECONCILE_INTERVAL_SECONDS`.
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import PaymentEvent, CheckoutIntent
+from services.order_placement import place_order_from_lines, find_placed_order
+
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", 100))
+RECONCILE_GRACE_SECONDS = int(os.getenv("RECONCILE_GRACE_SECONDS", 120))
+RECONCILE_MAX_ATTEMPTS = int(os.getenv("RECONCILE_MAX_ATTEMPTS", 5))
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("RECONCILE_INTERVAL_SECONDS", 30))
+
+# Events that mean "money for this Razorpay order has been captured"
+CAPTURE_EVENTS = {"payment.captured", "order.paid"}
+
+# Captured payments without an order: stay listed for admins until resolved
+ATTENTION_STATUSES = ("refund_needed", "unmatched")
+
+
+# ---------------------------- #
+# 📥 INBOX
+# ---------------------------- #
+
+def parse_event(body: bytes) -> dict:
+    """Pulls the fields we index on out of a Razorpay webhook body."""
+    event = orjson.loads(body)
+    payload = event.get("payload", {})
+    payment = payload.get("payment", {}).get("entity", {})
+    order = payload.get("order", {}).get("entity", {})
+    return {
+        "event_type": event.get("event", "unknown"),
+        "razorpay_order_id": payment.get("order_id") or order.get("id"),
+        "razorpay_payment_id": payment.get("id"),
+        "amount": payment.get("amount") or order.get("amount_paid"),
+    }
+
+
+def store_payment_event(db: Session, event_id: str, body: bytes) -> bool:
+    """Durably records a verified webhook. Returns False for a redelivery of an event we already have."""
+    fields = parse_event(body)
+    db.add(PaymentEvent(event_id=event_id, payload=body.decode("utf-8"), **fields))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return False
+
+
+# ---------------------------- #
+# 🔁 RECONCILIATION
+# ---------------------------- #
+
+def _settle(event: PaymentEvent, status: str, error: str = None):
+    event.status = status
+    event.last_error = error[:255] if error else None
+    event.processed_at = datetime.utcnow()
+
+
+def _failed_attempt(event: PaymentEvent, error: str):
+    """Counts a failed placement; the last allowed attempt leaves the payment for an admin."""
+    event.attempts += 1
+    if event.attempts >= RECONCILE_MAX_ATTEMPTS:
+        print(f"❌ Paid Razorpay order {event.razorpay_order_id} could not be fulfilled (refund needed): {error}")
+        return _settle(event, "refund_needed", error)  # ✅ Persisted for GET /admin/payments/attention
+    event.last_error = error[:255]
+
+
+def _process_event(db: Session, event: PaymentEvent):
+    if event.event_type not in CAPTURE_EVENTS or not event.razorpay_order_id:
+        return _settle(event, "ignored")
+
+    # ✅ Lock the intent: concurrent events for the same Razorpay order queue up here
+    intent = (
+        db.query(CheckoutIntent)
+        .filter(CheckoutIntent.razorpay_order_id == event.razorpay_order_id)
+        .with_for_update()
+        .first()
+    )
+
+    if find_placed_order(db, event.razorpay_order_id):
+        return _settle(event, "processed")  # The browser (or an earlier event) already placed it
+
+    if intent is None or intent.address_id is None:
+        return _settle(event, "unmatched", "No checkout intent with an address for this Razorpay order")
+
+    if event.amount is not None and event.amount != int(round(intent.amount * 100)):
+        error = f"Captured {event.amount} paise, expected {int(round(intent.amount * 100))}"
+        print(f"❌ Paid Razorpay order {event.razorpay_order_id} not fulfilled (refund needed): {error}")
+        return _settle(event, "refund_needed", error)
+
+    try:
+        with db.begin_nested():
+            order = place_order_from_lines(
+                db,
+                user_id=intent.universal_user_id,
+                address_id=intent.address_id,
+                amount=intent.amount,
+                razorpay_order_id=intent.razorpay_order_id,
+                payment_id=event.razorpay_payment_id,
+                lines=json.loads(intent.items),
+                coupon_code=intent.coupon_code,
+            )
+    except IntegrityError as e:
+        # The browser placed it concurrently (unique razorpay_order_id), or a row it points at is gone
+        if find_placed_order(db, event.razorpay_order_id):
+            return _settle(event, "processed")
+        return _failed_attempt(event, f"Order could not be created: {e.orig}")
+    except HTTPException as e:
+        return _failed_attempt(event, str(e.detail))
+
+    print(f"✅ Reconciled Razorpay order {event.razorpay_order_id} → Order {order.id}")
+    _settle(event, "processed")
+
+
+def reconcile_payments(db: Session, limit: int = RECONCILE_BATCH_SIZE) -> dict:
+    """Processes one batch of pending events; returns {status: count}."""
+    cutoff = datetime.utcnow() - timedelta(seconds=RECONCILE_GRACE_SECONDS)
+    events = (
+        db.query(PaymentEvent)
+        .filter(PaymentEvent.status == "pending", PaymentEvent.received_at <= cutoff)
+        .order_by(PaymentEvent.received_at, PaymentEvent.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)  # ✅ Several workers can drain the inbox side by side
+        .all()
+    )
+
+    counts = {}
+    for event in events:
+        try:
+            _process_event(db, event)
+        except Exception as e:
+            # 🔥 Anything else (bad intent snapshot, DB error) counts against this event only
+            _failed_attempt(event, f"{type(e).__name__}: {e}")
+        counts[event.status] = counts.get(event.status, 0) + 1
+
+    db.commit()
+    if events:
+        print(f"💳 Reconciled {len(events)} payment event(s): {counts}")
+    return counts
+
+
+# ---------------------------- #
+# 🚨 ADMIN FOLLOW-UP
+# ---------------------------- #
+
+def payments_needing_attention(db: Session, limit: int = 100) -> list[dict]:
+    """Captured payments that did not become an order, oldest first (uses the status index)."""
+    events = (
+        db.query(PaymentEvent)
+        .filter(PaymentEvent.status.in_(ATTENTION_STATUSES), PaymentEvent.event_type.in_(CAPTURE_EVENTS))
+        .order_by(PaymentEvent.received_at, PaymentEvent.id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "id": event.id,
+            "status": event.status,
+            "razorpay_order_id": event.razorpay_order_id,
+            "razorpay_payment_id": event.razorpay_payment_id,
+            "amount": event.amount / 100 if event.amount is not None else None,
+            "error": event.last_error,
+            "attempts": event.attempts,
+            "received_at": event.received_at.isoformat(),
+            "processed_at": event.processed_at.isoformat() if event.processed_at else None,
+        }
+        for event in events
+    ]
+
+
+def resolve_payment_event(db: Session, event_id: int, note: str = None) -> PaymentEvent | None:
+    """Marks an attention event as handled (refunded or fixed by hand). Commits."""
+    event = db.query(PaymentEvent).filter(
+        PaymentEvent.id == event_id, PaymentEvent.status.in_(ATTENTION_STATUSES)
+    ).with_for_update().first()
+    if event is None:
+        return None
+    _settle(event, "resolved", note or event.last_error)
+    db.commit()
+    return event
+
+
+def reconcile_payments_task():
+    """Background-task / scheduler entry point with its own session."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return reconcile_payments(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    if "--loop" in sys.argv:
+        while True:
+            reconcile_payments_task()
+            time.sleep(RECONCILE_INTERVAL_SECONDS)
+    else:
+        reconcile_payments_task()
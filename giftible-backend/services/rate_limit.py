@@ -0,0 +1,245 @@
+"""
+Token-bucket rate limiting for abuse-prone endpoints.
+
+`RateLimitMiddleware` is a pure ASGI middleware: it rejects with 429 before the
+request reaches FastAPI, so throttled logins never hit MySQL or bcrypt.
+Each rule has a per-IP bucket and optionally a per-account bucket keyed by a
+form field (e.g. the login contact number), which stops credential stuffing
+spread over many IPs. The small urlencoded body is buffered to read that field
+and then replayed to the app unchanged.
+
+Backends:
+- "memory" (default): per-process buckets, fine for a single node.
+- "redis": shared buckets across nodes (atomic Lua script); fails open if Redis is down.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"  # Only behind our own proxy
+
+MAX_BUFFERED_BODY = 16 * 1024  # Larger form bodies are not inspected for the account key
+MEMORY_MAX_KEYS = 100_000
+
+
+class Limit:
+    """`capacity` requests in a burst, refilled at `capacity / period` tokens per second."""
+
+    def __init__(self, capacity: int, period_seconds: float):
+        self.capacity = capacity
+        self.period_seconds = period_seconds
+        self.refill_rate = capacity / period_seconds
+
+
+class Rule:
+    def __init__(self, name: str, method: str, path: str, per_ip: Limit, per_account: Limit = None,
+                 account_field: str = None, prefix: bool = False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.prefix = prefix
+        self.per_ip = per_ip
+        self.per_account = per_account
+        self.account_field = account_field
+
+    def matches(self, method: str, path: str) -> bool:
+        if method != self.method:
+            return False
+        return path.startswith(self.path) if self.prefix else path.rstrip("/") == self.path
+
+
+def _limit(env_name: str, capacity: int, period_seconds: float) -> Limit:
+    # e.g. RATE_LIMIT_LOGIN_IP="20/60" → 20 requests per 60 seconds
+    raw = os.getenv(env_name)
+    if raw:
+        capacity, period_seconds = raw.split("/")
+    return Limit(int(capacity), float(period_seconds))
+
+
+RULES = [
+    Rule("login", "POST", "/token",
+         per_ip=_limit("RATE_LIMIT_LOGIN_IP", 20, 60),
+         per_account=_limit("RATE_LIMIT_LOGIN_ACCOUNT", 5, 300), account_field="username"),
+    Rule("forgot-password", "POST", "/forgot-password",
+         per_ip=_limit("RATE_LIMIT_RESET_IP", 5, 300),
+         per_account=_limit("RATE_LIMIT_RESET_ACCOUNT", 3, 3600), account_field="contact_number"),
+    Rule("register", "POST", "/register/", prefix=True,
+         per_ip=_limit("RATE_LIMIT_REGISTER_IP", 5, 600)),
+    Rule("search", "GET", "/api/search",
+         per_ip=_limit("RATE_LIMIT_SEARCH_IP", 30, 10)),
+]
+
+
+# ---------------------------- #
+# 🪣 BACKENDS
+# ---------------------------- #
+
+class MemoryBucketStore:
+    def __init__(self, max_keys: int = MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = {}  # key → (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, limit: Limit) -> float:
+        """Consumes one token; returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated_at) * limit.refill_rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                if len(self._buckets) > self.max_keys:
+                    self._prune(now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / limit.refill_rate
+
+    def _prune(self, now: float):
+        # Drop the oldest half; their buckets have had the longest time to refill
+        for key, _ in sorted(self._buckets.items(), key=lambda item: item[1][1])[: len(self._buckets) // 2]:
+            del self._buckets[key]
+
+
+class RedisBucketStore:
+    # KEYS[1]=bucket, ARGV: capacity, refill_rate (tokens/s), now (s), ttl (ms)
+    SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], ARGV[4])
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis.asyncio as redis_asyncio  # Only needed for the multi-node setup
+
+        self.client = redis_asyncio.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        ttl_ms = int(limit.period_seconds * 1000) + 1000
+        try:
+            wait = await self.script(keys=[f"ratelimit:{key}"], args=[limit.capacity, limit.refill_rate, time.time(), ttl_ms])
+            return float(wait)
+        except Exception as e:
+            print(f"⚠️ Rate limiter unavailable, allowing request: {e}")
+            return 0.0  # Fail open: an outage must not lock everyone out
+
+
+def create_store():
+    return RedisBucketStore() if RATE_LIMIT_BACKEND == "redis" else MemoryBucketStore()
+
+
+# ---------------------------- #
+# 🚦 MIDDLEWARE
+# ---------------------------- #
+
+def client_ip(scope, headers: Headers) -> str:
+    if TRUST_FORWARDED_FOR and headers.get("x-forwarded-for"):
+        return headers["x-forwarded-for"].split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def account_key(value: str) -> str:
+    # Hashed so raw identifiers never end up as Redis keys
+    return hashlib.sha256(value.strip().lower().encode()).hexdigest()[:32]
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, rules: list = None, store=None):
+        self.app = app
+        self.rules = RULES if rules is None else rules
+        self.store = store or create_store()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+
+        rule = next((r for r in self.rules if r.matches(scope["method"], scope["path"])), None)
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+
+        # ✅ Per-IP bucket
+        wait = await self.store.take(f"{rule.name}:ip:{client_ip(scope, headers)}", rule.per_ip)
+        if wait:
+            return await self._reject(send, wait)
+
+        # ✅ Per-account bucket (reads the form field without consuming the body)
+        if rule.per_account and rule.account_field:
+            body, receive = await self._buffer_form_body(headers, receive)
+            if body is not None:
+                values = parse_qs(body.decode("latin-1")).get(rule.account_field)
+                if values and values[0].strip():
+                    wait = await self.store.take(f"{rule.name}:acct:{account_key(values[0])}", rule.per_account)
+                    if wait:
+                        return await self._reject(send, wait)
+
+        await self.app(scope, receive, send)
+
+    async def _buffer_form_body(self, headers: Headers, receive):
+        """Returns (body or None, receive callable that replays it)."""
+        if not headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            return None, receive
+        content_length = headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_BUFFERED_BODY:
+            return None, receive
+
+        chunks, size, more_body = [], 0, True
+        messages = []
+        while more_body:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more_body = message.get("more_body", False)
+            if size > MAX_BUFFERED_BODY:
+                break
+
+        pending = list(messages)
+
+        async def replay_receive():
+            if pending:
+                return pending.pop(0)
+            return await receive()
+
+        body = b"".join(chunks) if not more_body else None
+        return body, replay_receive
+
+    async def _reject(self, send, wait: float):
+        retry_after = str(max(1, math.ceil(wait)))
+        body = json.dumps({"detail": "Too many requests. Please try again later."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", retry_after.encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
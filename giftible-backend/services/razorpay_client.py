@@ -1,36 +1,276 @@
-import razorpay
-import os
-from dotenv import load_dotenv
-import time  # ✅ Add this
-import hmac
+"""
+Async Razorpay client.
+
+Orders are created over one pooled aiohttp session per worker (keep-alive
+connections, bounded pool), with a per-call timeout and an overall deadline so a
+slow gateway cannot hold a checkout request open indefinitely.
+
+Razorpay has no idempotency header for orders, so every order carries a receipt
+derived from what is being paid for (see `cart_receipt`). Before a retry we look
+the receipt up on the gateway: if the timed-out attempt actually went through,
+that order is reused instead of creating a duplicate. Exact repeats (double
+clicks, client retries) are answered from a small per-worker memo. Once a
+checkout has been paid for, the caller moves on to the next receipt generation
+and evicts the old receipt from the memo, so a paid order is never handed out again.
+"""
+import asyncio
 import hashlib
+import hmac
+import os
+import random
+import threading
+import time
+import uuid
+
+from settings import PAYMENT_BACKEND
+from services.fakes import (
+    FakeRazorpayGateway, FAKE_RAZORPAY_KEY_ID, FAKE_RAZORPAY_KEY_SECRET, FAKE_RAZORPAY_WEBHOOK_SECRET,
+)
 
-# ✅ Load environment variables
-load_dotenv()
 
 # ✅ Environment Variables
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
+RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")  # Dashboard → Webhooks; not the API secret
+RAZORPAY_API_URL = os.getenv("RAZORPAY_API_URL", "https://api.razorpay.com/v1")
+RAZORPAY_TIMEOUT_SECONDS = float(os.getenv("RAZORPAY_TIMEOUT_SECONDS", 5))  # Per HTTP call
+RAZORPAY_CONNECT_TIMEOUT_SECONDS = float(os.getenv("RAZORPAY_CONNECT_TIMEOUT_SECONDS", 2))
+RAZORPAY_DEADLINE_SECONDS = float(os.getenv("RAZORPAY_DEADLINE_SECONDS", 10))  # All attempts together
+RAZORPAY_MAX_RETRIES = int(os.getenv("RAZORPAY_MAX_RETRIES", 2))
+RAZORPAY_POOL_SIZE = int(os.getenv("RAZORPAY_POOL_SIZE", 20))
+RAZORPAY_ORDER_MEMO_SECONDS = int(os.getenv("RAZORPAY_ORDER_MEMO_SECONDS", 900))
+
+RECEIPT_MAX_LENGTH = 40  # Razorpay limit
+RETRY_BACKOFF_SECONDS = 0.2
+ORDER_MEMO_MAX_KEYS = 10000
+
+if PAYMENT_BACKEND == "fake":
+    RAZORPAY_KEY_ID = RAZORPAY_KEY_ID or FAKE_RAZORPAY_KEY_ID
+    RAZORPAY_KEY_SECRET = RAZORPAY_KEY_SECRET or FAKE_RAZORPAY_KEY_SECRET
+    RAZORPAY_WEBHOOK_SECRET = RAZORPAY_WEBHOOK_SECRET or FAKE_RAZORPAY_WEBHOOK_SECRET
+
+
+class RazorpayError(Exception):
+    """The gateway rejected the request (4xx) or is misconfigured; retrying will not help."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class RazorpayUnavailableError(RazorpayError):
+    """Timeout, connection failure, 429 or 5xx: safe to retry."""
+
+
+# ---------------------------- #
+# 🌐 HTTP GATEWAY
+# ---------------------------- #
+
+class RazorpayGateway:
+    """Thin async wrapper over the Razorpay REST API; one instance (and pool) per worker."""
+
+    def __init__(self, key_id: str, key_secret: str, base_url: str = RAZORPAY_API_URL):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.base_url = base_url.rstrip("/")
+        self._session = None
+
+    def _get_session(self):
+        # Created on first use, inside the running event loop
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                base_url=self.base_url + "/",
+                auth=aiohttp.BasicAuth(self.key_id, self.key_secret),
+                connector=aiohttp.TCPConnector(limit=RAZORPAY_POOL_SIZE, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(total=RAZORPAY_TIMEOUT_SECONDS, connect=RAZORPAY_CONNECT_TIMEOUT_SECONDS),
+            )
+        return self._session
+
+    async def _request(self, method: str, path: str, timeout: float = None, **kwargs) -> dict:
+        import aiohttp
+
+        session = self._get_session()
+        call_timeout = aiohttp.ClientTimeout(
+            total=min(timeout or RAZORPAY_TIMEOUT_SECONDS, RAZORPAY_TIMEOUT_SECONDS),
+            connect=RAZORPAY_CONNECT_TIMEOUT_SECONDS,
+        )
+        try:
+            async with session.request(method, path.lstrip("/"), timeout=call_timeout, **kwargs) as response:
+                body = await response.json(content_type=None)
+                if response.status == 429 or response.status >= 500:
+                    raise RazorpayUnavailableError(f"Razorpay returned {response.status}", status=response.status)
+                if response.status >= 400:
+                    description = (body or {}).get("error", {}).get("description", "Request rejected")
+                    raise RazorpayError(description, status=response.status)
+                return body
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+            raise RazorpayUnavailableError(f"Razorpay unreachable: {e!r}")
+        except aiohttp.ContentTypeError as e:
+            raise RazorpayUnavailableError(f"Unexpected Razorpay response: {e!r}")
+
+    async def create_order(self, data: dict, timeout: float = None) -> dict:
+        return await self._request("POST", "/orders", timeout=timeout, json=data)
+
+    async def fetch_order(self, order_id: str, timeout: float = None) -> dict:
+        return await self._request("GET", f"/orders/{order_id}", timeout=timeout)
+
+    async def find_orders_by_receipt(self, receipt: str, timeout: float = None) -> list:
+        body = await self._request("GET", "/orders", timeout=timeout, params={"receipt": receipt})
+        return body.get("items", [])
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
 
-if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
-    raise ValueError("❌ Razorpay credentials are missing in the environment variables.")
+_gateway = None
+_gateway_lock = threading.Lock()
 
-# ✅ Initialize Razorpay Client
-client = razorpay.Client(auth=(os.getenv("RAZORPAY_KEY_ID"), os.getenv("RAZORPAY_KEY_SECRET")))
 
-def create_order(amount):
-    return client.order.create({
-        "amount": int(amount * 100),  # Amount in paise (e.g., ₹500 -> 50000)
+def get_gateway():
+    """Builds the gateway lazily so importing the app never fails on missing keys."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                if PAYMENT_BACKEND == "fake":
+                    _gateway = FakeRazorpayGateway(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+                else:
+                    if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
+                        raise RazorpayError("❌ Razorpay credentials are missing in the environment variables.")
+                    _gateway = RazorpayGateway(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET)
+    return _gateway
+
+
+async def close_gateway():
+    """Closes the connection pool (app shutdown)."""
+    if _gateway is not None:
+        await _gateway.close()
+
+
+# ---------------------------- #
+# 🧾 RECEIPTS
+# ---------------------------- #
+
+def cart_receipt(user_id: int, items: list, amount: float, generation: int = 0) -> str:
+    """
+    Stable receipt for "this user paying this amount for these cart lines":
+    the same checkout retried maps to the same receipt, a changed cart to a new one.
+    `items` is a list of (product_id, quantity). `generation` counts earlier checkouts
+    of the same cart that were already paid for (buying the same cart again).
+    """
+    fingerprint = f"{int(round(amount * 100))}|" + ",".join(f"{pid}x{qty}" for pid, qty in sorted(items))
+    digest = hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+    suffix = f"_{generation}" if generation else ""
+    return f"cart_{user_id}_{digest}{suffix}"[:RECEIPT_MAX_LENGTH]
+
+
+def random_receipt() -> str:
+    return f"rcpt_{uuid.uuid4().hex}"[:RECEIPT_MAX_LENGTH]
+
+
+# ---------------------------- #
+# 💳 ORDERS
+# ---------------------------- #
+
+_order_memo = {}  # receipt → (order, stored_at)
+_order_memo_lock = threading.Lock()
+
+
+def _remember_order(receipt: str, order: dict):
+    with _order_memo_lock:
+        _order_memo[receipt] = (order, time.monotonic())
+        if len(_order_memo) > ORDER_MEMO_MAX_KEYS:
+            for key, _ in sorted(_order_memo.items(), key=lambda item: item[1][1])[: len(_order_memo) // 2]:
+                del _order_memo[key]
+
+
+def _remembered_order(receipt: str, amount_paise: int) -> dict | None:
+    with _order_memo_lock:
+        entry = _order_memo.get(receipt)
+    if (
+        entry
+        and time.monotonic() - entry[1] < RAZORPAY_ORDER_MEMO_SECONDS
+        and entry[0]["amount"] == amount_paise
+        and entry[0].get("status") != "paid"  # ✅ Same rule as `_find_reusable_order`
+    ):
+        return entry[0]
+    return None
+
+
+def forget_orders(receipts):
+    """Evicts memoized orders whose checkout has been paid for or placed."""
+    with _order_memo_lock:
+        for receipt in receipts:
+            _order_memo.pop(receipt, None)
+
+
+async def _find_reusable_order(gateway, receipt: str, amount_paise: int, timeout: float) -> dict | None:
+    """An unpaid order already created for this receipt (e.g. by an attempt that timed out)."""
+    try:
+        orders = await gateway.find_orders_by_receipt(receipt, timeout=timeout)
+    except RazorpayUnavailableError:
+        return None
+    return next((o for o in orders if o["amount"] == amount_paise and o.get("status") != "paid"), None)
+
+
+async def create_order(amount: float, receipt: str = None, notes: dict = None) -> dict:
+    """
+    Creates (or reuses) a Razorpay order for `amount` rupees.
+    Raises RazorpayError on rejection, RazorpayUnavailableError once retries or the deadline run out.
+    """
+    receipt = receipt or random_receipt()
+    amount_paise = int(round(amount * 100))  # Amount in paise (e.g., ₹500 -> 50000)
+
+    remembered = _remembered_order(receipt, amount_paise)
+    if remembered:
+        return remembered
+
+    gateway = get_gateway()
+    payload = {
+        "amount": amount_paise,
         "currency": "INR",
-        "receipt": f"receipt_{int(time.time())}",  # Unique receipt ID
+        "receipt": receipt,
         "payment_capture": 1,
-    })
+        "notes": notes or {},
+    }
+
+    deadline = time.monotonic() + RAZORPAY_DEADLINE_SECONDS
+    last_error = None
+    for attempt in range(RAZORPAY_MAX_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
 
+        if attempt:
+            # ✅ The previous attempt may have reached Razorpay before timing out: reuse, don't duplicate
+            order = await _find_reusable_order(gateway, receipt, amount_paise, timeout=remaining)
+            if order:
+                _remember_order(receipt, order)
+                return order
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
 
+        try:
+            order = await gateway.create_order(payload, timeout=remaining)
+            _remember_order(receipt, order)
+            return order
+        except RazorpayUnavailableError as e:
+            print(f"⚠️ Razorpay order attempt {attempt + 1} failed: {e}")
+            last_error = e
 
+    raise last_error or RazorpayUnavailableError("Razorpay deadline exceeded")
 
 
 def verify_payment_signature(order_id: str, payment_id: str, signature: str):
+    if not RAZORPAY_KEY_SECRET:
+        raise ValueError("❌ Razorpay credentials are missing in the environment variables.")
     payload = f"{order_id}|{payment_id}".encode('utf-8')
     generated_signature = hmac.new(
         key=RAZORPAY_KEY_SECRET.encode('utf-8'),
@@ -41,8 +281,18 @@ def verify_payment_signature(order_id: str, payment_id: str, signature: str):
     print(f"✅ Generated Signature: {generated_signature}")
     print(f"✅ Received Signature: {signature}")
 
-    if generated_signature != signature:
+    if not hmac.compare_digest(generated_signature, signature):
         print("❌ Signature verification failed!")
         return False
     print("✅ Signature verified successfully!")
     return True
+
+
+def verify_webhook_signature(body: bytes, signature: str) -> bool:
+    """X-Razorpay-Signature is the hex HMAC-SHA256 of the raw request body with the webhook secret."""
+    if not RAZORPAY_WEBHOOK_SECRET:
+        raise ValueError("❌ RAZORPAY_WEBHOOK_SECRET is missing in the environment variables.")
+    if not signature:
+        return False
+    expected = hmac.new(RAZORPAY_WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
@@ -0,0 +1,250 @@
+"""
+Read-replica routing for reporting endpoints.
+
+Endpoints that only read (analytics, dashboards, sales, payout history) depend
+on `get_read_db` instead of `get_db`. It hands out a session on a replica from
+`REPLICA_DATABASE_URLS` unless:
+
+- no replica is configured, or none is fresh enough: a replica is used only
+  while the newest heartbeat it has replicated is at most
+  `REPLICA_MAX_STALENESS_SECONDS` old. The scheduler writes the heartbeat on
+  the primary every `REPLICA_HEARTBEAT_SECONDS` (an `entity_versions` row), so
+  this bounds how stale a report can be. A replica that is lagging or down falls
+  back to the primary.
+- the caller wrote something recently (read-your-writes): every commit that
+  changed rows marks the request's user (the JWT `sub`, recorded by
+  `ReadRoutingMiddleware`) as sticky to the primary for `REPLICA_STICKY_SECONDS`.
+
+Replica sessions are read-only; a flush on one raises.
+
+Sticky marks live in process memory by default, or in Redis
+(`READ_ROUTING_BACKEND=redis`) so every node sees them. To try it locally,
+point `REPLICA_DATABASE_URLS` at a second MySQL (or SQLite) database.
+"""
+import contextvars
+import itertools
+import os
+import threading
+import time
+from datetime import datetime
+
+import jwt
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+
+from database import SessionLocal, ReplicaSessionLocal, replica_engines
+from models import EntityVersion
+
+REPLICA_MAX_STALENESS_SECONDS = int(os.getenv("REPLICA_MAX_STALENESS_SECONDS", 30))
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", REPLICA_MAX_STALENESS_SECONDS))
+REPLICA_HEARTBEAT_SECONDS = int(os.getenv("REPLICA_HEARTBEAT_SECONDS", 5))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", 5))  # How long a lag reading is trusted
+READ_ROUTING_BACKEND = os.getenv("READ_ROUTING_BACKEND", "memory")  # memory | redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+HEARTBEAT = "replica_heartbeat"  # entity_versions tag
+MEMORY_STICKY_MAX_KEYS = 100_000
+
+# Session.info keys
+REPLICA_KEY = "read_replica"
+WROTE_KEY = "read_routing_wrote"
+
+_request_user = contextvars.ContextVar("request_user", default=None)
+
+
+# ---------------------------- #
+# 📌 STICKY USERS
+# ---------------------------- #
+
+class MemoryStickyStore:
+    def __init__(self):
+        self._until = {}
+        self._lock = threading.Lock()
+
+    def mark(self, key: str, seconds: int):
+        with self._lock:
+            self._until[key] = time.monotonic() + seconds
+            if len(self._until) > MEMORY_STICKY_MAX_KEYS:
+                now = time.monotonic()
+                self._until = {k: until for k, until in self._until.items() if until > now}
+
+    def contains(self, key: str) -> bool:
+        until = self._until.get(key)
+        return until is not None and until > time.monotonic()
+
+
+class RedisStickyStore:
+    def __init__(self, url: str = REDIS_URL):
+        import redis  # Only needed for the multi-node setup
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def mark(self, key: str, seconds: int):
+        self.client.set(f"rw:{key}", 1, ex=max(seconds, 1))
+
+    def contains(self, key: str) -> bool:
+        return bool(self.client.exists(f"rw:{key}"))
+
+
+_sticky = None
+_sticky_lock = threading.Lock()
+
+
+def get_sticky_store():
+    global _sticky
+    if _sticky is None:
+        with _sticky_lock:
+            if _sticky is None:
+                _sticky = RedisStickyStore() if READ_ROUTING_BACKEND == "redis" else MemoryStickyStore()
+    return _sticky
+
+
+def _is_sticky(key: str) -> bool:
+    try:
+        return get_sticky_store().contains(key)
+    except Exception as e:
+        print(f"⚠️ Read-routing store unavailable, reading from the primary: {e}")
+        return True  # Unknown → be safe
+
+
+# ---------------------------- #
+# 🩺 REPLICA FRESHNESS
+# ---------------------------- #
+
+_freshness = {}  # replica index → (checked_at monotonic, fresh)
+_round_robin = itertools.count()
+
+
+def _check_replica(index: int) -> bool:
+    db = ReplicaSessionLocal(bind=replica_engines[index])
+    try:
+        heartbeat = db.query(EntityVersion.updated_at).filter(EntityVersion.entity == HEARTBEAT).scalar()
+        if heartbeat is None:
+            return False
+        return (datetime.utcnow() - heartbeat).total_seconds() <= REPLICA_MAX_STALENESS_SECONDS
+    except Exception as e:
+        print(f"⚠️ Replica {index} unavailable: {e!r}")
+        return False
+    finally:
+        db.close()
+
+
+def _is_fresh(index: int) -> bool:
+    checked = _freshness.get(index)
+    if checked is None or time.monotonic() - checked[0] > REPLICA_CHECK_SECONDS:
+        checked = (time.monotonic(), _check_replica(index))
+        _freshness[index] = checked
+    return checked[1]
+
+
+def pick_replica():
+    """A replica engine within the staleness bound (round robin), or None."""
+    count = len(replica_engines)
+    start = next(_round_robin)
+    for offset in range(count):
+        index = (start + offset) % count
+        if _is_fresh(index):
+            return replica_engines[index]
+    return None
+
+
+def write_replica_heartbeat_task():
+    """Scheduler entry point: stamps the heartbeat on the primary for replicas to replicate."""
+    from services.versioning import bump_version
+
+    db = SessionLocal()
+    try:
+        bump_version(db, HEARTBEAT)
+        db.commit()
+    finally:
+        db.close()
+
+
+# ---------------------------- #
+# 🔀 DEPENDENCY
+# ---------------------------- #
+
+def get_read_db():
+    """Like `get_db`, for read-only endpoints: a fresh replica unless the caller wrote recently."""
+    engine = None
+    user = _request_user.get()
+    if replica_engines and not (user and _is_sticky(user)):
+        engine = pick_replica()
+
+    if engine is None:
+        db = SessionLocal()
+    else:
+        db = ReplicaSessionLocal(bind=engine)
+        db.info[REPLICA_KEY] = True
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ---------------------------- #
+# 🪝 HOOKS & MIDDLEWARE
+# ---------------------------- #
+
+@event.listens_for(Session, "before_flush")
+def _refuse_replica_writes(session, flush_context, instances):
+    if session.info.get(REPLICA_KEY):
+        raise RuntimeError("Replica sessions are read-only; use get_db for writes")
+
+
+@event.listens_for(Session, "after_flush")
+def _note_flush(session, flush_context):
+    session.info[WROTE_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_bulk_write(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info[WROTE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_writer_sticky(session):
+    if not session.info.pop(WROTE_KEY, False):
+        return
+    user = _request_user.get()
+    if user and replica_engines:
+        try:
+            get_sticky_store().mark(user, REPLICA_STICKY_SECONDS)
+        except Exception as e:
+            print(f"⚠️ Could not mark user {user} for read-your-writes: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_writes(session):
+    session.info.pop(WROTE_KEY, None)
+
+
+def _bearer_subject(headers: Headers) -> str | None:
+    """JWT `sub` of the request, unverified: it only picks a database, never grants access."""
+    authorization = headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        claims = jwt.decode(authorization[7:], options={"verify_signature": False, "verify_exp": False})
+    except jwt.PyJWTError:
+        return None
+    subject = claims.get("sub")
+    return str(subject) if subject is not None else None
+
+
+class ReadRoutingMiddleware:
+    """Pure ASGI: records who is calling, so commits can mark them for read-your-writes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_engines:
+            return await self.app(scope, receive, send)
+        token = _request_user.set(_bearer_subject(Headers(scope=scope)))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_user.reset(token)
@@ -0,0 +1,190 @@
+"""
+Precomputed "frequently bought together" recommendations.
+
+An offline job (the scheduler's `build_recommendations`, or
+`python -m services.recommendations`) reads the (order_id, product_id) pairs of
+`order_items`, leaving out cancelled lines and lines older than
+`RECOMMENDATION_WINDOW_DAYS`, into a binary order × product sparse matrix B.
+Bᵀ·B is the product co-occurrence matrix: entry (i, j) counts the orders that
+contain both i and j. For every product the `RECOMMENDATION_TOP_K` strongest
+neighbours are kept, ties broken by how often the neighbour sells at all, and
+written to `product_recommendations` in one transaction.
+
+`GET /products/{id}/related` reads those rows with one primary-key range scan
+(the table is clustered on product_id, rank) joined to products for liveness.
+Nothing is aggregated at request time.
+
+- Orders with more than `RECOMMENDATION_MAX_ORDER_LINES` distinct products
+  (bulk / corporate gifting) are skipped: each adds n² pairs and says little
+  about what goes together.
+- Pairs seen in fewer than `RECOMMENDATION_MIN_SUPPORT` orders are dropped.
+- A table rather than a memory-mapped array: every worker and host reads the
+  same result without shipping files around, and readers never see a half-written
+  rebuild.
+
+NumPy and SciPy are imported by the job only, so API workers never load them.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, joinedload
+
+from models import Order, OrderItem, Product, ProductRecommendation, UniversalUser
+from services.versioning import bump_version, RECOMMENDATIONS
+
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", 12))
+RECOMMENDATION_WINDOW_DAYS = int(os.getenv("RECOMMENDATION_WINDOW_DAYS", 365))
+RECOMMENDATION_MIN_SUPPORT = int(os.getenv("RECOMMENDATION_MIN_SUPPORT", 1))
+RECOMMENDATION_MAX_ORDER_LINES = int(os.getenv("RECOMMENDATION_MAX_ORDER_LINES", 50))
+RECOMMENDATION_INTERVAL_SECONDS = int(os.getenv("RECOMMENDATION_INTERVAL_SECONDS", 6 * 3600))
+
+FETCH_SIZE = 10000
+INSERT_BATCH_SIZE = 1000
+
+
+# ---------------------------- #
+# 🧮 CO-OCCURRENCE
+# ---------------------------- #
+
+def _load_order_lines(db: Session, since: datetime):
+    """Two int64 arrays (order ids, product ids), one entry per non-cancelled order line."""
+    import numpy as np
+
+    rows = (
+        db.query(OrderItem.order_id, OrderItem.product_id)
+        .join(Order, Order.id == OrderItem.order_id)
+        .filter(Order.created_at >= since, OrderItem.status != "Cancelled")
+        .execution_options(yield_per=FETCH_SIZE)  # ✅ Streamed: never one huge result set in memory
+    )
+    order_ids, product_ids = [], []
+    for order_id, product_id in rows:
+        order_ids.append(order_id)
+        product_ids.append(product_id)
+    return np.asarray(order_ids, dtype=np.int64), np.asarray(product_ids, dtype=np.int64)
+
+
+def top_neighbours(order_ids, product_ids, top_k: int = RECOMMENDATION_TOP_K,
+                   min_support: int = RECOMMENDATION_MIN_SUPPORT,
+                   max_order_lines: int = RECOMMENDATION_MAX_ORDER_LINES) -> list[dict]:
+    """
+    [{product_id, rank, related_product_id, score}] for every product bought
+    together with at least one other, strongest neighbour first.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    if len(order_ids) == 0:
+        return []
+
+    orders, order_index = np.unique(order_ids, return_inverse=True)
+    products, product_index = np.unique(product_ids, return_inverse=True)
+    basket = sparse.csr_matrix(
+        (np.ones(len(order_index), dtype=np.int32), (order_index, product_index)),
+        shape=(len(orders), len(products)),
+    )
+    basket.sum_duplicates()
+    basket.data[:] = 1  # ✅ Several lines of one product in an order count once
+
+    lines = np.diff(basket.indptr)
+    basket = basket[lines <= max_order_lines]
+    popularity = np.asarray(basket.sum(axis=0)).ravel()  # Orders per product, for tie-breaking
+    basket = basket[np.diff(basket.indptr) >= 2]  # Single-product orders pair nothing
+
+    together = (basket.T @ basket).tocsr()
+    together.setdiag(0)
+    together.data[together.data < min_support] = 0
+    together.eliminate_zeros()
+
+    rows = []
+    for column in range(together.shape[0]):
+        start, end = together.indptr[column], together.indptr[column + 1]
+        if start == end:
+            continue
+        neighbours = together.indices[start:end]
+        counts = together.data[start:end]
+        # lexsort: last key is primary → count desc, then popularity desc, then product id
+        best = np.lexsort((products[neighbours], -popularity[neighbours], -counts))[:top_k]
+        product_id = int(products[column])
+        rows.extend(
+            {
+                "product_id": product_id,
+                "rank": rank,
+                "related_product_id": int(products[neighbours[i]]),
+                "score": int(counts[i]),
+            }
+            for rank, i in enumerate(best, start=1)
+        )
+    return rows
+
+
+# ---------------------------- #
+# 🏗️ BUILD JOB
+# ---------------------------- #
+
+def build_recommendations(db: Session) -> dict:
+    """Recomputes every product's neighbours and replaces the table in one transaction. Commits."""
+    clock = time.monotonic()
+    since = datetime.utcnow() - timedelta(days=RECOMMENDATION_WINDOW_DAYS)
+    order_ids, product_ids = _load_order_lines(db, since)
+    rows = top_neighbours(order_ids, product_ids)
+
+    computed_at = datetime.utcnow()
+    for row in rows:
+        row["computed_at"] = computed_at
+
+    db.query(ProductRecommendation).delete(synchronize_session=False)
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.execute(insert(ProductRecommendation), rows[start:start + INSERT_BATCH_SIZE])
+    bump_version(db, RECOMMENDATIONS)
+    db.commit()
+
+    result = {
+        "order_lines": int(len(order_ids)),
+        "products": len({row["product_id"] for row in rows}),
+        "rows": len(rows),
+        "duration_ms": int((time.monotonic() - clock) * 1000),
+    }
+    print(f"🎁 Recommendations rebuilt: {result}")
+    return result
+
+
+def build_recommendations_task() -> dict:
+    """Background-task / scheduler entry point with its own session."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return build_recommendations(db)
+    finally:
+        db.close()
+
+
+# ---------------------------- #
+# 📖 READ PATH
+# ---------------------------- #
+
+def related_products(db: Session, product_id: int, limit: int = RECOMMENDATION_TOP_K) -> list[tuple[Product, int]]:
+    """[(product, score)] of live neighbours, strongest first; images, category and NGO eager-loaded."""
+    return (
+        db.query(Product, ProductRecommendation.score)
+        .join(Product, Product.id == ProductRecommendation.related_product_id)
+        .filter(
+            ProductRecommendation.product_id == product_id,
+            Product.is_approved == True,
+            Product.is_live == True,
+        )
+        .options(
+            joinedload(Product.images),
+            joinedload(Product.category),
+            joinedload(Product.universal_user).joinedload(UniversalUser.ngo),
+        )
+        .order_by(ProductRecommendation.rank)
+        .limit(limit)
+        .all()
+    )
+
+
+if __name__ == "__main__":
+    print(build_recommendations_task())
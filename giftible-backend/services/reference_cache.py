@@ -0,0 +1,148 @@
+"""
+Per-worker in-memory cache for slowly changing reference data.
+
+Approved categories, live coupons and approved NGOs change a few times a day
+but are read on every storefront page. Each set is held in memory as plain
+dicts together with the `entity_versions` stamp it was loaded at, and reloads
+only when that stamp moved.
+
+Each cache subscribes to its entity tag on the invalidation bus
+(services/invalidation_bus.py), which marks it stale as soon as any worker
+commits a change. While the bus is delivering, reads re-check the stamp only
+every `REFERENCE_CACHE_MAX_AGE_SECONDS` as a safety net; while it is not (not
+started, Redis and MySQL polls failing), they check at most every
+`REFERENCE_CACHE_CHECK_SECONDS` (one primary-key lookup) on their own. Right
+after an invalidation the short interval applies too: a request whose
+transaction snapshot predates the change may re-check first and see the old
+stamp.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from models import Category, Coupon, NGO, UniversalUser
+from services import invalidation_bus
+from services.versioning import get_versions, CATEGORIES, COUPONS, NGOS
+
+REFERENCE_CACHE_CHECK_SECONDS = float(os.getenv("REFERENCE_CACHE_CHECK_SECONDS", 2))
+REFERENCE_CACHE_MAX_AGE_SECONDS = float(os.getenv("REFERENCE_CACHE_MAX_AGE_SECONDS", 300))  # With a healthy bus
+SETTLE_SECONDS = 10  # Short re-checks after an invalidation, until older snapshots are gone
+
+
+class ReferenceCache:
+    """One cached set, loaded by `loader(db)` and keyed to an entity version."""
+
+    def __init__(self, entity: str, loader, check_seconds: float = REFERENCE_CACHE_CHECK_SECONDS):
+        self.entity = entity
+        self.loader = loader
+        self.check_seconds = check_seconds
+        self._value = None
+        self._version = None
+        self._checked_at = 0.0
+        self._invalidated_at = 0.0
+        self._lock = threading.Lock()
+        invalidation_bus.subscribe(entity, self.mark_stale)
+
+    def _is_current(self) -> bool:
+        if self._value is None:
+            return False
+        now = time.monotonic()
+        trust_bus = invalidation_bus.is_healthy() and now - self._invalidated_at > SETTLE_SECONDS
+        max_age = REFERENCE_CACHE_MAX_AGE_SECONDS if trust_bus else self.check_seconds
+        return now - self._checked_at < max_age
+
+    def get(self, db: Session):
+        if self._is_current():
+            return self._value  # ✅ Hot path: no DB access at all
+
+        with self._lock:
+            if self._is_current():
+                return self._value
+
+            # ✅ Read the version *before* the data: a concurrent change can only make us reload again, never miss it
+            version = get_versions(db, self.entity)[self.entity][0]
+            if self._value is None or version != self._version:
+                self._value = self.loader(db)
+                self._version = version
+            self._checked_at = time.monotonic()
+            return self._value
+
+    def mark_stale(self):
+        """Forces a version check on the next read (invalidation bus callback)."""
+        self._invalidated_at = time.monotonic()
+        self._checked_at = 0.0
+
+    def clear(self):
+        with self._lock:
+            self._value = None
+            self._version = None
+            self._checked_at = 0.0
+
+
+# ---------------------------- #
+# 📚 LOADERS (plain dicts only: ORM objects must not outlive their session)
+# ---------------------------- #
+
+def _load_approved_categories(db: Session) -> list[dict]:
+    rows = db.query(Category).filter(Category.is_approved == True).order_by(Category.id).all()
+    return [
+        {"id": c.id, "name": c.name, "description": c.description, "is_approved": c.is_approved}
+        for c in rows
+    ]
+
+
+def _load_live_coupons(db: Session) -> list[dict]:
+    rows = db.query(Coupon).filter(Coupon.is_active == True).order_by(Coupon.id).all()
+    return [
+        {
+            "id": c.id,
+            "code": c.code,
+            "discount_percentage": c.discount_percentage,
+            "max_discount": c.max_discount,
+            "usage_limit": c.usage_limit.value if hasattr(c.usage_limit, "value") else c.usage_limit,
+            "minimum_order_amount": c.minimum_order_amount,
+            "is_active": c.is_active,
+        }
+        for c in rows
+    ]
+
+
+def _load_approved_ngos(db: Session) -> list[dict]:
+    rows = (
+        db.query(NGO, UniversalUser)
+        .join(UniversalUser, UniversalUser.id == NGO.universal_user_id)
+        .filter(NGO.is_approved == True)
+        .order_by(NGO.id)
+        .all()
+    )
+    return [
+        {
+            "id": ngo.id,
+            "universal_user_id": ngo.universal_user_id,
+            "ngo_name": ngo.ngo_name,
+            "is_approved": ngo.is_approved,
+            "logo": ngo.logo,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "email": user.email,
+            "contact_number": user.contact_number,
+            "address": ngo.address,
+            "city": ngo.city,
+            "state": ngo.state,
+            "pincode": ngo.pincode,
+        }
+        for ngo, user in rows
+    ]
+
+
+approved_categories = ReferenceCache(CATEGORIES, _load_approved_categories)
+live_coupons = ReferenceCache(COUPONS, _load_live_coupons)
+approved_ngos = ReferenceCache(NGOS, _load_approved_ngos)
+
+CACHES_BY_ENTITY = {cache.entity: cache for cache in (approved_categories, live_coupons, approved_ngos)}
+
+
+def get_approved_category(db: Session, category_id: int) -> dict | None:
+    return next((c for c in approved_categories.get(db) if c["id"] == category_id), None)
@@ -0,0 +1,218 @@
+"""
+Refresh-token store: hashed, rotated, cheaply revocable.
+
+- Only a SHA-256 digest of each refresh token is stored (`token_hash`, fixed
+  width, unique index). The refresh path locks the row it finds there.
+- Every login starts a token *family* (`fam` claim). Each refresh marks the
+  presented token used and issues its successor in the same family. A used
+  token presented again after `REFRESH_REUSE_GRACE_SECONDS` means it was copied:
+  the whole family is revoked. Within the grace period (two tabs refreshing at
+  once, or a client that never received the successor) a sibling token is
+  issued in the same family, so the client always gets a live refresh token.
+- Revoked families go into a revocation set (`TOKEN_REVOCATION_BACKEND`: an
+  in-process set, or Redis keys shared by all nodes) that is checked right after
+  the JWT signature, before any MySQL query. Entries expire with the longest
+  refresh-token lifetime, so the set stays small.
+
+Used and expired rows are kept until they expire; the retention janitor removes them.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import jwt
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from models import RefreshToken
+
+REFRESH_SECRET_KEY = os.getenv("REFRESH_SECRET_KEY", "default_refresh_secret_key")
+ALGORITHM = "HS256"
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
+REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", 10))
+TOKEN_REVOCATION_BACKEND = os.getenv("TOKEN_REVOCATION_BACKEND", "memory")  # memory | redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+MEMORY_REVOCATION_MAX_KEYS = 100000
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+# ---------------------------- #
+# 🚫 REVOCATION SET
+# ---------------------------- #
+
+class MemoryRevocationSet:
+    """Revoked family ids for this process; expired entries are pruned when the set grows."""
+
+    def __init__(self):
+        self._expires = {}  # family_id → monotonic expiry
+        self._lock = threading.Lock()
+
+    def add(self, family_id: str, ttl_seconds: int):
+        with self._lock:
+            self._expires[family_id] = time.monotonic() + ttl_seconds
+            if len(self._expires) > MEMORY_REVOCATION_MAX_KEYS:
+                now = time.monotonic()
+                self._expires = {key: expiry for key, expiry in self._expires.items() if expiry > now}
+
+    def contains(self, family_id: str) -> bool:
+        expiry = self._expires.get(family_id)
+        return expiry is not None and expiry > time.monotonic()
+
+
+class RedisRevocationSet:
+    """Revoked family ids shared by every node, one expiring key each."""
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis  # Only needed for the multi-node setup
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    @staticmethod
+    def _key(family_id: str) -> str:
+        return f"revoked:family:{family_id}"
+
+    def add(self, family_id: str, ttl_seconds: int):
+        self.client.set(self._key(family_id), 1, ex=max(int(ttl_seconds), 1))
+
+    def contains(self, family_id: str) -> bool:
+        return bool(self.client.exists(self._key(family_id)))
+
+
+_revoked = None
+_revoked_lock = threading.Lock()
+
+
+def get_revocation_set():
+    global _revoked
+    if _revoked is None:
+        with _revoked_lock:
+            if _revoked is None:
+                _revoked = RedisRevocationSet() if TOKEN_REVOCATION_BACKEND == "redis" else MemoryRevocationSet()
+    return _revoked
+
+
+def _is_revoked(family_id: str) -> bool:
+    try:
+        return get_revocation_set().contains(family_id)
+    except Exception as e:
+        print(f"⚠️ Token revocation set unavailable, falling back to the database: {e}")
+        return False  # The DB rows are authoritative; the set is only a shortcut
+
+
+def _mark_revoked(family_ids):
+    ttl = REFRESH_TOKEN_EXPIRE_DAYS * 86400
+    for family_id in family_ids:
+        try:
+            get_revocation_set().add(family_id, ttl)
+        except Exception as e:
+            print(f"⚠️ Could not add family {family_id} to the revocation set: {e}")
+
+
+# ---------------------------- #
+# 🔁 ISSUE / ROTATE / REVOKE
+# ---------------------------- #
+
+def issue_refresh_token(db: Session, user_id: int, role: str, family_id: str = None) -> str:
+    """Creates a refresh token (a new family unless `family_id` is given) and stores its digest. Does not commit."""
+    family_id = family_id or uuid.uuid4().hex
+    expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    token = jwt.encode(
+        {"sub": str(user_id), "role": role, "fam": family_id, "jti": uuid.uuid4().hex, "exp": expires_at},
+        REFRESH_SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+    db.add(RefreshToken(
+        universal_user_id=user_id,
+        token_hash=hash_token(token),
+        family_id=family_id,
+        expires_at=expires_at,
+    ))
+    return token
+
+
+def _decode(token: str) -> dict:
+    try:
+        payload = jwt.decode(token, REFRESH_SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Refresh token expired.")
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid token.")
+    if not payload.get("fam") or not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="Invalid token.")  # Issued before token families
+    return payload
+
+
+def rotate_refresh_token(db: Session, token: str) -> tuple[dict, str]:
+    """
+    Validates `token` and replaces it with its successor. Returns (claims, new refresh token).
+    A repeat inside the reuse grace period gets a sibling of the successor. Commits.
+    """
+    payload = _decode(token)
+    family_id = payload["fam"]
+    if _is_revoked(family_id):
+        raise HTTPException(status_code=401, detail="Session has been revoked. Please log in again.")
+
+    entry = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.token_hash == hash_token(token))
+        .with_for_update()  # ✅ Concurrent refreshes of one token queue up here
+        .first()
+    )
+    if entry is None or str(entry.universal_user_id) != str(payload["sub"]) or entry.family_id != family_id:
+        raise HTTPException(status_code=401, detail="Invalid refresh token.")
+    if entry.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=401, detail="Refresh token expired.")
+
+    if entry.used_at is not None:
+        if entry.used_at >= datetime.utcnow() - timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+            # ✅ Another tab just rotated it, or the successor got lost on the way: issue a sibling
+            sibling = issue_refresh_token(db, entry.universal_user_id, payload.get("role"), family_id=family_id)
+            db.commit()
+            return payload, sibling
+        print(f"🚨 Refresh token reuse detected for user {entry.universal_user_id}; revoking family {family_id}")
+        revoke_family(db, family_id)
+        db.commit()
+        raise HTTPException(status_code=401, detail="Session has been revoked. Please log in again.")
+
+    entry.used_at = datetime.utcnow()
+    new_token = issue_refresh_token(db, entry.universal_user_id, payload.get("role"), family_id=family_id)
+    db.commit()
+    return payload, new_token
+
+
+def revoke_family(db: Session, family_id: str) -> int:
+    """Deletes every token of a family and adds it to the revocation set. Does not commit."""
+    deleted = db.query(RefreshToken).filter(RefreshToken.family_id == family_id).delete(synchronize_session=False)
+    _mark_revoked([family_id])
+    return deleted
+
+
+def revoke_refresh_token(db: Session, token: str) -> bool:
+    """Logs out the session `token` belongs to (its whole family). Commits."""
+    entry = (
+        db.query(RefreshToken.family_id)
+        .filter(RefreshToken.token_hash == hash_token(token))
+        .first()
+    )
+    if entry is None:
+        return False
+    revoke_family(db, entry.family_id)
+    db.commit()
+    return True
+
+
+def revoke_user_refresh_tokens(db: Session, user_id: int) -> int:
+    """Ends every session of a user (password reset, account deletion). Does not commit."""
+    family_ids = {
+        row.family_id for row in db.query(RefreshToken.family_id).filter(RefreshToken.universal_user_id == user_id)
+    }
+    deleted = db.query(RefreshToken).filter(RefreshToken.universal_user_id == user_id).delete(synchronize_session=False)
+    _mark_revoked(family_ids)
+    return deleted
@@ -0,0 +1,166 @@
+"""
+Retention janitor: keeps short-lived tables small.
+
+Rules (one per table, all driven by an index on the column they filter on):
+
+- refresh_tokens: rows past `expires_at` (used ones are kept until then for
+  reuse detection, see services/refresh_tokens.py);
+- password_reset_tokens: links past `expires_at`;
+- cart_items: lines untouched for `CART_ITEM_RETENTION_DAYS`;
+- carts: carts left without items, created more than `EMPTY_CART_GRACE_HOURS` ago.
+
+Each rule deletes at most `RETENTION_BATCH_SIZE` rows per transaction, sleeping
+`RETENTION_PAUSE_SECONDS` between batches so the auth and cart paths never wait
+long on locks, and stops after `RETENTION_MAX_BATCHES` so one run stays bounded.
+Per-table metrics (rows deleted, batches, duration) are returned and kept in
+`RETENTION_METRICS` for this process.
+
+Run `python -m services.retention` by hand or from cron.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import exists
+from sqlalchemy.orm import Session
+
+from models import RefreshToken, PasswordResetToken, Cart, CartItem
+
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 500))
+RETENTION_PAUSE_SECONDS = float(os.getenv("RETENTION_PAUSE_SECONDS", 0.1))
+RETENTION_MAX_BATCHES = int(os.getenv("RETENTION_MAX_BATCHES", 200))  # Per table per run
+CART_ITEM_RETENTION_DAYS = int(os.getenv("CART_ITEM_RETENTION_DAYS", 90))
+EMPTY_CART_GRACE_HOURS = int(os.getenv("EMPTY_CART_GRACE_HOURS", 24))
+
+RETENTION_METRICS = {}  # table → cumulative counters for this process
+_metrics_lock = threading.Lock()
+
+
+# ---------------------------- #
+# 📋 RULES
+# ---------------------------- #
+# A rule returns the ids of the next batch to delete, oldest first, walking the
+# index on its filter column.
+
+def _expired_refresh_tokens(db: Session, now: datetime, limit: int) -> list[int]:
+    rows = (
+        db.query(RefreshToken.id)
+        .filter(RefreshToken.expires_at < now)
+        .order_by(RefreshToken.expires_at)
+        .limit(limit)
+    )
+    return [row.id for row in rows]
+
+
+def _expired_reset_tokens(db: Session, now: datetime, limit: int) -> list[int]:
+    rows = (
+        db.query(PasswordResetToken.id)
+        .filter(PasswordResetToken.expires_at < now)
+        .order_by(PasswordResetToken.expires_at)
+        .limit(limit)
+    )
+    return [row.id for row in rows]
+
+
+def _stale_cart_items(db: Session, now: datetime, limit: int) -> list[int]:
+    cutoff = now - timedelta(days=CART_ITEM_RETENTION_DAYS)
+    rows = (
+        db.query(CartItem.id)
+        .filter(CartItem.updated_at < cutoff)
+        .order_by(CartItem.updated_at)
+        .limit(limit)
+    )
+    return [row.id for row in rows]
+
+
+def _empty_carts(db: Session, now: datetime, limit: int) -> list[int]:
+    cutoff = now - timedelta(hours=EMPTY_CART_GRACE_HOURS)
+    rows = (
+        db.query(Cart.id)
+        .filter(
+            (Cart.created_at < cutoff) | Cart.created_at.is_(None),  # Carts from before the column existed
+            ~exists().where(CartItem.cart_id == Cart.id),
+        )
+        .order_by(Cart.id)
+        .limit(limit)
+    )
+    return [row.id for row in rows]
+
+
+# (table, model, rule) in run order: cart lines go before the carts they may empty
+RETENTION_RULES = [
+    ("refresh_tokens", RefreshToken, _expired_refresh_tokens),
+    ("password_reset_tokens", PasswordResetToken, _expired_reset_tokens),
+    ("cart_items", CartItem, _stale_cart_items),
+    ("carts", Cart, _empty_carts),
+]
+
+
+# ---------------------------- #
+# 🧹 JANITOR
+# ---------------------------- #
+
+def _purge(db: Session, model, rule, batch_size: int) -> dict:
+    started = time.monotonic()
+    now = datetime.utcnow()
+    deleted = batches = 0
+    while batches < RETENTION_MAX_BATCHES:
+        ids = rule(db, now, batch_size)
+        if not ids:
+            break
+        if model is Cart:
+            # ✅ Re-check emptiness in the DELETE itself: an item may have been added since the SELECT
+            query = db.query(Cart).filter(Cart.id.in_(ids), ~exists().where(CartItem.cart_id == Cart.id))
+        else:
+            query = db.query(model).filter(model.id.in_(ids))
+        deleted += query.delete(synchronize_session=False)
+        db.commit()
+        batches += 1
+        if len(ids) < batch_size:
+            break
+        time.sleep(RETENTION_PAUSE_SECONDS)
+    return {"deleted": deleted, "batches": batches, "duration_ms": int((time.monotonic() - started) * 1000)}
+
+
+def _record(table: str, result: dict):
+    with _metrics_lock:
+        totals = RETENTION_METRICS.setdefault(table, {"deleted": 0, "batches": 0, "runs": 0})
+        totals["deleted"] += result["deleted"]
+        totals["batches"] += result["batches"]
+        totals["runs"] += 1
+        totals["last_run_at"] = datetime.utcnow().isoformat()
+        totals["last_deleted"] = result["deleted"]
+        totals["last_duration_ms"] = result["duration_ms"]
+
+
+def run_retention(db: Session, batch_size: int = RETENTION_BATCH_SIZE) -> dict:
+    """Applies every retention rule once; returns {table: {deleted, batches, duration_ms}}."""
+    results = {}
+    for table, model, rule in RETENTION_RULES:
+        try:
+            results[table] = _purge(db, model, rule, batch_size)
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Retention for {table} failed: {e}")
+            results[table] = {"deleted": 0, "batches": 0, "duration_ms": 0, "error": str(e)[:255]}
+        _record(table, results[table])
+        if results[table]["deleted"]:
+            print(f"🧹 Retention: {table} -{results[table]['deleted']} in {results[table]['batches']} batch(es), "
+                  f"{results[table]['duration_ms']} ms")
+    return results
+
+
+def run_retention_task() -> dict:
+    """Background-task / scheduler entry point with its own session."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return run_retention(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print(run_retention_task())
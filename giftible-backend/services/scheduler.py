@@ -0,0 +1,297 @@
+"""
+Built-in periodic job scheduler with a single leader across workers and hosts.
+
+Every app process (each uvicorn/gunicorn worker) starts one scheduler thread
+from `main.py`. Every `SCHEDULER_TICK_SECONDS` the thread tries to hold the
+lease row in `scheduler_leases`:
+
+- the holder renews it (`expires_at = now + SCHEDULER_LEASE_SECONDS`);
+- anyone else may take it over only once it has expired, with one conditional
+  UPDATE, so exactly one process wins and a dead leader is replaced after at
+  most one lease period.
+
+A lease row is used instead of MySQL `GET_LOCK` because an advisory lock
+belongs to one connection. That connection would have to be kept out of the
+pool for the process lifetime, and the lock would be lost silently whenever
+the connection drops. The lease works the same on any database.
+
+Each process creates the `scheduled_jobs` rows for its registered jobs on the
+first tick that reaches the database. Until then it does not contend for the
+lease. Only the leader runs due jobs, one after another, renewing the lease
+before each one. Each job's last start, duration, status, error and result, plus its
+run and failure counts, are kept in `scheduled_jobs` for the admin UI
+(`GET /admin/jobs`). A failing job backs off (up to 8x its interval). All
+registered jobs are also safe to run concurrently (they claim rows with
+SKIP LOCKED), so an overlap during a leader hand-over is harmless.
+
+`SCHEDULER_ENABLED=false` turns the thread off (e.g. when jobs run from cron).
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import ScheduledJob, SchedulerLease
+from settings import ORDER_INTAKE_MODE
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_TICK_SECONDS = float(os.getenv("SCHEDULER_TICK_SECONDS", 5))
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", 60))
+
+LEASE_NAME = "scheduler"
+MAX_BACKOFF_FACTOR = 8
+RESULT_MAX_LENGTH = 2000
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+JOBS = {}  # name → (func, interval_seconds)
+
+
+def register_job(name: str, func, interval_seconds: int):
+    """Adds a periodic job. `func` takes no arguments, opens its own session and returns something JSON-able."""
+    JOBS[name] = (func, int(os.getenv(f"JOB_{name.upper()}_SECONDS", interval_seconds)))
+
+
+def register_default_jobs():
+    from database import replica_engines
+    from services.deletion_jobs import resume_deletion_jobs_task, DELETION_POLL_SECONDS
+    from services.file_store import collect_orphans_task
+    from services.hot_stock import reconcile_hot_stock_task
+    from services.order_intake import process_intake_task
+    from services.payment_reconciliation import reconcile_payments_task, RECONCILE_INTERVAL_SECONDS
+    from services.read_routing import write_replica_heartbeat_task, REPLICA_HEARTBEAT_SECONDS
+    from services.recommendations import build_recommendations_task, RECOMMENDATION_INTERVAL_SECONDS
+    from services.retention import run_retention_task
+    from services.stock_reservations import release_expired_holds_task
+
+    register_job("reconcile_payments", reconcile_payments_task, RECONCILE_INTERVAL_SECONDS)
+    register_job("release_expired_holds", release_expired_holds_task, 60)
+    register_job("reconcile_hot_stock", reconcile_hot_stock_task, 10)
+    if ORDER_INTAKE_MODE == "queue":
+        register_job("process_intake", process_intake_task, 5)  # Backstop; dedicated `--loop` workers drain faster
+    register_job("collect_orphans", collect_orphans_task, 3600)
+    register_job("retention", run_retention_task, 3600)
+    register_job("resume_deletion_jobs", resume_deletion_jobs_task, DELETION_POLL_SECONDS)
+    register_job("build_recommendations", build_recommendations_task, RECOMMENDATION_INTERVAL_SECONDS)
+    if replica_engines:
+        register_job("replica_heartbeat", write_replica_heartbeat_task, REPLICA_HEARTBEAT_SECONDS)
+
+
+# ---------------------------- #
+# 👑 LEADER LEASE
+# ---------------------------- #
+
+def try_acquire_lease(db: Session) -> bool:
+    """Renews our lease or takes over an expired one. Commits."""
+    now = datetime.utcnow()
+    until = now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)
+
+    renewed = db.query(SchedulerLease).filter(
+        SchedulerLease.name == LEASE_NAME, SchedulerLease.holder == WORKER_ID
+    ).update({"expires_at": until}, synchronize_session=False)
+    if not renewed:
+        # ✅ Conditional takeover: only one contender's UPDATE can match the expired row
+        renewed = db.query(SchedulerLease).filter(
+            SchedulerLease.name == LEASE_NAME, SchedulerLease.expires_at < now
+        ).update({"holder": WORKER_ID, "expires_at": until, "acquired_at": now}, synchronize_session=False)
+        if renewed:
+            print(f"👑 Scheduler leadership taken by {WORKER_ID}")
+    if not renewed and db.query(SchedulerLease.name).filter(SchedulerLease.name == LEASE_NAME).first() is None:
+        db.add(SchedulerLease(name=LEASE_NAME, holder=WORKER_ID, expires_at=until, acquired_at=now))
+        try:
+            db.commit()
+            print(f"👑 Scheduler leadership taken by {WORKER_ID}")
+            return True
+        except IntegrityError:
+            db.rollback()  # Another worker inserted it first
+            return False
+    db.commit()
+    return bool(renewed)
+
+
+def release_lease(db: Session):
+    db.query(SchedulerLease).filter(
+        SchedulerLease.name == LEASE_NAME, SchedulerLease.holder == WORKER_ID
+    ).update({"expires_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
+
+# ---------------------------- #
+# 🏃 RUNNING JOBS
+# ---------------------------- #
+
+def sync_job_rows(db: Session) -> bool:
+    """Creates state rows for newly registered jobs and applies interval changes. Commits; False if it must be retried."""
+    existing = {job.name: job for job in db.query(ScheduledJob).filter(ScheduledJob.name.in_(list(JOBS)))}
+    for name, (_, interval) in JOBS.items():
+        if name not in existing:
+            db.add(ScheduledJob(name=name, interval_seconds=interval, next_run_at=datetime.utcnow()))
+        elif existing[name].interval_seconds != interval:
+            existing[name].interval_seconds = interval
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()  # Another worker created them: the next try sees their rows
+        return False
+
+
+def _result_json(result) -> str | None:
+    if result is None:
+        return None
+    text = json.dumps(result, default=str)
+    return text if len(text) <= RESULT_MAX_LENGTH else json.dumps(text[:RESULT_MAX_LENGTH - 100] + "…")
+
+
+def _run_job(db: Session, state: ScheduledJob, func):
+    started = datetime.utcnow()
+    state.last_started_at = started
+    state.last_status = "running"
+    state.last_runner = WORKER_ID
+    db.commit()
+
+    clock = time.monotonic()
+    try:
+        result = func()
+        state.last_status = "ok"
+        state.last_error = None
+        state.last_result = _result_json(result)
+        state.consecutive_failures = 0
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Scheduled job {state.name} failed: {e!r}")
+        state.last_status = "failed"
+        state.last_error = repr(e)[:255]
+        state.failure_count += 1
+        state.consecutive_failures += 1
+
+    state.last_duration_ms = int((time.monotonic() - clock) * 1000)
+    state.last_finished_at = datetime.utcnow()
+    state.run_count += 1
+    backoff = min(2 ** state.consecutive_failures, MAX_BACKOFF_FACTOR) if state.consecutive_failures else 1
+    state.next_run_at = started + timedelta(seconds=state.interval_seconds * backoff)
+    db.commit()
+
+
+def run_due_jobs(db: Session) -> int:
+    """Runs every job whose time has come; stops early if leadership is lost. Returns jobs run."""
+    ran = 0
+    for name, (func, _) in JOBS.items():
+        state = db.query(ScheduledJob).filter(ScheduledJob.name == name).first()
+        if state is None or not state.enabled or (state.next_run_at and state.next_run_at > datetime.utcnow()):
+            continue
+        if not try_acquire_lease(db):
+            print("⚠️ Scheduler lease lost; leaving remaining jobs to the new leader")
+            break
+        _run_job(db, state, func)
+        ran += 1
+    return ran
+
+
+_synced = False  # Job rows created for this process's registry
+
+
+def tick():
+    """One scheduler iteration with its own session."""
+    global _synced
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if not _synced:
+            # ✅ Retried every tick until it succeeds (e.g. the DB was not reachable at startup)
+            _synced = sync_job_rows(db)
+        if try_acquire_lease(db):
+            run_due_jobs(db)
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Scheduler tick failed: {e!r}")
+    finally:
+        db.close()
+
+
+# ---------------------------- #
+# 🧵 THREAD
+# ---------------------------- #
+
+_stop = threading.Event()
+_thread = None
+
+
+def _loop():
+    while not _stop.wait(SCHEDULER_TICK_SECONDS):
+        tick()
+
+
+def start_scheduler():
+    """Starts the scheduler thread for this process (called from the app lifespan)."""
+    global _thread
+    if not SCHEDULER_ENABLED or (_thread and _thread.is_alive()):
+        return
+    if not JOBS:
+        register_default_jobs()
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="giftible-scheduler", daemon=True)
+    _thread.start()
+
+
+def stop_scheduler(timeout: float = 10):
+    """Stops the thread and hands leadership over right away."""
+    if not _thread:
+        return
+    _stop.set()
+    _thread.join(timeout)
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        release_lease(db)
+    except Exception as e:
+        print(f"⚠️ Could not release scheduler lease: {e!r}")
+    finally:
+        db.close()
+
+
+def scheduler_status(db: Session) -> dict:
+    lease = db.query(SchedulerLease).filter(SchedulerLease.name == LEASE_NAME).first()
+    jobs = db.query(ScheduledJob).order_by(ScheduledJob.name).all()
+    return {
+        "worker": WORKER_ID,
+        "leader": {
+            "holder": lease.holder,
+            "expires_at": lease.expires_at.isoformat(),
+            "acquired_at": lease.acquired_at.isoformat() if lease.acquired_at else None,
+            "active": lease.expires_at > datetime.utcnow(),
+        } if lease else None,
+        "jobs": [
+            {
+                "name": job.name,
+                "enabled": job.enabled,
+                "interval_seconds": job.interval_seconds,
+                "next_run_at": job.next_run_at.isoformat() if job.next_run_at else None,
+                "last_started_at": job.last_started_at.isoformat() if job.last_started_at else None,
+                "last_duration_ms": job.last_duration_ms,
+                "last_status": job.last_status,
+                "last_error": job.last_error,
+                "last_result": json.loads(job.last_result) if job.last_result else None,
+                "last_runner": job.last_runner,
+                "run_count": job.run_count,
+                "failure_count": job.failure_count,
+                "consecutive_failures": job.consecutive_failures,
+            }
+            for job in jobs
+        ],
+    }
+
+
+if __name__ == "__main__":
+    # One leader-checked pass by hand (e.g. from cron with SCHEDULER_ENABLED=false on the app)
+    register_default_jobs()
+    tick()
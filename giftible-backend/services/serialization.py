@@ -0,0 +1,148 @@
+"""
+Fast JSON responses for listing endpoints.
+
+`FastJSONResponse` is the app-wide default response class (orjson instead of
+the stdlib encoder). Returning a dict from a route still goes through FastAPI's
+`jsonable_encoder` (and `response_model` validation); hot listings instead build
+plain dicts of JSON-native values from ORM rows with the helpers below and
+return `FastJSONResponse(payload)` directly, skipping both passes. Only use that
+shortcut for data we built ourselves from trusted DB rows.
+"""
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+def _default(obj):
+    # orjson handles datetime, date, enum, UUID and dataclasses natively
+    if isinstance(obj, Decimal):
+        return float(obj)  # e.g. AVG() results on MySQL
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+# ---------------------------- #
+# 📅 DATES
+# ---------------------------- #
+
+def iso_date(value):
+    """datetime → "YYYY-MM-DD" (same output as strftime("%Y-%m-%d"), without the format parsing)."""
+    return value.date().isoformat() if value else None
+
+
+def iso_day_start(value):
+    """
+    datetime → "YYYY-MM-DDT00:00:00": what the admin listings returned when a
+    strftime'd date was re-validated into a `datetime` response field.
+    """
+    return f"{value.date().isoformat()}T00:00:00" if value else None
+
+
+# ---------------------------- #
+# 🧱 ROW SERIALIZERS
+# ---------------------------- #
+
+def serialize_browse_product(product, average_rating) -> dict:
+    """One `/products/browse` item. Expects images, category and universal_user.ngo to be eager-loaded."""
+    owner = product.universal_user
+    ngo = owner.ngo
+    category = product.category
+    return {
+        "id": product.id,
+        "name": product.name,
+        "price": product.price,
+        "stock": product.stock,
+        "is_approved": product.is_approved,
+        "is_live": product.is_live,
+        "created_at": iso_date(product.created_at),
+        "average_rating": average_rating,
+        "category": {"id": category.id, "name": category.name} if category else None,
+        "ngo": {
+            "id": ngo.id,
+            "universal_user_id": owner.id,
+            "ngo_name": ngo.ngo_name,
+            "logo": ngo.logo,
+            "contact_number": owner.contact_number,
+            "email": owner.email,
+        } if ngo else None,
+        "images": [{"image_url": img.image_url} for img in product.images],
+    }
+
+
+def serialize_related_product(product, score) -> dict:
+    """One `/products/{id}/related` item (same eager-loading as `serialize_browse_product`)."""
+    ngo = product.universal_user.ngo
+    category = product.category
+    return {
+        "id": product.id,
+        "name": product.name,
+        "price": product.price,
+        "stock": product.stock,
+        "bought_together": score,  # Orders that contained both products
+        "category": {"id": category.id, "name": category.name} if category else None,
+        "ngo": {
+            "id": ngo.id,
+            "universal_user_id": product.universal_user_id,
+            "ngo_name": ngo.ngo_name,
+        } if ngo else None,
+        "images": [{"image_url": img.image_url} for img in product.images],
+    }
+
+
+def serialize_admin_ngo(ngo, user) -> dict:
+    """Same keys and order as `NGOResponse` for `/admin/ngos`."""
+    return {
+        "id": ngo.id,
+        "universal_user_id": ngo.universal_user_id,
+        "ngo_name": ngo.ngo_name,
+        "is_approved": ngo.is_approved,
+        "logo": None,
+        "license": None,
+        "account_holder_name": ngo.account_holder_name,
+        "account_number": ngo.account_number,
+        "ifsc_code": ngo.ifsc_code,
+        "address": ngo.address,
+        "city": ngo.city,
+        "state": ngo.state,
+        "pincode": ngo.pincode,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "contact_number": user.contact_number,
+        "created_at": iso_day_start(ngo.created_at),
+    }
+
+
+def serialize_admin_user(user) -> dict:
+    """Same keys and order as `UserResponse` for `/admin/users`."""
+    return {
+        "id": user.id,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "contact_number": user.contact_number,
+        "email_verified": bool(user.email_verified),
+        "contact_verified": bool(user.contact_verified),
+        "created_at": iso_day_start(user.created_at),
+    }
+
+
+def serialize_address(address) -> dict | None:
+    if not address:
+        return None
+    return {
+        "id": address.id,
+        "full_name": address.full_name,
+        "contact_number": address.contact_number,
+        "address_line": address.address_line,
+        "landmark": address.landmark,
+        "city": address.city,
+        "state": address.state,
+        "pincode": address.pincode,
+        "is_default": address.is_default,
+    }
@@ -1,5 +1,6 @@
-import boto3
 import os
+from settings import SMS_BACKEND
+from services.fakes import send_fake_sms
 
 def format_phone_number(phone_number: str) -> str:
     """
@@ -15,12 +16,16 @@ def format_phone_number(phone_number: str) -> str:
     return cleaned_number
 
 
-def send_reset_sms(phone_number: str, reset_link: str):
-    """
-    Sends an SMS with the password reset link using AWS SNS.
-    """
-    # Format the phone number
-    formatted_number = format_phone_number(phone_number)
+def _send_via_twilio(phone_number: str, message: str) -> str:
+    from twilio.rest import Client
+
+    client = Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+    sent = client.messages.create(body=message, from_=os.getenv("TWILIO_PHONE_NUMBER"), to=phone_number)
+    return sent.sid
+
+
+def _send_via_sns(phone_number: str, message: str) -> str:
+    import boto3
 
     sns_client = boto3.client(
         "sns",
@@ -28,13 +33,36 @@ def send_reset_sms(phone_number: str, reset_link: str):
         aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
         region_name=os.getenv("AWS_REGION", "us-east-1"),
     )
+    response = sns_client.publish(PhoneNumber=phone_number, Message=message)
+    return response["MessageId"]
+
+
+SMS_BACKENDS = {
+    "twilio": _send_via_twilio,
+    "sns": _send_via_sns,
+    "fake": send_fake_sms,
+}
+
 
+def send_sms(phone_number: str, message: str, provider: str = "twilio") -> str:
+    """
+    Sends an SMS and returns the provider message id.
+    `provider` is the live provider for this message type; `SMS_BACKEND` can override it globally.
+    """
+    backend = provider if SMS_BACKEND == "live" else SMS_BACKEND
+    if backend not in SMS_BACKENDS:
+        raise ValueError(f"Unknown SMS backend: {backend}")
+
+    return SMS_BACKENDS[backend](format_phone_number(phone_number), message)
+
+
+def send_reset_sms(phone_number: str, reset_link: str):
+    """
+    Sends an SMS with the password reset link using AWS SNS.
+    """
     try:
-        response = sns_client.publish(
-            PhoneNumber=formatted_number,
-            Message=f"Reset your password using the link: {reset_link}",
-        )
-        print(f"SMS sent successfully to {formatted_number}. Message ID: {response['MessageId']}")
+        message_id = send_sms(phone_number, f"Reset your password using the link: {reset_link}", provider="sns")
+        print(f"SMS sent successfully to {format_phone_number(phone_number)}. Message ID: {message_id}")
 
     except Exception as e:
         raise Exception(f"SMS sending failed: {e}")
@@ -0,0 +1,81 @@
+"""
+Cache-friendly static serving for /uploads.
+
+- Content-addressed files (hash in the name, see services/uploads.py) are served
+  with `Cache-Control: immutable` and a strong ETag derived from the content hash,
+  so browsers/CDNs never revalidate them.
+- Legacy files with stable names must be revalidated (`no-cache`) and get 304s.
+- Range requests are handled by Starlette's FileResponse.
+- Bodies can be offloaded to the front proxy (X-Accel-Redirect / X-Sendfile) or to
+  the ASGI server's `http.response.pathsend` extension so the worker never copies bytes.
+"""
+import os
+from mimetypes import guess_type
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from services.uploads import content_hash_from_name
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# 📤 e.g. UPLOADS_SENDFILE_HEADER=X-Accel-Redirect, UPLOADS_SENDFILE_PREFIX=/_uploads (nginx `internal` location)
+UPLOADS_SENDFILE_HEADER = os.getenv("UPLOADS_SENDFILE_HEADER")
+UPLOADS_SENDFILE_PREFIX = os.getenv("UPLOADS_SENDFILE_PREFIX", "/_uploads")
+
+
+class UploadFileResponse(FileResponse):
+    """FileResponse that lets the proxy or ASGI server send the file body when possible."""
+
+    def __init__(self, *args, relative_path: str = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.relative_path = relative_path
+
+    async def __call__(self, scope, receive, send):
+        request_headers = Headers(scope=scope)
+        is_simple_get = scope["method"].upper() == "GET" and "range" not in request_headers
+
+        if UPLOADS_SENDFILE_HEADER and self.relative_path is not None:
+            # ✅ Proxy streams the file with sendfile(); we only send headers
+            self.headers[UPLOADS_SENDFILE_HEADER] = f"{UPLOADS_SENDFILE_PREFIX.rstrip('/')}/{self.relative_path}"
+            self.headers["content-length"] = "0"
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if is_simple_get and "http.response.pathsend" in scope.get("extensions", {}):
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+            return
+
+        await super().__call__(scope, receive, send)
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with immutable caching and strong ETags."""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        content_hash = content_hash_from_name(os.fspath(full_path))
+        headers = {}
+
+        if content_hash:
+            headers["etag"] = f'"{content_hash}"'  # ✅ Strong: identical across servers and deploys
+            headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+
+        relative_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/") if self.directory else None
+        response = UploadFileResponse(
+            full_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=guess_type(os.fspath(full_path))[0],
+            stat_result=stat_result,
+            relative_path=relative_path,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,245 @@
+"""
+Time-limited stock holds for checkouts in flight.
+
+When a Razorpay order is created, the cart quantities are held for
+`STOCK_HOLD_MINUTES` (long enough for the Razorpay checkout). A hold is active
+while `expires_at` is in the future; available stock is `Product.stock` minus
+active holds, so during a popular drop only as many customers as there are units
+get to the payment step. Placing the order turns the hold into a sale (stock is
+decremented and the hold rows deleted in the same transaction).
+
+Expired rows no longer count, so correctness never waits on cleanup;
+`release_expired_holds` just deletes them in bulk (and returns hot-product units
+to their counters, see services/hot_stock.py). Run
+`python -m services.stock_reservations` to sweep by hand.
+"""
+import os
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Product, StockReservation
+from services.hot_stock import take_hot_stock, hot_available, release_hot_stock_on_commit
+
+STOCK_HOLD_MINUTES = int(os.getenv("STOCK_HOLD_MINUTES", 15))
+HOLD_SWEEP_BATCH_SIZE = int(os.getenv("HOLD_SWEEP_BATCH_SIZE", 1000))
+
+
+def held_quantities(db: Session, product_ids: list[int], exclude_receipt: str = None,
+                    exclude_razorpay_order_id: str = None, exclude_user_id: int = None) -> dict[int, int]:
+    """{product_id: quantity held by active reservations}, optionally ignoring the caller's own holds."""
+    if not product_ids:
+        return {}
+    query = db.query(StockReservation.product_id, func.sum(StockReservation.quantity)).filter(
+        StockReservation.product_id.in_(product_ids),
+        StockReservation.expires_at > datetime.utcnow(),
+    )
+    if exclude_receipt:
+        query = query.filter(StockReservation.receipt != exclude_receipt)
+    if exclude_razorpay_order_id:
+        query = query.filter(
+            (StockReservation.razorpay_order_id != exclude_razorpay_order_id) | StockReservation.razorpay_order_id.is_(None)
+        )
+    if exclude_user_id:
+        query = query.filter(StockReservation.universal_user_id != exclude_user_id)
+    return {product_id: int(held) for product_id, held in query.group_by(StockReservation.product_id).all()}
+
+
+def available_stock(db: Session, product: Product, exclude_user_id: int = None) -> int:
+    """Stock a customer can still buy right now."""
+    if product.is_hot:
+        return hot_available(product.id)
+    held = held_quantities(db, [product.id], exclude_user_id=exclude_user_id).get(product.id, 0)
+    return max(product.stock - held, 0)
+
+
+def reserve_stock(db: Session, receipt: str, user_id: int, lines: list[dict]) -> list[int]:
+    """
+    Holds `lines` for this checkout. Live holds already under the same receipt (a retried
+    or concurrent request for the same checkout) are updated in place and extended; lines
+    dropped from the cart lose theirs. The customer's holds for an earlier checkout (the
+    cart or amount changed, e.g. a coupon was applied after a first Pay click) are
+    replaced: one customer never competes with their own holds. Raises 409 if another
+    customer's holds or sales leave too little stock. Commits.
+    Returns the ids of the hold rows this call created (see `release_holds`).
+    Hot products (`Product.is_hot`) are admitted by their counter instead of a row lock.
+    """
+    quantities = {line["product_id"]: line["quantity"] for line in lines}
+    product_ids = sorted(quantities)  # ✅ Fixed lock order: concurrent checkouts cannot deadlock
+
+    try:
+        # ✅ This checkout's holds and the customer's older ones, locked before the products
+        previous = (
+            db.query(StockReservation)
+            .filter((StockReservation.receipt == receipt) | (StockReservation.universal_user_id == user_id))
+            .order_by(StockReservation.id)
+            .with_for_update()
+            .all()
+        )
+
+        meta = {row.id: row for row in db.query(Product.id, Product.name, Product.is_hot).filter(Product.id.in_(product_ids))}
+        for product_id in product_ids:
+            if product_id not in meta:
+                raise HTTPException(status_code=404, detail=f"Product with ID {product_id} not found")
+
+        cold_ids = [pid for pid in product_ids if not meta[pid].is_hot]
+        hot_ids = [pid for pid in product_ids if meta[pid].is_hot]
+
+        # ❄️ Regular products: lock the rows and subtract everyone else's active holds
+        if cold_ids:
+            products = {
+                p.id: p for p in db.query(Product).filter(Product.id.in_(cold_ids))
+                .order_by(Product.id).with_for_update().all()
+            }
+            held = held_quantities(db, cold_ids, exclude_receipt=receipt, exclude_user_id=user_id)
+            for product_id in cold_ids:
+                available = products[product_id].stock - held.get(product_id, 0)
+                if available < quantities[product_id]:
+                    raise HTTPException(status_code=409, detail=_sold_out_detail(meta[product_id].name, available))
+
+        previously_held = {}
+        for hold in previous:
+            previously_held[hold.product_id] = previously_held.get(hold.product_id, 0) + hold.quantity
+
+        # 🔥 Hot products: only the change against the customer's previous holds touches the counter
+        for product_id in hot_ids:
+            delta = quantities[product_id] - previously_held.pop(product_id, 0)
+            if delta > 0 and not take_hot_stock(db, product_id, delta):
+                raise HTTPException(status_code=409, detail=_sold_out_detail(meta[product_id].name, hot_available(product_id)))
+            if delta < 0:
+                release_hot_stock_on_commit(db, product_id, -delta)
+        for product_id, quantity in previously_held.items():  # Hot lines dropped from the cart
+            if product_id in meta and meta[product_id].is_hot:
+                release_hot_stock_on_commit(db, product_id, quantity)
+
+        # ✅ Update live holds in place: another request for this checkout may still be relying on them
+        now = datetime.utcnow()
+        expires_at = now + timedelta(minutes=STOCK_HOLD_MINUTES)
+        kept = {}
+        for hold in previous:
+            if (hold.receipt == receipt and hold.product_id in quantities and hold.product_id not in kept
+                    and hold.expires_at > now):
+                hold.quantity = quantities[hold.product_id]
+                hold.expires_at = expires_at
+                kept[hold.product_id] = hold
+            else:
+                db.delete(hold)  # Hot units were carried over or given back above
+        created = [
+            StockReservation(
+                receipt=receipt,
+                universal_user_id=user_id,
+                product_id=product_id,
+                quantity=quantities[product_id],
+                expires_at=expires_at,
+            )
+            for product_id in product_ids if product_id not in kept
+        ]
+        db.add_all(created)
+        db.commit()
+        return [hold.id for hold in created]
+    except Exception:
+        db.rollback()  # ✅ Also gives back any hot-stock units taken above
+        raise
+
+
+def _sold_out_detail(name: str, available: int) -> str:
+    return f"❌ Only {available} left of {name}" if available > 0 else f"❌ {name} is sold out"
+
+
+def attach_razorpay_order(db: Session, receipt: str, razorpay_order_id: str):
+    """Links the receipt's holds to the Razorpay order that will pay for them. Commits."""
+    db.query(StockReservation).filter(StockReservation.receipt == receipt).update(
+        {"razorpay_order_id": razorpay_order_id}, synchronize_session=False
+    )
+    db.commit()
+
+
+def _delete_holds(db: Session, holds: list):
+    """Deletes locked hold rows; hot products get their units back once the caller commits."""
+    hot_ids = {
+        row.id for row in db.query(Product.id).filter(
+            Product.id.in_({hold.product_id for hold in holds}), Product.is_hot == True
+        )
+    } if holds else set()
+    for hold in holds:
+        if hold.product_id in hot_ids:
+            release_hot_stock_on_commit(db, hold.product_id, hold.quantity)
+        db.delete(hold)
+
+
+def release_holds(db: Session, hold_ids: list[int]):
+    """
+    Drops the hold rows one request created (e.g. its Razorpay order could not be created).
+    Holds it only extended stay: a concurrent request for the same checkout owns them. Commits.
+    """
+    if not hold_ids:
+        return
+    holds = db.query(StockReservation).filter(StockReservation.id.in_(hold_ids)).with_for_update().all()
+    _delete_holds(db, holds)
+    db.commit()
+
+
+def lock_own_holds(db: Session, razorpay_order_id: str) -> dict[int, int]:
+    """
+    {product_id: quantity} held for this Razorpay order, with the rows locked so the
+    sweeper cannot release them while the order is being placed.
+    """
+    holds = (
+        db.query(StockReservation)
+        .filter(StockReservation.razorpay_order_id == razorpay_order_id)
+        .with_for_update()
+        .all()
+    )
+    held = {}
+    for hold in holds:
+        held[hold.product_id] = held.get(hold.product_id, 0) + hold.quantity
+    return held
+
+
+def consume_holds(db: Session, razorpay_order_id: str):
+    """Removes the holds converted into a sale. Does not commit: runs inside the order transaction."""
+    db.query(StockReservation).filter(StockReservation.razorpay_order_id == razorpay_order_id).delete(
+        synchronize_session=False
+    )
+
+
+def release_expired_holds(db: Session, batch_size: int = HOLD_SWEEP_BATCH_SIZE) -> int:
+    """Deletes expired holds in batches of `batch_size`; returns how many were removed."""
+    removed = 0
+    while True:
+        expired = (
+            db.query(StockReservation)
+            .filter(StockReservation.expires_at <= datetime.utcnow())
+            .order_by(StockReservation.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)  # ✅ Holds being turned into an order right now are skipped
+            .all()
+        )
+        if not expired:
+            break
+        _delete_holds(db, expired)
+        db.commit()
+        removed += len(expired)
+        if len(expired) < batch_size:
+            break
+
+    if removed:
+        print(f"🧹 Released {removed} expired stock hold(s)")
+    return removed
+
+
+def release_expired_holds_task():
+    """Background-task / scheduler entry point with its own session."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return release_expired_holds(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    release_expired_holds_task()
@@ -0,0 +1,420 @@
+"""
+Time-decayed trending and bestseller rankings, maintained incrementally.
+
+Two boards of exponentially decayed scores, updated as events happen instead of
+aggregating order history on every read:
+
+- `trending`: product views (`TRENDING_VIEW_WEIGHT` each) and ordered units
+  (`TRENDING_ORDER_WEIGHT` each), half-life `TRENDING_HALF_LIFE_HOURS`. Ranked
+  per product overall, per category and per NGO; powers
+  `/products/browse?sort=trending`.
+- `bestsellers`: units sold per product (overall and per NGO) and revenue per
+  NGO and per category, half-life `BESTSELLER_HALF_LIFE_DAYS`. With the shared
+  Redis store it also feeds the `recent_*` lists (field `sales_score`) of the
+  admin / NGO dashboards and analytics. A per-worker memory store would show
+  each worker's own view, so those lists stay empty then. The all-time totals
+  on those pages always come from SQL.
+
+Scores use forward decay: an event of weight w at time t adds
+w·2^((t − E)/H) to its member, where E is the start of the current period and H
+the half-life, so nothing already stored ever has to be rescaled and the order
+of members is always the order of their decayed scores. The current score is
+stored·2^(−(now − E)/H). Every `PERIOD_HALF_LIVES` half-lives a new period
+starts, and the previous period's sets are carried over once, scaled by
+2^(−PERIOD_HALF_LIVES), so the stored numbers stay small.
+
+Each set keeps its strongest `TRENDING_MAX_MEMBERS` members (trimmed once it
+holds twice as many). Sales are applied after the order transaction commits, and
+cancellations subtract exactly what the sale added. A store that starts empty
+(a new worker with the memory backend, a fresh Redis) is warmed from the paid
+order lines of the last `WARM_HALF_LIVES` half-lives. Views are not persisted,
+so they start from zero.
+
+Backends: "memory" (default, per worker) or "redis" (`TRENDING_BACKEND=redis`,
+sorted sets shared by every node). Rankings are best effort: a store error is
+logged and never fails the request that recorded or read it.
+"""
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+from operator import itemgetter
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Category, NGO, Order, OrderItem, Product
+
+TRENDING_BACKEND = os.getenv("TRENDING_BACKEND", "memory")  # memory | redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", 24))
+BESTSELLER_HALF_LIFE_DAYS = float(os.getenv("BESTSELLER_HALF_LIFE_DAYS", 30))
+TRENDING_VIEW_WEIGHT = float(os.getenv("TRENDING_VIEW_WEIGHT", 1))
+TRENDING_ORDER_WEIGHT = float(os.getenv("TRENDING_ORDER_WEIGHT", 10))  # Per unit ordered
+TRENDING_MAX_MEMBERS = int(os.getenv("TRENDING_MAX_MEMBERS", 500))  # Kept per set
+RANKINGS_SHARED = TRENDING_BACKEND == "redis"  # One view for every worker: safe to show on dashboards
+
+MIN_STORED_SCORE = 1e-6  # Below this a member is gone (float residue of a sale minus its cancellation)
+PERIOD_HALF_LIVES = 16  # Stored scores grow at most 2^16 before the next carry-over
+WARM_HALF_LIVES = 5  # Older events add less than 1/32 of their weight
+WARM_FETCH_SIZE = 10000
+
+# 🏷️ Boards
+TRENDING = "trending"
+BESTSELLERS = "bestsellers"
+HALF_LIFE_SECONDS = {
+    TRENDING: TRENDING_HALF_LIFE_HOURS * 3600,
+    BESTSELLERS: BESTSELLER_HALF_LIFE_DAYS * 86400,
+}
+
+# Session.info key: sales / cancellations applied once the transaction commits
+SALES_KEY = "trending_sales"
+
+
+def product_scope(category_id: int = None, ngo_user_id: int = None) -> str:
+    """Set name of a product ranking: overall, per category or per NGO (its universal_user_id)."""
+    if category_id is not None:
+        return f"products:category:{category_id}"
+    if ngo_user_id is not None:
+        return f"products:ngo:{ngo_user_id}"
+    return "products"
+
+
+NGO_REVENUE = "ngos"  # bestsellers: members are NGO universal_user_ids
+CATEGORY_REVENUE = "categories"  # bestsellers: members are category ids
+
+
+# ---------------------------- #
+# 🗄️ RANKING STORES
+# ---------------------------- #
+
+class MemoryRankingStore:
+    """Per-process sets {key: {member: stored score}} behind one lock."""
+
+    def __init__(self):
+        self._sets = {}
+        self._flags = set()
+        self._lock = threading.Lock()
+
+    def add(self, increments, ttl_seconds: int):
+        with self._lock:
+            for key, member, amount in increments:
+                members = self._sets.setdefault(key, {})
+                score = members.get(member, 0.0) + amount
+                if score > MIN_STORED_SCORE:
+                    members[member] = score
+                else:
+                    members.pop(member, None)
+                if len(members) > 2 * TRENDING_MAX_MEMBERS:
+                    self._sets[key] = dict(heapq.nlargest(TRENDING_MAX_MEMBERS, members.items(), key=itemgetter(1)))
+
+    def top(self, key: str, limit: int) -> list[tuple[int, float]]:
+        with self._lock:
+            members = self._sets.get(key)
+            return heapq.nlargest(limit, members.items(), key=itemgetter(1)) if members else []
+
+    def claim(self, flag: str, ttl_seconds: int) -> bool:
+        """True for the first caller only (warm-up / carry-over guard)."""
+        with self._lock:
+            if flag in self._flags:
+                return False
+            self._flags.add(flag)
+            return True
+
+    def carry_over(self, old_prefix: str, new_prefix: str, factor: float, ttl_seconds: int):
+        with self._lock:
+            for key in [key for key in self._sets if key.startswith(old_prefix)]:
+                old = self._sets.pop(key)
+                new = self._sets.setdefault(new_prefix + key[len(old_prefix):], {})
+                for member, score in old.items():
+                    new[member] = new.get(member, 0.0) + score * factor
+
+
+class RedisRankingStore:
+    """Sorted sets shared by every node; one pipeline per event."""
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis  # Only needed for the multi-node setup
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def add(self, increments, ttl_seconds: int):
+        pipe = self.client.pipeline(transaction=False)
+        for key, member, amount in increments:
+            pipe.zincrby(key, amount, member)
+        for key in {key for key, _, _ in increments}:
+            pipe.zremrangebyscore(key, "-inf", MIN_STORED_SCORE)  # Fully cancelled members
+            pipe.zremrangebyrank(key, 0, -(TRENDING_MAX_MEMBERS + 1))
+            pipe.expire(key, ttl_seconds)
+        pipe.execute()
+
+    def top(self, key: str, limit: int) -> list[tuple[int, float]]:
+        return [(int(member), score) for member, score in self.client.zrevrange(key, 0, limit - 1, withscores=True)]
+
+    def claim(self, flag: str, ttl_seconds: int) -> bool:
+        return bool(self.client.set(flag, 1, nx=True, ex=ttl_seconds))
+
+    def carry_over(self, old_prefix: str, new_prefix: str, factor: float, ttl_seconds: int):
+        for old_key in self.client.scan_iter(match=f"{old_prefix}*", count=500):
+            old_key = old_key.decode()
+            new_key = new_prefix + old_key[len(old_prefix):]
+            # ✅ Merges with whatever was already written to the new period
+            self.client.zunionstore(new_key, {new_key: 1, old_key: factor})
+            self.client.expire(new_key, ttl_seconds)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RedisRankingStore() if TRENDING_BACKEND == "redis" else MemoryRankingStore()
+    return _store
+
+
+# ---------------------------- #
+# ⏳ PERIODS & DECAY
+# ---------------------------- #
+
+_ready_periods = set()  # (board, period) carried over / checked in this process
+
+
+def _period(board: str, now: float) -> tuple[int, float]:
+    """(period number, period start) of `board` at `now` (epoch seconds)."""
+    length = HALF_LIFE_SECONDS[board] * PERIOD_HALF_LIVES
+    period = int(now // length)
+    return period, period * length
+
+
+def _prefix(board: str, period: int) -> str:
+    return f"rank:{board}:{period}:"
+
+
+def _ttl(board: str) -> int:
+    return int(HALF_LIFE_SECONDS[board] * PERIOD_HALF_LIVES * 2)
+
+
+def _ensure_period(board: str, period: int):
+    if (board, period) in _ready_periods:
+        return
+    store = get_store()
+    if store.claim(f"rank-carried:{board}:{period}", _ttl(board)):  # Outside the `rank:` prefix carry-over scans
+        store.carry_over(_prefix(board, period - 1), _prefix(board, period), 2.0 ** -PERIOD_HALF_LIVES, _ttl(board))
+    _ready_periods.add((board, period))
+
+
+def _epoch(at: datetime) -> float:
+    return (at - datetime(1970, 1, 1)).total_seconds()  # Naive UTC, like every timestamp we store
+
+
+# ---------------------------- #
+# ✍️ RECORDING
+# ---------------------------- #
+
+def _product_scopes(category_id, ngo_user_id) -> list[str]:
+    scopes = [product_scope()]
+    if category_id is not None:
+        scopes.append(product_scope(category_id=category_id))
+    if ngo_user_id is not None:
+        scopes.append(product_scope(ngo_user_id=ngo_user_id))
+    return scopes
+
+
+def _sale_increments(product_id, category_id, ngo_user_id, quantity, revenue) -> list[tuple]:
+    """[(board, set, member, weight)] for `quantity` units (negative for a cancellation)."""
+    increments = [
+        (TRENDING, scope, product_id, TRENDING_ORDER_WEIGHT * quantity)
+        for scope in _product_scopes(category_id, ngo_user_id)
+    ]
+    increments += [
+        (BESTSELLERS, scope, product_id, quantity)
+        for scope in _product_scopes(None, ngo_user_id)
+    ]
+    if ngo_user_id is not None:
+        increments.append((BESTSELLERS, NGO_REVENUE, ngo_user_id, revenue))
+    if category_id is not None:
+        increments.append((BESTSELLERS, CATEGORY_REVENUE, category_id, revenue))
+    return increments
+
+
+def _apply(events, now: float = None):
+    """events: [(epoch seconds the event happened, [(board, set, member, weight)])]"""
+    now = now or time.time()
+    by_board = {}
+    for board in HALF_LIFE_SECONDS:
+        period, start = _period(board, now)
+        _ensure_period(board, period)
+        by_board[board] = (_prefix(board, period), start, HALF_LIFE_SECONDS[board])
+
+    increments = []
+    for at, entries in events:
+        for board, scope, member, weight in entries:
+            prefix, start, half_life = by_board[board]
+            increments.append((prefix + scope, member, weight * 2.0 ** ((at - start) / half_life)))
+    if increments:
+        get_store().add(increments, max(_ttl(board) for board in HALF_LIFE_SECONDS))
+
+
+def _safely(operation, *args):
+    try:
+        _ensure_warm()
+        return operation(*args)
+    except Exception as e:
+        print(f"⚠️ Rankings unavailable: {e!r}")
+        return None
+
+
+def record_view(product: Product):
+    """A product page was viewed."""
+    entries = [
+        (TRENDING, scope, product.id, TRENDING_VIEW_WEIGHT)
+        for scope in _product_scopes(product.category_id, product.universal_user_id)
+    ]
+    _safely(_apply, [(time.time(), entries)])
+
+
+def record_sale_on_commit(db: Session, product: Product, quantity: int, revenue: float, ordered_at: datetime = None):
+    """Counts an order line (now, or at `ordered_at` for a restored one) once `db` commits. Does not commit."""
+    db.info.setdefault(SALES_KEY, []).append(
+        (_epoch(ordered_at) if ordered_at else None,
+         _sale_increments(product.id, product.category_id, product.universal_user_id, quantity, revenue))
+    )
+
+
+def record_cancellation_on_commit(db: Session, product: Product, quantity: int, revenue: float, ordered_at: datetime):
+    """Takes back exactly what the sale at `ordered_at` added, once `db` commits. Does not commit."""
+    db.info.setdefault(SALES_KEY, []).append(
+        (_epoch(ordered_at) if ordered_at else None,
+         _sale_increments(product.id, product.category_id, product.universal_user_id, -quantity, -revenue))
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_recorded_sales(session):
+    if session.in_nested_transaction():
+        return  # A SAVEPOINT release is not the commit
+    sales = session.info.pop(SALES_KEY, None)
+    if sales:
+        now = time.time()
+        _safely(_apply, [(at or now, entries) for at, entries in sales], now)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_recorded_sales(session):
+    if not session.in_nested_transaction():
+        session.info.pop(SALES_KEY, None)
+
+
+# ---------------------------- #
+# 🔥 WARM-UP
+# ---------------------------- #
+
+_warm = False
+_warm_lock = threading.Lock()
+
+
+def warm_from_orders(db: Session) -> int:
+    """Replays the paid, non-cancelled order lines of the last WARM_HALF_LIVES half-lives. Returns lines applied."""
+    now = time.time()
+    horizon = {board: now - WARM_HALF_LIVES * half_life for board, half_life in HALF_LIFE_SECONDS.items()}
+    rows = (
+        db.query(
+            OrderItem.product_id, OrderItem.quantity, OrderItem.price,
+            Product.category_id, Product.universal_user_id, Order.created_at,
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .join(Product, Product.id == OrderItem.product_id)
+        .filter(
+            Order.payment_id.isnot(None),
+            OrderItem.status != "Cancelled",
+            Order.created_at >= datetime.utcfromtimestamp(min(horizon.values())),
+        )
+        .execution_options(yield_per=WARM_FETCH_SIZE)
+    )
+    events, applied = [], 0
+    for row in rows:
+        at = _epoch(row.created_at)
+        entries = _sale_increments(row.product_id, row.category_id, row.universal_user_id, row.quantity,
+                                   row.price * row.quantity)
+        events.append((at, [entry for entry in entries if at >= horizon[entry[0]]]))
+        if len(events) >= WARM_FETCH_SIZE:
+            _apply(events, now)
+            applied += len(events)
+            events = []
+    _apply(events, now)
+    return applied + len(events)
+
+
+def _ensure_warm():
+    global _warm
+    if _warm:
+        return
+    with _warm_lock:
+        if _warm:
+            return
+        # ✅ One replay per store: per process for memory, once for a shared Redis
+        if get_store().claim("rank-warmed", _ttl(BESTSELLERS)):
+            from database import SessionLocal
+
+            db = SessionLocal()
+            try:
+                print(f"🔥 Rankings warmed from {warm_from_orders(db)} order line(s)")
+            finally:
+                db.close()
+        _warm = True
+
+
+# ---------------------------- #
+# 🏆 READING
+# ---------------------------- #
+
+def top(board: str, scope: str, limit: int) -> list[tuple[int, float]]:
+    """[(member id, current decayed score)], strongest first; [] if the store is unavailable."""
+    def read():
+        now = time.time()
+        period, start = _period(board, now)
+        _ensure_period(board, period)
+        decay = 2.0 ** (-(now - start) / HALF_LIFE_SECONDS[board])
+        return [(int(member), score * decay) for member, score in get_store().top(_prefix(board, period) + scope, limit)]
+
+    return _safely(read) or []
+
+
+def trending_product_ids(category_ids: list = None, ngo_ids: list = None, limit: int = TRENDING_MAX_MEMBERS) -> list[int]:
+    """Product ids by trending score, from the narrowest single-category / single-NGO set that applies."""
+    if category_ids and len(category_ids) == 1:
+        scope = product_scope(category_id=category_ids[0])
+    elif ngo_ids and len(ngo_ids) == 1:
+        scope = product_scope(ngo_user_id=ngo_ids[0])
+    else:
+        scope = product_scope()
+    return [product_id for product_id, _ in top(TRENDING, scope, limit)]
+
+
+def _named(db: Session, ranked, id_column, name_column) -> list[tuple[str, float]]:
+    """[(name, score)] in rank order; one primary-key IN lookup, members that no longer exist are skipped."""
+    if not ranked:
+        return []
+    names = dict(db.query(id_column, name_column).filter(id_column.in_([member for member, _ in ranked])).all())
+    return [(names[member], score) for member, score in ranked if member in names]
+
+
+def top_selling_products(db: Session, limit: int = 5, ngo_user_id: int = None) -> list[tuple[str, float]]:
+    """[(product name, decayed units sold)] overall or for one NGO."""
+    ranked = top(BESTSELLERS, product_scope(ngo_user_id=ngo_user_id), limit)
+    return _named(db, ranked, Product.id, Product.name)
+
+
+def top_ngos_by_revenue(db: Session, limit: int = 5) -> list[tuple[str, float]]:
+    """[(NGO name, decayed revenue)]"""
+    return _named(db, top(BESTSELLERS, NGO_REVENUE, limit), NGO.universal_user_id, NGO.ngo_name)
+
+
+def top_categories_by_revenue(db: Session, limit: int = 5) -> list[tuple[str, float]]:
+    """[(category name, decayed revenue)]"""
+    return _named(db, top(BESTSELLERS, CATEGORY_REVENUE, limit), Category.id, Category.name)
@@ -0,0 +1,269 @@
+"""
+Content-addressed storage for uploaded files.
+
+Files are stored under a name derived from the SHA-256 of their content, so a
+URL never changes meaning: re-uploading different bytes produces a new URL and
+the old one can be cached forever (see services/static_files.py).
+
+Uploads are streamed to a temp file in chunks without blocking the event loop,
+checked against per-file / per-request size caps and sniffed by their leading
+bytes, then atomically renamed into place. Multi-file requests are written in
+parallel.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import anyio
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+
+UPLOAD_ROOT = "uploads"
+HASH_LENGTH = 32  # Hex chars of the SHA-256 kept in file names (128 bits)
+CHUNK_SIZE = 256 * 1024
+
+# 📏 Size caps
+MB = 1024 * 1024
+MAX_UPLOAD_FILE_BYTES = int(float(os.getenv("MAX_UPLOAD_FILE_MB", 5)) * MB)
+MAX_UPLOAD_REQUEST_BYTES = int(float(os.getenv("MAX_UPLOAD_REQUEST_MB", 25)) * MB)
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # Boundaries + text form fields on top of the file bytes
+
+# 🧾 Allowed formats (by extension, confirmed by magic bytes)
+IMAGE_TYPES = {"jpg", "jpeg", "png", "webp", "gif"}
+DOCUMENT_TYPES = IMAGE_TYPES | {"pdf"}
+
+MAGIC_SIGNATURES = (
+    (b"\xff\xd8\xff", {"jpg", "jpeg"}),
+    (b"\x89PNG\r\n\x1a\n", {"png"}),
+    (b"GIF87a", {"gif"}),
+    (b"GIF89a", {"gif"}),
+    (b"%PDF-", {"pdf"}),
+)
+
+# Matches "<hash>.ext" and "<stem>-<hash>.ext"
+HASHED_NAME_RE = re.compile(r"(?:^|[-_])([0-9a-f]{%d})\.[A-Za-z0-9]+$" % HASH_LENGTH)
+
+
+# Same bytes must map to the same name regardless of how the client spelled the extension
+CANONICAL_EXTENSIONS = {"jpeg": "jpg"}
+
+
+def file_extension(filename: str) -> str:
+    """Lower-cased extension without the dot ("bin" when there is none)."""
+    if not filename or "." not in filename:
+        return "bin"
+    return filename.rsplit(".", 1)[-1].lower()
+
+
+def content_hash_from_name(filename: str) -> str | None:
+    """Returns the content hash embedded in a stored file name, if any."""
+    match = HASHED_NAME_RE.search(os.path.basename(filename))
+    return match.group(1) if match else None
+
+
+def hashed_filename(digest: str, extension: str, stem: str = None) -> str:
+    short_hash = digest[:HASH_LENGTH]
+    return f"{stem}-{short_hash}.{extension}" if stem else f"{short_hash}.{extension}"
+
+
+def sniff_extension(head: bytes) -> set[str]:
+    """Extensions compatible with the file's leading bytes (empty set if unknown)."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return {"webp"}
+    for signature, extensions in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return extensions
+    return set()
+
+
+def _commit_temp_file(tmp_path: str, path: str):
+    """Moves a finished temp file into place, or drops it when identical content is already stored."""
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        os.utime(path)  # ✅ Fresh mtime tells the orphan collector this file is in use again
+    else:
+        os.replace(tmp_path, path)  # ✅ Atomic
+
+
+class UploadBudget:
+    """Tracks bytes written across all files of one request."""
+
+    def __init__(self, limit: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.limit = limit
+        self.used = 0
+
+    def consume(self, size: int):
+        self.used += size
+        if self.used > self.limit:
+            raise HTTPException(status_code=413, detail=f"Upload too large. Max {self.limit // MB} MB per request.")
+
+
+async def save_upload(upload, directory: str, stem: str = None, allowed_types: set = IMAGE_TYPES,
+                      budget: UploadBudget = None) -> str:
+    """
+    Streams an `UploadFile` to a content-addressed name inside `directory`
+    and returns the stored path (e.g. "uploads/products/<hash>.jpg").
+    Raises 413 (too large), 415 (wrong type) or 400 (empty file).
+    """
+    extension = file_extension(upload.filename)
+    if allowed_types and extension not in allowed_types:
+        raise HTTPException(status_code=415, detail=f"Unsupported file type '.{extension}' for {upload.filename}.")
+
+    # ✅ Reject on the declared size before reading anything
+    if upload.size is not None and upload.size > MAX_UPLOAD_FILE_BYTES:
+        raise HTTPException(status_code=413, detail=f"{upload.filename} is too large. Max {MAX_UPLOAD_FILE_BYTES // MB} MB per file.")
+
+    await anyio.to_thread.run_sync(lambda: os.makedirs(directory, exist_ok=True))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    os.close(fd)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as buffer:
+            while chunk := await upload.read(CHUNK_SIZE):
+                if size == 0 and allowed_types:
+                    # 🔍 Content sniffing on the first chunk: the bytes must match the extension
+                    if extension not in sniff_extension(chunk):
+                        raise HTTPException(status_code=415, detail=f"{upload.filename} does not look like a .{extension} file.")
+
+                size += len(chunk)
+                if size > MAX_UPLOAD_FILE_BYTES:
+                    raise HTTPException(status_code=413, detail=f"{upload.filename} is too large. Max {MAX_UPLOAD_FILE_BYTES // MB} MB per file.")
+                if budget:
+                    budget.consume(len(chunk))
+
+                digest.update(chunk)
+                await buffer.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail=f"{upload.filename} is empty.")
+
+        extension = CANONICAL_EXTENSIONS.get(extension, extension)
+        path = os.path.join(directory, hashed_filename(digest.hexdigest(), extension, stem))
+        await anyio.to_thread.run_sync(_commit_temp_file, tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return path
+
+
+async def save_uploads(uploads: list, directory: str, stems: list = None, allowed_types=IMAGE_TYPES) -> list[str]:
+    """
+    Saves several uploads of one request in parallel under a shared size budget.
+    `allowed_types` is either one set for all files or a list with one set per file.
+    If any file is rejected the others are cancelled and the error is raised.
+    """
+    budget = UploadBudget()
+    stems = stems or [None] * len(uploads)
+    types = allowed_types if isinstance(allowed_types, list) else [allowed_types] * len(uploads)
+
+    declared = sum(upload.size or 0 for upload in uploads)
+    if declared > budget.limit:
+        raise HTTPException(status_code=413, detail=f"Upload too large. Max {budget.limit // MB} MB per request.")
+
+    tasks = [
+        asyncio.ensure_future(save_upload(upload, directory, stem=stem, allowed_types=file_types, budget=budget))
+        for upload, stem, file_types in zip(uploads, stems, types)
+    ]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def move_stored_file(path: str, directory: str) -> str:
+    """Moves a stored file (keeping its content-addressed name) into another directory."""
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, os.path.basename(path))
+    os.replace(path, target)
+    return target
+
+
+def public_url(path: str) -> str:
+    """"uploads/ngos/1/logo-<hash>.png" → "/uploads/ngos/1/logo-<hash>.png"."""
+    return "/" + path.replace(os.sep, "/").lstrip("/")
+
+
+def remove_stored_file(path: str):
+    """Deletes a stored file if present."""
+    path = path.lstrip("/")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# ---------------------------- #
+# 🚧 REQUEST BODY LIMIT
+# ---------------------------- #
+
+class _BodyTooLarge(HTTPException):
+    """Raised from `receive`; being an HTTPException, FastAPI's form parsing re-raises it as a 413."""
+
+    def __init__(self):
+        super().__init__(status_code=413, detail=f"Upload too large. Max {MAX_UPLOAD_REQUEST_BYTES // MB} MB per request.")
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects multipart requests above the per-request cap with 413 *before* the
+    body is parsed and spooled: by Content-Length when present, otherwise as
+    soon as the streamed body crosses the limit.
+    """
+
+    def __init__(self, app, max_body_bytes: int = MAX_UPLOAD_REQUEST_BYTES + MULTIPART_OVERHEAD_BYTES):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        content_length = headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            return await self._reject(send)
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if response_started:
+                raise
+            await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": _BodyTooLarge().detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,211 @@
+"""
+Per-entity version stamps and HTTP conditional GET for public catalogue reads.
+
+Every write that changes what a public listing shows calls `bump_version(db, ...)`
+before its commit, so the stamp moves in the same transaction as the data.
+Read endpoints call `conditional_get(request, db, entities)` first: it reads the
+stamps with one primary-key lookup, raises a bodiless 304 when the client's
+ETag / Last-Modified is still current (the listing query never runs), and
+otherwise returns the validator + Cache-Control headers for the 200 response.
+
+Stock moves on every sale, so checkouts do not bump inside their transaction (one
+hot row lock shared by all checkouts). They call `bump_version_after_commit(db, STOCK)`
+instead: after the commit, each process folds such bumps into one separate write
+at most every `DEFERRED_BUMP_SECONDS`. Listings that show stock include STOCK in
+their validators; caches keyed on PRODUCTS (facets, reference data) are not touched.
+"""
+import atexit
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import HTTPException, Request
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import EntityVersion
+
+# 🏷️ Entity tags
+CATEGORIES = "categories"
+COUPONS = "coupons"
+NGOS = "ngos"
+PRODUCTS = "products"
+RECOMMENDATIONS = "recommendations"
+REVIEWS = "reviews"
+STOCK = "stock"  # Stock levels only (sales, cancellations); bumped after commit, coalesced
+
+# Browsers revalidate after `max-age`; shared caches (CDN / proxy) may keep serving a stale copy meanwhile
+CATALOGUE_MAX_AGE = int(os.getenv("CATALOGUE_MAX_AGE", 30))
+CATALOGUE_SHARED_MAX_AGE = int(os.getenv("CATALOGUE_SHARED_MAX_AGE", 60))
+CATALOGUE_STALE_WHILE_REVALIDATE = int(os.getenv("CATALOGUE_STALE_WHILE_REVALIDATE", 300))
+
+DEFERRED_BUMP_SECONDS = float(os.getenv("DEFERRED_BUMP_SECONDS", 5))
+
+NO_STORE_HEADERS = {"Cache-Control": "no-store"}
+
+# Session.info key listing entities bumped in the current transaction (published by services/invalidation_bus.py)
+BUMPED_ENTITIES_KEY = "bumped_entities"
+DEFERRED_BUMPS_KEY = "deferred_bumps"
+
+
+def bump_version(db: Session, *entities: str):
+    """Marks entities as changed. Call before `db.commit()` of the write it describes; does not commit."""
+    now = datetime.utcnow()
+    db.info.setdefault(BUMPED_ENTITIES_KEY, set()).update(entities)
+    for entity in entities:
+        result = db.execute(
+            update(EntityVersion)
+            .where(EntityVersion.entity == entity)
+            .values(version=EntityVersion.version + 1, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            continue
+        try:
+            with db.begin_nested():  # ✅ First bump ever; a concurrent first bump wins the insert
+                db.add(EntityVersion(entity=entity, version=1, updated_at=now))
+        except IntegrityError:
+            db.execute(
+                update(EntityVersion)
+                .where(EntityVersion.entity == entity)
+                .values(version=EntityVersion.version + 1, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+
+
+# ---------------------------- #
+# ⏳ DEFERRED (COALESCED) BUMPS
+# ---------------------------- #
+
+_deferred = set()  # Entities committed as changed but not bumped yet in this process
+_deferred_lock = threading.Lock()
+_deferred_timer = None
+
+
+def bump_version_after_commit(db: Session, *entities: str):
+    """Bumps `entities` after this transaction commits, in a separate write shared with other commits. Does not commit."""
+    db.info.setdefault(DEFERRED_BUMPS_KEY, set()).update(entities)
+
+
+def flush_deferred_bumps():
+    """Applies pending deferred bumps now, with its own session and commit."""
+    global _deferred_timer
+    with _deferred_lock:
+        entities = set(_deferred)
+        _deferred.clear()
+        _deferred_timer = None
+    if not entities:
+        return
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        bump_version(db, *sorted(entities))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Deferred version bump of {sorted(entities)} failed: {e!r}")
+    finally:
+        db.close()
+
+
+@event.listens_for(Session, "after_commit")
+def _schedule_deferred_bumps(session):
+    global _deferred_timer
+    if session.in_nested_transaction():
+        return  # A SAVEPOINT release is not the commit
+    entities = session.info.pop(DEFERRED_BUMPS_KEY, None)
+    if not entities:
+        return
+    with _deferred_lock:
+        _deferred.update(entities)
+        if _deferred_timer is None:
+            # ✅ One write per DEFERRED_BUMP_SECONDS per process, however many commits asked for it
+            _deferred_timer = threading.Timer(DEFERRED_BUMP_SECONDS, flush_deferred_bumps)
+            _deferred_timer.daemon = True
+            _deferred_timer.start()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_deferred_bumps(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(DEFERRED_BUMPS_KEY, None)
+
+
+atexit.register(flush_deferred_bumps)  # One-shot jobs (`python -m ...`) exit before the timer fires
+
+
+def get_versions(db: Session, *entities: str) -> dict[str, tuple[int, datetime | None]]:
+    """{entity: (version, updated_at)}; entities never bumped are (0, None)."""
+    rows = db.query(EntityVersion.entity, EntityVersion.version, EntityVersion.updated_at).filter(
+        EntityVersion.entity.in_(entities)
+    ).all()
+    versions = {entity: (0, None) for entity in entities}
+    versions.update({row.entity: (row.version, row.updated_at) for row in rows})
+    return versions
+
+
+def catalogue_cache_control() -> str:
+    return (
+        f"public, max-age={CATALOGUE_MAX_AGE}, s-maxage={CATALOGUE_SHARED_MAX_AGE}, "
+        f"stale-while-revalidate={CATALOGUE_STALE_WHILE_REVALIDATE}"
+    )
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def conditional_get(request: Request, db: Session, entities: tuple) -> dict:
+    """
+    Returns ETag / Last-Modified / Cache-Control / Vary headers for a public
+    listing built from `entities`, or raises a 304 if the client copy is current.
+    """
+    versions = get_versions(db, *entities)
+
+    # ✅ Same URL + same entity versions → same body
+    fingerprint = "|".join(f"{entity}:{versions[entity][0]}" for entity in sorted(versions))
+    fingerprint += f"|{request.url.path}?{request.url.query}"
+    etag = f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()[:20]}"'
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": catalogue_cache_control(),
+        "Vary": "Accept-Encoding",
+    }
+
+    stamps = [updated_at for _, updated_at in versions.values() if updated_at]
+    last_modified = max(stamps).replace(microsecond=0) if stamps else None
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)  # ✅ ETag wins over If-Modified-Since
+    else:
+        not_modified = False
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and last_modified:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+                if since.tzinfo:
+                    since = since.astimezone(timezone.utc).replace(tzinfo=None)
+                not_modified = last_modified <= since
+            except (TypeError, ValueError):
+                pass
+
+    if not_modified:
+        raise HTTPException(status_code=304, headers=headers)  # No body; the listing query never runs
+    return headers
+
+
+# ✅ Registers the after_commit publisher in every process that bumps versions (API workers, job runners)
+from services import invalidation_bus  # noqa: E402,F401
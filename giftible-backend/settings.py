@@ -1,6 +1,25 @@
 # settings.py
 import os
+from dotenv import load_dotenv
+
+# ✅ Load .env once for the whole app (imported first by main.py and database.py)
+load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+
+# 🔌 External provider backends
+# "fake" keeps everything in-process (see services/fakes.py) for offline / load-test runs
+PAYMENT_BACKEND = os.getenv("PAYMENT_BACKEND", "razorpay")  # razorpay | fake
+SMS_BACKEND = os.getenv("SMS_BACKEND", "live")  # live (Twilio/SNS per message type) | twilio | sns | fake
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "smtp")  # smtp | fake
+FAKE_PROVIDER_LATENCY_MS = int(os.getenv("FAKE_PROVIDER_LATENCY_MS", 0))  # Artificial delay per fake call
+
+# 🗄️ Database
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"  # Log every SQL statement (debug only)
+
+# 🛒 Order intake
+# "sync": /orders/place-order places the order in the request; "queue": it enqueues and returns 202
+# (run `python -m services.order_intake --loop` workers to drain the queue)
+ORDER_INTAKE_MODE = os.getenv("ORDER_INTAKE_MODE", "sync")  # sync | queue
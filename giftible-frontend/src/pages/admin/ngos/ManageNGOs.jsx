@@ -25,7 +25,7 @@ import {
 } from "@mui/material";
 import { useNavigate } from "react-router-dom";
 import { useTheme } from "@mui/material/styles";
-import { fetchAllNGOs, deleteNGO } from "../../../services/adminService";
+import { fetchAllNGOs, deleteNGO, waitForDeletionJob } from "../../../services/adminService";
 import EditIcon from "@mui/icons-material/Edit";
 import DeleteIcon from "@mui/icons-material/Delete";
 import { LocalizationProvider, DatePicker } from "@mui/x-date-pickers";
@@ -267,9 +267,14 @@ const handleDownloadCSV = () => {
     }
   
     try {
-      await deleteNGO(selectedNgo.id, deletionReason);
-      fetchNGOs();
+      const { job_id } = await deleteNGO(selectedNgo.id, deletionReason);
+      fetchNGOs(); // ✅ Soft-deleted right away, so it drops out of the list
       setDeleteDialogOpen(false);
+      setSnackbar({ open: true, message: "NGO deleted. Removing related records…", severity: "info" });
+      // 🗑️ Related records are purged in the background; show progress until done
+      await waitForDeletionJob(job_id, (job) =>
+        setSnackbar({ open: true, message: `Removing related records… ${job.percent}%`, severity: "info" })
+      );
       setSnackbar({ open: true, message: "NGO deleted successfully", severity: "success" });
     } catch (error) {
       setSnackbar({ open: true, message: error.message, severity: "error" });
@@ -254,7 +254,7 @@ const AdminProductDetails = () => {
             onClick={() => navigate(`/admin/ngos/details/${product.ngo.id}`)}
           >
             <Avatar
-              src={`${API_BASE_URL}/uploads/ngos/${product.ngo.id}/logo.png`}
+              src={product.ngo.logo ? `${API_BASE_URL}${product.ngo.logo}` : "/placeholder.png"}
               alt={product.ngo.ngo_name}
               sx={{ width: 60, height: 60, border: "2px solid #6A4C93" }}
               onError={(e) => e.target.src = "/placeholder.png"} // Fallback image
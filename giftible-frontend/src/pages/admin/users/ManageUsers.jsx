@@ -25,7 +25,7 @@ import {
 } from "@mui/material";
 import { useNavigate } from "react-router-dom";
 import { useTheme } from "@mui/material/styles";
-import { fetchAllUsers, deleteUser } from "../../../services/adminService";
+import { fetchAllUsers, deleteUser, waitForDeletionJob } from "../../../services/adminService";
 import EditIcon from "@mui/icons-material/Edit";
 import DeleteIcon from "@mui/icons-material/Delete";
 import { LocalizationProvider, DatePicker } from "@mui/x-date-pickers";
@@ -256,9 +256,14 @@ const ManageUsers = () => {
         }
       
         try {
-          await deleteUser(selectedUser.id, deletionReason); // ✅ Use deleteUser instead of deleteNGO
-          fetchUsers(); // ✅ Refresh Users List
+          const { job_id } = await deleteUser(selectedUser.id, deletionReason);
+          fetchUsers(); // ✅ Soft-deleted right away, so it drops out of the list
           setDeleteDialogOpen(false);
+          setSnackbar({ open: true, message: "User deleted. Removing related records…", severity: "info" });
+          // 🗑️ Related records are purged in the background; show progress until done
+          await waitForDeletionJob(job_id, (job) =>
+            setSnackbar({ open: true, message: `Removing related records… ${job.percent}%`, severity: "info" })
+          );
           setSnackbar({ open: true, message: "User deleted successfully", severity: "success" });
         } catch (error) {
           setSnackbar({ open: true, message: error.message, severity: "error" });
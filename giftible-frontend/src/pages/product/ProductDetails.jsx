@@ -17,6 +17,7 @@ import {
 import API_BASE_URL from "../../config";
 import { addToCart, fetchCartCount } from "../../services/cartService";
 import { addToWishlist, removeFromWishlist, fetchWishlist } from "../../services/wishlistService";
+import { getRelatedProducts } from "../../services/productService";
 import FavoriteIcon from "@mui/icons-material/Favorite";
 import FavoriteBorderIcon from "@mui/icons-material/FavoriteBorder";
 import ShoppingCartIcon from "@mui/icons-material/ShoppingCart";
@@ -44,6 +45,7 @@ function ProductDetails() {
   const [isWishlisted, setIsWishlisted] = useState(false);
   const [reviews, setReviews] = useState([]);
   const [averageRating, setAverageRating] = useState(5); // Default 5 for unrated products
+  const [relatedProducts, setRelatedProducts] = useState([]);
 
 
   useEffect(() => {
@@ -89,6 +91,7 @@ function ProductDetails() {
     };
 
     fetchProduct();
+    getRelatedProducts(productId).then(setRelatedProducts); // 🎁 Precomputed "frequently bought together"
 
     const storedUser = JSON.parse(localStorage.getItem("user"));
     setUserId(storedUser?.id || null);
@@ -348,6 +351,32 @@ function ProductDetails() {
 
           </Grid>
         </Grid>
+        {/* 🎁 Frequently Bought Together */}
+        {relatedProducts.length > 0 && (
+          <Box mt={4}>
+            <Typography variant="h5" fontWeight="bold">Frequently Bought Together</Typography>
+            <Grid container spacing={2} mt={1}>
+              {relatedProducts.map((item) => (
+                <Grid item xs={6} sm={4} md={2} key={item.id}>
+                  <Paper
+                    sx={{ p: 1, borderRadius: "12px", boxShadow: 2, cursor: "pointer", "&:hover": { transform: "scale(1.02)" } }}
+                    onClick={() => navigate(`/products/${item.id}`)}
+                  >
+                    <img
+                      src={item.images?.[0]?.image_url ? `${API_BASE_URL}/${item.images[0].image_url}` : "/assets/default-ngo-logo.png"}
+                      alt={item.name}
+                      width="100%"
+                      height="120"
+                      style={{ borderRadius: "8px", objectFit: "cover" }}
+                    />
+                    <Typography variant="body2" fontWeight="bold" noWrap>{item.name}</Typography>
+                    <Typography variant="body2" color="primary">₹{item.price}</Typography>
+                  </Paper>
+                </Grid>
+              ))}
+            </Grid>
+          </Box>
+        )}
          {/* 📝 User Reviews Section */}
 {reviews.length > 0 ? (
   <Box mt={4}>
@@ -42,6 +42,7 @@ const ProductList = () => {
   const [wishlist, setWishlist] = useState([]);
   const [snackbar, setSnackbar] = useState({ open: false, message: "", severity: "info" });
   const [totalNgos, setTotalNgos] = useState(0);
+  const [facets, setFacets] = useState({ categories: {}, ngos: {} }); // 🧮 id → matching product count
   const location = useLocation();
   const [sortBy, setSortBy] = useState("random"); // Default: Show products in random order
 
@@ -92,8 +93,13 @@ const fetchProducts = async (location) => {
           max_price: filters.max_price,
           limit,
           offset: (page - 1) * limit,
+          include_facets: true, // 🧮 Sidebar counts for the same search
       };
 
+      if (sortBy === "trending") {
+          requestParams.sort = "trending"; // 📈 Ranked server-side across all pages
+      }
+
       if (searchQuery) {
           requestParams.search_query = searchQuery; // ✅ Add search query to request
       }
@@ -137,11 +143,19 @@ const fetchProducts = async (location) => {
           sortedProducts.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
       } else if (sortBy === "oldest") {
           sortedProducts.sort((a, b) => new Date(a.created_at) - new Date(b.created_at));
+      } else if (sortBy === "trending") {
+          // ✅ Keep the server's ranking
       } else {
           sortedProducts.sort(() => Math.random() - 0.5); // 🔀 Default: Random Order
       }
 
       setProducts(sortedProducts);
+      if (data.facets) {
+          setFacets({
+              categories: Object.fromEntries(data.facets.categories.map((f) => [f.id, f.count])),
+              ngos: Object.fromEntries(data.facets.ngos.map((f) => [f.id, f.count])),
+          });
+      }
       setTotalPages(Math.ceil(data.total / limit));
       setMessage(data.message);
   } catch (err) {
@@ -295,6 +309,11 @@ const fetchProducts = async (location) => {
           control={<Radio />}
           label="Relevance"
         />
+        <FormControlLabel
+          value="trending"
+          control={<Radio />}
+          label="Trending"
+        />
         <FormControlLabel
           value="price_asc"
           control={<Radio />}
@@ -360,7 +379,7 @@ const fetchProducts = async (location) => {
               onChange={() => handleCategoryChange(category.id)}
             />
           }
-          label={category.name}
+          label={`${category.name} (${facets.categories[category.id] || 0})`}
         />
       ))}
     </FormGroup>
@@ -389,7 +408,7 @@ const fetchProducts = async (location) => {
               onChange={() => handleNgoChange(ngo.universal_user_id)}
             />
           }
-          label={ngo.ngo_name}
+          label={`${ngo.ngo_name} (${facets.ngos[ngo.universal_user_id] || 0})`}
         />
       ))}
     </FormGroup>
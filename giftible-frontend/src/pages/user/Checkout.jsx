@@ -91,7 +91,11 @@ function Checkout() {
 
     try {
       setIsPlacingOrder(true);
-      const { order_id, amount } = await initiateRazorpayPayment({ amount: grandTotal });
+      const { order_id, amount } = await initiateRazorpayPayment({
+        amount: grandTotal,
+        address_id: selectedAddress,
+        coupon_code: appliedCoupon?.code ?? null,
+      });
 
       const options = {
         key: import.meta.env.VITE_RAZORPAY_KEY_ID,
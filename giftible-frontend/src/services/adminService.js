@@ -194,6 +194,31 @@ export const fetchUserDetails = async (userId) => {
 };
 
 
+// 🗑️ Deletions run in the background: poll the job the delete call returned
+export const fetchDeletionJob = async (jobId) => {
+  const { data } = await axiosInstance.get(`${API_BASE_URL}/admin/deletion-jobs/${jobId}`);
+  return data;
+};
+
+export const waitForDeletionJob = async (jobId, onProgress, { intervalMs = 1500, maxAttempts = 200 } = {}) => {
+  for (let attempt = 0; attempt < maxAttempts; attempt++) {
+    const job = await fetchDeletionJob(jobId);
+    onProgress?.(job);
+    if (job.status === "completed") return job;
+    if (job.status === "failed") throw new Error(job.error || "Deletion failed while removing related records.");
+    if (job.status === "restored") return job;
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+  return fetchDeletionJob(jobId);  // Still running; it keeps going server-side
+};
+
+// ↩️ Undo a failed deletion: the account can log in again
+export const restoreDeletionJob = async (jobId) => {
+  const { data } = await axiosInstance.post(`${API_BASE_URL}/admin/deletion-jobs/${jobId}/restore`);
+  return data;
+};
+
+
 // ✅ Delete User (With Error Handling)
 export const deleteUser = async (userId, deletionReason = "No specific reason provided") => {
   try {
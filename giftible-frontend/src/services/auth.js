@@ -44,18 +44,16 @@ export const refreshTokenAPI = async () => {
 
   console.log("🔄 Attempting refresh token request...");
   try {
-    const formData = new URLSearchParams();
-    formData.append("refresh_token", refreshToken); // ✅ Correct format
-
-    const { data } = await axiosInstance.post(`/refresh-token`, formData, {
-      headers: { "Content-Type": "application/x-www-form-urlencoded" }, // ✅ Fix header format
-    });
+    const { data } = await axiosInstance.post(`/refresh-token`, { refresh_token: refreshToken });
 
     if (!data.access_token) {
       console.error("🚫 No access token received from refresh API.");
       throw new Error("No access token received.");
     }
 
+    // 🔁 Refresh tokens are single-use: keep the rotated one
+    if (data.refresh_token) localStorage.setItem("refresh_token", data.refresh_token);
+
     console.log("✅ Successfully refreshed access token.");
     return data.access_token;
   } catch (error) {
@@ -50,14 +50,28 @@ export const fetchCartSummary = async (couponCode = "") => {
 
 // ✅ Place order
 export const placeOrder = async ({ address_id, coupon_code, payment_id, order_id, amount, signature }) => {
-  const { data } = await axiosInstance.post(
+  const { data, status } = await axiosInstance.post(
     `${API_BASE_URL}/orders/place-order`,
     { address_id, coupon_code, payment_id, order_id, amount, signature },  // Ensure all fields are present
     {
       headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
     }
   );
-  return data;
+  // 📮 202: the order was queued; wait for a worker to place it
+  return status === 202 ? waitForOrderIntake(data.intake_id) : data;
+};
+
+// 📮 Poll a queued order request until it is placed or fails
+export const waitForOrderIntake = async (intakeId, { intervalMs = 1000, maxAttempts = 60 } = {}) => {
+  for (let attempt = 0; attempt < maxAttempts; attempt++) {
+    const { data } = await axiosInstance.get(`${API_BASE_URL}/orders/intake/${intakeId}`, {
+      headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
+    });
+    if (data.status === "placed") return data;
+    if (data.status === "failed") throw new Error(data.error || "Order could not be placed.");
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+  return { status: "queued", intake_id: intakeId };  // Still processing; it will show up in order history
 };
 
 
@@ -79,10 +93,10 @@ export const verifyPayment = async (paymentData) => {
   };
 
 
-  export const initiateRazorpayPayment = async ({ amount }) => {
+  export const initiateRazorpayPayment = async ({ amount, address_id = null, coupon_code = null }) => {
     const { data } = await axiosInstance.post(
       `${API_BASE_URL}/payments/razorpay/order`,
-      { amount: Number(amount) },  // ✅ Ensure it's a number
+      { amount: Number(amount), address_id, coupon_code },  // ✅ Ensure it's a number; address lets the server finish a paid order
       {
         headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
       }
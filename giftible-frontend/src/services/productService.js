@@ -119,4 +119,14 @@ export const getProductDetails = async (productId) => {
       throw new Error(error.response?.data?.detail || "Failed to fetch product details.");
     }
 };
-  
\ No newline at end of file
+  
+// ✅ Fetch products frequently bought together with this one
+export const getRelatedProducts = async (productId, limit = 6) => {
+    try {
+      const response = await axiosInstance.get(`${API_BASE_URL}/products/${productId}/related`, { params: { limit } });
+      return response.data.related || [];
+    } catch (error) {
+      console.error("❌ Error fetching related products:", error.response?.data);
+      return [];  // Recommendations are optional; the product page works without them
+    }
+};